@@ -7,6 +7,7 @@ import os
 from dotenv import load_dotenv
 from jose import jwt, JWTError
 from .utils.security import verify_password
+from .utils.cache_principal import resolver_usuario
 from .database import get_session 
 
 
@@ -74,7 +75,7 @@ def get_current_user(
     except (JWTError, ValueError) as e:
         raise HTTPException(status_code=401, detail="Token inválido o expirado")
 
-    user = session.exec(select(User).where(User.username == username)).first()
+    user = resolver_usuario(session, token, username, payload.get("exp"))
     print("current_user.role repr:", repr(user.role))
     print("current_user.role type:", type(user.role))
 
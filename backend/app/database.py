@@ -1,22 +1,91 @@
 from sqlmodel import SQLModel, create_engine, Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from .models.usuario.usuario import User, RoleEnum
 from datetime import date
 import os
 from dotenv import load_dotenv
 from .utils.security import get_password_hash
+from .utils.pool import QueuePoolMedido, AsyncQueuePoolMedido
+from .esquema import sincronizar_esquema
 
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL, echo=True)
+
+
+def _url_async(url: str) -> str:
+    # Mismo servidor que el engine síncrono, pero con el driver asyncpg
+    url_sa = make_url(url)
+    if url_sa.get_backend_name() == "postgresql":
+        url_sa = url_sa.set(drivername="postgresql+asyncpg")
+    return url_sa.render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _url_async(DATABASE_URL)
+
+
+def _env_bool(nombre: str, default: bool) -> bool:
+    return os.getenv(nombre, str(default)).strip().lower() in ("1", "true", "yes", "si")
+
+
+# Perfil de ejecución de la base de datos
+APP_ENV = os.getenv("APP_ENV", "prod").lower()
+DB_ECHO = APP_ENV == "dev" and _env_bool("DB_ECHO", False)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+
+
+def _opciones_engine(poolclass) -> dict:
+    return {
+        "echo": DB_ECHO,
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _connect_args(url: str) -> dict:
+    if DB_STATEMENT_TIMEOUT_MS <= 0 or make_url(url).get_backend_name() != "postgresql":
+        return {}
+    if make_url(url).get_driver_name() == "asyncpg":
+        return {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args=_connect_args(DATABASE_URL),
+    **_opciones_engine(QueuePoolMedido)
+)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=_connect_args(ASYNC_DATABASE_URL),
+    **_opciones_engine(AsyncQueuePoolMedido)
+)
 
 def get_session():
     with Session(engine) as session:
         yield session
 
+async def get_async_session():
+    # expire_on_commit=False: tras el commit los atributos siguen disponibles
+    # sin tener que recargarlos (en async no hay carga perezosa implícita)
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
 def init_db():
     SQLModel.metadata.create_all(engine)
+    sincronizar_esquema(engine)
 
     with Session(engine) as session:
         existing = session.exec(select(User).where(User.role == RoleEnum.super_admin)).first()
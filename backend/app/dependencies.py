@@ -3,7 +3,8 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from .database import get_session
 from .models.usuario.usuario import User
-from sqlmodel import Session, select
+from .utils.cache_principal import resolver_usuario
+from sqlmodel import Session
 import os
 from dotenv import load_dotenv
 
@@ -19,7 +20,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Dep
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401)
-        user = session.exec(select(User).where(User.username == username)).first()
+        user = resolver_usuario(session, token, username, payload.get("exp"))
         return user
     except JWTError:
         raise HTTPException(status_code=401)
@@ -0,0 +1,251 @@
+import json
+import logging
+from datetime import datetime, time, timezone
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import SQLModel
+
+logger = logging.getLogger(__name__)
+
+# create_all solo crea tablas nuevas: los índices y restricciones que se
+# agregan a tablas existentes se aplican aquí, de forma idempotente.
+SENTENCIAS_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    # Reemplazado por ix_cita_medico_agenda, que lo cubre como prefijo
+    "DROP INDEX IF EXISTS ix_cita_medico_fecha",
+    "ALTER TABLE recetamedicamento ADD COLUMN IF NOT EXISTS unidades_por_toma DOUBLE PRECISION",
+    "ALTER TABLE recetamedicamento ADD COLUMN IF NOT EXISTS tomas_por_dia DOUBLE PRECISION",
+    "ALTER TABLE recetamedicamento ADD COLUMN IF NOT EXISTS dias_tratamiento INTEGER",
+    "ALTER TABLE recetamedicamento ADD COLUMN IF NOT EXISTS total_unidades INTEGER",
+    # Búsqueda del catálogo: unaccent no es IMMUTABLE y no puede usarse en un
+    # índice de expresión, por eso se envuelve fijando el diccionario.
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_medicamento_nombre_trgm ON medicamento USING gin (f_unaccent(lower(nombre)) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_medicamento_laboratorio_trgm ON medicamento USING gin (f_unaccent(lower(laboratorio)) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_medicamento_concentracion_trgm ON medicamento USING gin (f_unaccent(lower(concentracion)) gin_trgm_ops)",
+    "ALTER TABLE medicamento ADD COLUMN IF NOT EXISTS stock_minimo INTEGER NOT NULL DEFAULT 0",
+    # Versión del catálogo: cada alta, cambio real (el stock también, es
+    # parte de MedicamentoRead) y baja toma el número siguiente de
+    # versioncatalogo; las bajas dejan una marca en medicamentoeliminado.
+    # Una secuencia no sirve: nextval no sigue el orden de commit y un
+    # cliente podría saltarse un cambio confirmado tarde. La fila del
+    # contador queda bloqueada hasta el commit, por eso el trigger es
+    # diferido: numera al confirmar y dos dispensaciones solo se esperan
+    # durante el commit, no durante toda la transacción.
+    "ALTER TABLE medicamento ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0",
+    """
+    INSERT INTO versioncatalogo (id, valor)
+    SELECT 1, GREATEST(
+        (SELECT COALESCE(MAX(version), 0) FROM medicamento),
+        (SELECT COALESCE(MAX(version), 0) FROM medicamentoeliminado)
+    )
+    ON CONFLICT (id) DO NOTHING
+    """,
+    """
+    CREATE OR REPLACE FUNCTION medicamento_versionar() RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+    DECLARE
+        siguiente BIGINT;
+    BEGIN
+        UPDATE versioncatalogo SET valor = valor + 1 WHERE id = 1 RETURNING valor INTO siguiente;
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO medicamentoeliminado (medicamento_id, version)
+            VALUES (OLD.id, siguiente)
+            ON CONFLICT (medicamento_id) DO UPDATE SET version = EXCLUDED.version;
+        ELSE
+            -- Este UPDATE corre con pg_trigger_depth() = 1 y no se vuelve a numerar
+            UPDATE medicamento SET version = siguiente WHERE id = NEW.id;
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    "DROP SEQUENCE IF EXISTS medicamento_version_seq",
+    """
+    DO $$
+    BEGIN
+        -- Versiones anteriores numeraban en un trigger BEFORE, no diferido
+        DROP TRIGGER IF EXISTS medicamento_version ON medicamento;
+        DROP TRIGGER IF EXISTS medicamento_eliminado ON medicamento;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'medicamento_version_alta') THEN
+            CREATE CONSTRAINT TRIGGER medicamento_version_alta AFTER INSERT ON medicamento
+                DEFERRABLE INITIALLY DEFERRED
+                FOR EACH ROW WHEN (pg_trigger_depth() = 0)
+                EXECUTE FUNCTION medicamento_versionar();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'medicamento_version_cambio') THEN
+            CREATE CONSTRAINT TRIGGER medicamento_version_cambio AFTER UPDATE ON medicamento
+                DEFERRABLE INITIALLY DEFERRED
+                FOR EACH ROW WHEN (pg_trigger_depth() = 0 AND OLD.* IS DISTINCT FROM NEW.*)
+                EXECUTE FUNCTION medicamento_versionar();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'medicamento_version_baja') THEN
+            CREATE CONSTRAINT TRIGGER medicamento_version_baja AFTER DELETE ON medicamento
+                DEFERRABLE INITIALLY DEFERRED
+                FOR EACH ROW EXECUTE FUNCTION medicamento_versionar();
+        END IF;
+    END $$;
+    """,
+]
+
+
+# Un médico no puede tener dos citas cuyos intervalos se crucen. El índice
+# GiST de la restricción sirve también para buscar solapamientos. crear_cita
+# depende de ella para rechazar reservas simultáneas, así que es obligatoria.
+RESTRICCION_SOLAPAMIENTO = """
+    ALTER TABLE cita ADD CONSTRAINT cita_sin_solapamiento
+        EXCLUDE USING gist (
+            medico_id WITH =,
+            tsrange(fecha + hora_inicio, fecha + hora_fin, '[)') WITH &&
+        )
+"""
+
+CITAS_SOLAPADAS = """
+    SELECT a.id, b.id
+    FROM cita a
+    JOIN cita b ON b.medico_id = a.medico_id AND b.id > a.id
+        AND tsrange(a.fecha + a.hora_inicio, a.fecha + a.hora_fin, '[)')
+            && tsrange(b.fecha + b.hora_inicio, b.fecha + b.hora_fin, '[)')
+    ORDER BY a.id, b.id
+"""
+
+
+def _aplicar_sin_solapamiento(engine):
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM pg_constraint WHERE conname = 'cita_sin_solapamiento'")).first():
+            return
+        solapadas = conn.execute(text(CITAS_SOLAPADAS)).all()
+        if solapadas:
+            pares = ", ".join(f"{a}-{b}" for a, b in solapadas)
+            logger.error("Citas solapadas impiden crear cita_sin_solapamiento (pares de ids): %s", pares)
+            raise RuntimeError(
+                "Hay citas del mismo médico con horarios solapados; corríjalas antes de iniciar "
+                f"(pares de ids: {pares})"
+            )
+        conn.execute(text(RESTRICCION_SOLAPAMIENTO))
+
+
+# Clave del advisory lock que serializa la migración entre workers
+LOCK_MIGRACION_ENTREGAS = 7_301_001
+# Migraciones de datos ya completadas: se registran para no repetir el barrido
+MIGRACION_ENTREGAS = "entregas_legadas"
+
+
+def _entregados_legados(receta_id: int, observaciones: str):
+    # Antes de DispensacionMedicamento, las entregas parciales se guardaban
+    # como {"entregados": [ids]} en Receta.observaciones
+    try:
+        nota = json.loads(observaciones or "")
+    except ValueError:
+        return None, None
+    if not isinstance(nota, dict) or not isinstance(nota.get("entregados"), list):
+        return None, None
+    entregados = set()
+    for medicamento_id in nota["entregados"]:
+        try:
+            entregados.add(int(medicamento_id))
+        except (TypeError, ValueError):
+            logger.warning("Receta %s: id entregado inválido en observaciones, se omite: %r", receta_id, medicamento_id)
+    return nota, entregados
+
+
+def migrar_entregas_legadas(engine):
+    """
+    Pasa a DispensacionMedicamento las entregas hechas antes de que existiera:
+    los renglones de recetas "entregada" y los ids de {"entregados": [...]}
+    en observaciones. Sin esto esos renglones figuran como pendientes y una
+    nueva autorización los volvería a descontar del stock. No toca el stock
+    (ya se descontó en su momento) y es idempotente: solo inserta renglones
+    sin dispensación y quita la clave "entregados" al migrar la receta. Al
+    terminar queda registrada en sgc_migracion y los arranques siguientes no
+    vuelven a recorrer las observaciones.
+    """
+    from sqlalchemy import and_, exists, or_
+    from sqlmodel import Session, select
+
+    from .models.medicamento.receta import DispensacionMedicamento, Receta, RecetaMedicamento
+    from .utils.posologia import interpretar_posologia
+
+    with Session(engine) as session:
+        if engine.dialect.name == "postgresql":
+            session.execute(text(f"SELECT pg_advisory_xact_lock({LOCK_MIGRACION_ENTREGAS})"))
+        session.execute(text(
+            "CREATE TABLE IF NOT EXISTS sgc_migracion (nombre TEXT PRIMARY KEY, aplicada_en TIMESTAMP NOT NULL)"
+        ))
+        if session.execute(
+            text("SELECT 1 FROM sgc_migracion WHERE nombre = :nombre"), {"nombre": MIGRACION_ENTREGAS}
+        ).first():
+            return
+
+        ya_entregado = exists().where(
+            DispensacionMedicamento.receta_id == RecetaMedicamento.receta_id,
+            DispensacionMedicamento.medicamento_id == RecetaMedicamento.medicamento_id
+        )
+        con_pendientes = exists().where(RecetaMedicamento.receta_id == Receta.id, ~ya_entregado)
+        recetas = session.exec(
+            select(Receta).where(or_(
+                Receta.observaciones.contains('"entregados"'),
+                and_(Receta.estado == "entregada", con_pendientes)
+            ))
+        ).all()
+        migradas = 0
+        for receta in recetas:
+            nota, entregados = _entregados_legados(receta.id, receta.observaciones)
+            if receta.estado != "entregada" and entregados is None:
+                continue
+            pendientes = session.exec(
+                select(RecetaMedicamento).where(RecetaMedicamento.receta_id == receta.id, ~ya_entregado)
+            ).all()
+            fecha = datetime.combine(receta.fecha_entrega or receta.fecha_emision, time(), tzinfo=timezone.utc)
+            for item in pendientes:
+                if receta.estado != "entregada" and item.medicamento_id not in entregados:
+                    continue
+                cantidad = item.total_unidades
+                if cantidad is None:
+                    cantidad = interpretar_posologia(item.dosis, item.frecuencia, item.duracion).total_unidades
+                session.add(DispensacionMedicamento(
+                    receta_id=receta.id,
+                    medicamento_id=item.medicamento_id,
+                    cantidad=cantidad,
+                    fecha_entrega=fecha
+                ))
+            if nota is not None:
+                del nota["entregados"]
+                receta.observaciones = json.dumps(nota) if nota else ""
+                session.add(receta)
+            if pendientes or nota is not None:
+                migradas += 1
+        session.execute(
+            text("INSERT INTO sgc_migracion (nombre, aplicada_en) VALUES (:nombre, :ahora)"),
+            {"nombre": MIGRACION_ENTREGAS, "ahora": datetime.now(timezone.utc).replace(tzinfo=None)}
+        )
+        session.commit()
+        if migradas:
+            logger.info("Entregas legadas migradas a DispensacionMedicamento: %s recetas", migradas)
+
+
+def sincronizar_esquema(engine):
+    # Primero las sentencias: pueden agregar columnas que los índices usan
+    if engine.dialect.name == "postgresql":
+        for sentencia in SENTENCIAS_POSTGRES:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(sentencia))
+            except SQLAlchemyError as e:
+                # Por ejemplo, datos previos que violan una restricción nueva
+                logger.warning("No se pudo aplicar la sentencia de esquema: %s", e)
+        _aplicar_sin_solapamiento(engine)
+
+    with engine.begin() as conn:
+        for tabla in SQLModel.metadata.sorted_tables:
+            for indice in tabla.indexes:
+                indice.create(conn, checkfirst=True)
+
+    migrar_entregas_legadas(engine)
@@ -2,7 +2,14 @@ from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 
-from .database import init_db
+import asyncio
+
+from .database import init_db, engine, async_engine
+from .utils.inventario import tarea_inventario
+from .utils.alertas import barrido_alertas
+from .utils.bus import bus
+from .utils.tareas import ejecutar_periodicamente, cancelar_tareas
+from .utils.paginacion import CABECERA_CURSOR
 
 # Importa cada router de usuario
 from app.routes.usuario.registro_usuario import router as registro_usuario_router
@@ -18,18 +25,39 @@ from app.routes.cita.certificado import router as certificado_router
 from app.routes.expediente.expediente import router as expediente_router
 from app.routes.signos.signos_vitales import router as signos_router
 from app.routes.websocket.websoket import router as websocket_router
+from app.routes.websocket.gestor_citas import gestor_citas
+from app.routes.websocket.gestor_medicamentos import gestor_medicamentos
+from app.routes.websocket.gestor_recetas import gestor_recetas
 from app.routes.medicamento.medicamento import router as medicamento_router
 from app.routes.medicamento.receta import router as receta_router
+from app.routes.medicamento.inventario import router as inventario_router
+from app.routes.medicamento.interaccion import router as interaccion_router
+from app.routes.sistema.metricas import router as metricas_router
 
 import os
 from fastapi.staticfiles import StaticFiles
 
 os.makedirs("./media/expedientes", exist_ok=True)
 
+INVENTARIO_SNAPSHOT_HORAS = float(os.getenv("INVENTARIO_SNAPSHOT_HORAS", 24))
+ALERTAS_BARRIDO_HORAS = float(os.getenv("ALERTAS_BARRIDO_HORAS", 24))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    await bus.iniciar()
+    tareas = [
+        asyncio.create_task(ejecutar_periodicamente(INVENTARIO_SNAPSHOT_HORAS * 3600, tarea_inventario, engine)),
+        # La primera ejecución carga las alertas; las siguientes cubren el cambio de fecha
+        asyncio.create_task(ejecutar_periodicamente(ALERTAS_BARRIDO_HORAS * 3600, barrido_alertas, async_engine)),
+    ]
     yield
+    await cancelar_tareas(tareas)
+    # Antes de soltar el bus: lo que aún estaba en una ventana se publica
+    for gestor in (gestor_citas, gestor_medicamentos, gestor_recetas):
+        await gestor.vaciar_pendientes()
+    await bus.detener()
+    await async_engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -39,6 +67,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[CABECERA_CURSOR, "ETag"],
 )
 
 app.mount("/media", StaticFiles(directory="media"), name="media")
@@ -58,4 +87,7 @@ app.include_router(expediente_router, tags=["Expedientes"])
 app.include_router(signos_router, tags=["Signos Vitales"])
 app.include_router(medicamento_router, tags=["Medicamentos"])
 app.include_router(receta_router, tags=["Recetas"])
+app.include_router(inventario_router, tags=["Inventario"])
+app.include_router(interaccion_router, tags=["Interacciones"])
 app.include_router(websocket_router, tags=["WebSocket"])
+app.include_router(metricas_router, tags=["Sistema"])
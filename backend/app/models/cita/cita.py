@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 from typing import Optional
 from datetime import date, time
 from enum import Enum
@@ -21,6 +22,16 @@ class EstadoCitaEnum(str, Enum):
     perdida = "perdida"
 
 class Cita(SQLModel, table=True):
+    # El solapamiento de horarios lo impide la restricción de exclusión
+    # "cita_sin_solapamiento" (ver app/esquema.py)
+    # Los índices siguen el orden de paginación (fecha, hora_inicio, id) de
+    # cada listado, así cada página es un rango contiguo del índice.
+    __table_args__ = (
+        Index("ix_cita_medico_agenda", "medico_id", "fecha", "hora_inicio", "id"),
+        Index("ix_cita_paciente_historial", "paciente_id", "fecha", "hora_inicio", "id"),
+        Index("ix_cita_fecha_hora", "fecha", "hora_inicio", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
     paciente_id: int = Field(foreign_key="user.id")
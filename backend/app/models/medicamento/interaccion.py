@@ -0,0 +1,24 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import CheckConstraint, UniqueConstraint
+from typing import Optional
+from enum import Enum
+
+
+class SeveridadInteraccionEnum(str, Enum):
+    leve = "leve"
+    moderada = "moderada"
+    grave = "grave"
+
+
+class InteraccionMedicamento(SQLModel, table=True):
+    # El par se guarda ordenado (a < b) para que cada interacción sea una fila
+    __table_args__ = (
+        UniqueConstraint("medicamento_a_id", "medicamento_b_id", name="uq_interaccion_par"),
+        CheckConstraint("medicamento_a_id < medicamento_b_id", name="ck_interaccion_orden"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    medicamento_a_id: int = Field(foreign_key="medicamento.id")
+    medicamento_b_id: int = Field(foreign_key="medicamento.id", index=True)
+    severidad: SeveridadInteraccionEnum = SeveridadInteraccionEnum.moderada
+    descripcion: Optional[str] = Field(default=None, max_length=500)
@@ -0,0 +1,45 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
+from typing import Optional
+from enum import Enum
+from datetime import datetime, timezone
+
+
+class TipoMovimientoEnum(str, Enum):
+    ingreso = "ingreso"
+    dispensacion = "dispensacion"
+    ajuste = "ajuste"
+    vencimiento = "vencimiento"
+
+
+class MovimientoInventario(SQLModel, table=True):
+    # Registro de solo inserción: cada cambio de stock es una fila con su
+    # delta (positivo entra, negativo sale). medicamento_id no lleva FK para
+    # que el historial sobreviva a la eliminación del medicamento.
+    __table_args__ = (
+        Index("ix_movimiento_medicamento_id", "medicamento_id", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    medicamento_id: int
+    tipo: TipoMovimientoEnum
+    cantidad: int
+    fecha: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+
+    usuario_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    receta_id: Optional[int] = Field(default=None, foreign_key="receta.id")
+    nota: Optional[str] = Field(default=None, max_length=255)
+
+
+class SnapshotStock(SQLModel, table=True):
+    # Stock de un medicamento después de aplicar todos los movimientos con
+    # id <= ultimo_movimiento_id
+    __table_args__ = (
+        Index("ix_snapshot_medicamento_fecha", "medicamento_id", "fecha"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    medicamento_id: int
+    fecha: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    stock: int
+    ultimo_movimiento_id: int = 0
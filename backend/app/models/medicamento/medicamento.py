@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from typing import Optional
 from enum import Enum
 from datetime import date
@@ -26,6 +27,11 @@ class UnidadPresentacionEnum(str, Enum):
 
 
 class Medicamento(SQLModel, table=True):
+    # Orden del catálogo y de la paginación por cursor de /medicamentos/buscar
+    __table_args__ = (
+        Index("ix_medicamento_nombre_id", "nombre", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     
     nombre: str = Field(index=True, max_length=100)
@@ -36,8 +42,28 @@ class Medicamento(SQLModel, table=True):
     unidad_presentacion: Optional[UnidadPresentacionEnum] = None
 
     stock: int = Field(default=0, ge=0)
-    fecha_vencimiento: Optional[date] = None
+    # Umbral para la alerta de stock bajo
+    stock_minimo: int = Field(default=0, ge=0)
+    fecha_vencimiento: Optional[date] = Field(default=None, index=True)
     laboratorio: Optional[str] = Field(default=None, max_length=100)
     precio_unitario: Optional[float] = Field(default=0.0, ge=0.0)
 
     is_activo: bool = Field(default=True)
+
+    # Versión del catálogo en la que cambió la fila por última vez. La asigna
+    # un trigger de Postgres desde VersionCatalogo (ver esquema.py).
+    version: int = Field(default=0, index=True)
+
+
+class MedicamentoEliminado(SQLModel, table=True):
+    # Marca de borrado para que /medicamentos/cambios informe eliminaciones
+    medicamento_id: int = Field(primary_key=True)
+    version: int = Field(index=True)
+
+
+class VersionCatalogo(SQLModel, table=True):
+    # Contador de una sola fila (id = 1) que el trigger de medicamento
+    # incrementa en la transacción que escribe. El bloqueo de la fila dura
+    # hasta el commit, así los números se confirman en orden.
+    id: int = Field(default=1, primary_key=True)
+    valor: int = 0
@@ -1,11 +1,17 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import ForeignKeyConstraint, Index
 from typing import Optional, List
-from datetime import date
+from datetime import date, datetime, timezone
 
 from ...models.medicamento.medicamento import Medicamento
 
 
 class Receta(SQLModel, table=True):
+    # Cola de pendientes de farmacia: filtra por estado y avanza por id
+    __table_args__ = (
+        Index("ix_receta_estado_id", "estado", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
     cita_id: int = Field(foreign_key="cita.id", unique=True)
@@ -26,5 +32,37 @@ class RecetaMedicamento(SQLModel, table=True):
     duracion: str
     indicaciones: Optional[str] = None
 
+    # Posología normalizada al emitir la receta (ver utils/posologia.py);
+    # en renglones anteriores a estas columnas quedan en NULL
+    unidades_por_toma: Optional[float] = None
+    tomas_por_dia: Optional[float] = None
+    dias_tratamiento: Optional[int] = None
+    total_unidades: Optional[int] = None
+
     receta: "Receta" = Relationship(back_populates="medicamentos")
     medicamento: "Medicamento" = Relationship()
+    dispensaciones: List["DispensacionMedicamento"] = Relationship(back_populates="receta_medicamento")
+
+
+class DispensacionMedicamento(SQLModel, table=True):
+    # Cada entrega de farmacia de un renglón de receta. Un renglón sin
+    # dispensaciones es un medicamento todavía pendiente.
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["receta_id", "medicamento_id"],
+            ["recetamedicamento.receta_id", "recetamedicamento.medicamento_id"]
+        ),
+        Index("ix_dispensacion_receta_medicamento", "receta_id", "medicamento_id"),
+        # Cubre la agregación por ventana de fechas del pronóstico de consumo
+        Index("ix_dispensacion_fecha_consumo", "fecha_entrega", "medicamento_id", "cantidad"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    receta_id: int
+    medicamento_id: int
+
+    cantidad: int
+    fecha_entrega: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    farmaceutico_id: Optional[int] = Field(default=None, foreign_key="user.id")
+
+    receta_medicamento: "RecetaMedicamento" = Relationship(back_populates="dispensaciones")
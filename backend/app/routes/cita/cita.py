@@ -1,26 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, or_, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlmodel import Session, select, tuple_
+from sqlalchemy import exists
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
 
 from ...models.usuario.usuario import User, RoleEnum
-from ...models.usuario.horario_laboral import HorarioLaboral
 from ...models.cita.cita import Cita, EstadoCitaEnum
 
-from ...schemas.cita.cita import CitaCreate, CitaRead, CitaWithMedicoRead, EstadoCita, EstadoCitaRequest
+from ...schemas.cita.cita import (
+    CitaCreate, CitaRead, CitaWithMedicoRead, EstadoCita, EstadoCitaRequest,
+    DisponibilidadMedicoRead, SlotDisponible
+)
+from ...utils.disponibilidad import a_minutos, a_hora, calcular_slots
+from ...utils.horarios import cache_horarios
+from ...utils.paginacion import PAGINA_MAX, CABECERA_CURSOR, decodificar_cursor, limite_pagina, paginar, recortar_pagina
 
-from ..websocket.websoket import notificar_actualizacion
+from ..websocket.gestor_citas import notificar_cita
 
-from ...database import get_session
-from datetime import date, time
+from ...database import get_session, get_async_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import date, datetime, time, timedelta
 from ...dependencies import get_current_user
-from typing import List
+from typing import List, Optional
+from collections import defaultdict
 from app.models.medicamento.receta import Receta
 
 router = APIRouter()
 
+ORDEN_CITA = (Cita.fecha, Cita.hora_inicio, Cita.id)
+TIPOS_CURSOR_CITA = (date.fromisoformat, time.fromisoformat, int)
+
+
+def clave_cita(cita):
+    return (cita.fecha, cita.hora_inicio, cita.id)
+
 @router.get("/citas/medico/{medico_id}", response_model=List[CitaRead])
 def obtener_citas_activas_por_medico(
     medico_id: int,
+    response: Response,
+    limite: Optional[int] = Query(None, ge=1, le=PAGINA_MAX),
+    cursor: Optional[str] = None,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
@@ -29,68 +48,62 @@ def obtener_citas_activas_por_medico(
 
     hoy = date.today()
 
-    citas = session.exec(
+    consulta = (
         select(Cita)
         .where(Cita.medico_id == medico_id)
         .where(Cita.fecha >= hoy)
         .where(Cita.estado.notin_([EstadoCita.perdida]))
-        .order_by(Cita.fecha, Cita.hora_inicio)
-    ).all()
+    )
+    if cursor:
+        consulta = consulta.where(tuple_(*ORDEN_CITA) > tuple_(*decodificar_cursor(cursor, TIPOS_CURSOR_CITA)))
+
+    limite = limite_pagina(limite, cursor)
+    citas = session.exec(paginar(consulta.order_by(*ORDEN_CITA), limite)).all()
+    citas, siguiente = recortar_pagina(citas, limite, clave_cita)
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
 
     return citas
 
 @router.post("/citas")
-async  def crear_cita(cita_data: CitaCreate, session: Session = Depends(get_session)):
-    conflictos = session.exec(
-        select(Cita).where(
+async  def crear_cita(cita_data: CitaCreate, session: AsyncSession = Depends(get_async_session)):
+    if cita_data.hora_fin <= cita_data.hora_inicio:
+        raise HTTPException(status_code=400, detail="La hora de fin debe ser posterior a la hora de inicio.")
+
+    # Chequeo rápido para dar el error sin llegar al INSERT; la garantía real
+    # la da la restricción cita_sin_solapamiento ante reservas simultáneas.
+    conflictos = (await session.exec(
+        select(Cita.id).where(
             Cita.medico_id == cita_data.medico_id,
             Cita.fecha == cita_data.fecha,
-            or_(
-                Cita.hora_inicio == cita_data.hora_inicio,
-                Cita.hora_fin == cita_data.hora_fin,
-                (Cita.hora_inicio < cita_data.hora_inicio) & (Cita.hora_fin > cita_data.hora_inicio),
-                (Cita.hora_inicio < cita_data.hora_fin) & (Cita.hora_fin > cita_data.hora_fin),
-                (Cita.hora_inicio >= cita_data.hora_inicio) & (Cita.hora_fin <= cita_data.hora_fin),
-            )
+            Cita.hora_inicio < cita_data.hora_fin,
+            Cita.hora_fin > cita_data.hora_inicio,
         )
-    ).first()
+    )).first()
 
     if conflictos:
         raise HTTPException(status_code=400, detail="El médico ya tiene una cita en ese horario.")
 
-    dia_nombre = cita_data.fecha.strftime("%A").lower()
-    dias_map = {
-        "monday": "lunes", "tuesday": "martes", "wednesday": "miércoles",
-        "thursday": "jueves", "friday": "viernes", "saturday": "sábado", "sunday": "domingo"
-    }
-    dia_local = dias_map[dia_nombre]
-
-    horario = session.exec(
-        select(HorarioLaboral).where(
-            HorarioLaboral.user_id == cita_data.medico_id,
-            HorarioLaboral.dia == dia_local
-        )
-    ).first()
+    horario = await cache_horarios.obtener_async(session, cita_data.medico_id)
+    dia_semana = cita_data.fecha.weekday()
 
-    if not horario:
+    if not horario.trabaja(dia_semana):
         raise HTTPException(status_code=400, detail="El médico no tiene horario ese día.")
 
-    def str_to_time(val):
-        return time.fromisoformat(val) if isinstance(val, str) else val
-
-    cita_inicio = str_to_time(cita_data.hora_inicio)
-    cita_fin = str_to_time(cita_data.hora_fin)
-    horario_inicio = str_to_time(horario.hora_inicio)
-    horario_fin = str_to_time(horario.hora_fin)
-
-    if not (horario_inicio <= cita_inicio < horario_fin and horario_inicio < cita_fin <= horario_fin):
+    if not horario.contiene(dia_semana, a_minutos(cita_data.hora_inicio), a_minutos(cita_data.hora_fin)):
         raise HTTPException(status_code=400, detail="La cita está fuera del horario laboral del médico.")
 
     nueva_cita = Cita.from_orm(cita_data)
     session.add(nueva_cita)
-    session.commit()
-    session.refresh(nueva_cita)
-    await notificar_actualizacion()
+    try:
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        if "cita_sin_solapamiento" in str(e.orig):
+            raise HTTPException(status_code=400, detail="El médico ya tiene una cita en ese horario.")
+        raise
+    await session.refresh(nueva_cita)
+    await notificar_cita(nueva_cita, "creada")
 
     return {"message": "Cita creada exitosamente", "cita_id": nueva_cita.id}
 
@@ -98,6 +111,9 @@ async  def crear_cita(cita_data: CitaCreate, session: Session = Depends(get_sess
 
 @router.get("/citas/hoy", response_model=List[Cita])
 def obtener_citas_hoy(
+    response: Response,
+    limite: Optional[int] = Query(None, ge=1, le=PAGINA_MAX),
+    cursor: Optional[str] = None,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
@@ -111,29 +127,36 @@ def obtener_citas_hoy(
 
     hoy = date.today()
 
-    citas = session.exec(
-        select(Cita).where(Cita.fecha == hoy)
-    ).all()
+    consulta = select(Cita).where(Cita.fecha == hoy)
+    if cursor:
+        consulta = consulta.where(tuple_(*ORDEN_CITA) > tuple_(*decodificar_cursor(cursor, TIPOS_CURSOR_CITA)))
+
+    limite = limite_pagina(limite, cursor)
+    citas = session.exec(paginar(consulta.order_by(*ORDEN_CITA), limite)).all()
+    citas, siguiente = recortar_pagina(citas, limite, clave_cita)
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
 
     return citas
 
 @router.put("/citas/{cita_id}/para-signos")
 async def marcar_cita_para_signos(
     cita_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != RoleEnum.administrativo:
         raise HTTPException(status_code=403, detail="Acceso denegado, solo administrativo puede marcar para signos.")
 
-    cita = session.get(Cita, cita_id)
+    cita = await session.get(Cita, cita_id)
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
+    estado_anterior = cita.estado
     cita.estado = EstadoCitaEnum.para_signos
     session.add(cita)
-    session.commit()
-    await notificar_actualizacion()
+    await session.commit()
+    await notificar_cita(cita, "estado", estado_anterior)
 
     return {"message": "Cita actualizada a 'para signos' correctamente."}
 
@@ -141,49 +164,59 @@ async def marcar_cita_para_signos(
 async def cambiar_estado_cita(
     cita_id: int,
     data: EstadoCitaRequest,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
-    cita = session.get(Cita, cita_id)
+    cita = await session.get(Cita, cita_id)
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada.")
 
     if current_user.role != RoleEnum.medico:
         raise HTTPException(status_code=403, detail="Solo médicos pueden actualizar el estado.")
 
+    estado_anterior = cita.estado
     cita.estado = data.estado
     session.add(cita)
-    session.commit()
+    await session.commit()
 
-    await notificar_actualizacion()
+    await notificar_cita(cita, "estado", estado_anterior)
 
     return {"message": "Estado actualizado"}
 
 
 @router.get("/citas/historial", response_model=List[CitaWithMedicoRead])
 def obtener_historial_citas_paciente(
+    response: Response,
+    limite: Optional[int] = Query(None, ge=1, le=PAGINA_MAX),
+    cursor: Optional[str] = None,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != RoleEnum.paciente:
         raise HTTPException(status_code=403, detail="Solo pacientes pueden consultar su historial de citas.")
 
-    citas = session.exec(
-        select(Cita)
+    tiene_receta = exists().where(Receta.cita_id == Cita.id).label("tiene_receta")
+    consulta = (
+        select(Cita, tiene_receta)
         .options(
             selectinload(Cita.medico).selectinload(User.especialidad),
             selectinload(Cita.certificado_medico),
             selectinload(Cita.certificado_asistencia)
         )
         .where(Cita.paciente_id == current_user.id)
-        .order_by(Cita.fecha.desc(), Cita.hora_inicio.desc())
+    )
+    if cursor:
+        consulta = consulta.where(tuple_(*ORDEN_CITA) < tuple_(*decodificar_cursor(cursor, TIPOS_CURSOR_CITA)))
+
+    limite = limite_pagina(limite, cursor)
+    citas = session.exec(
+        paginar(consulta.order_by(*(columna.desc() for columna in ORDEN_CITA)), limite)
     ).all()
+    citas, siguiente = recortar_pagina(citas, limite, lambda fila: clave_cita(fila[0]))
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
     resultado = []
-    for cita in citas:
-        receta_existente = session.exec(
-            select(Receta).where(Receta.cita_id == cita.id)
-        ).first()
-
+    for cita, receta_existente in citas:
         resultado.append(
             CitaWithMedicoRead(
                 id=cita.id,
@@ -199,13 +232,83 @@ def obtener_historial_citas_paciente(
                 },
                 certificado_medico=cita.certificado_medico is not None,
                 certificado_asistencia=cita.certificado_asistencia is not None,
-                tiene_receta=receta_existente is not None  # 👈 aquí
+                tiene_receta=receta_existente
             )
         )
 
     return resultado
 
 
+MAX_DIAS_DISPONIBILIDAD = 62
+
+
+@router.get("/citas/disponibilidad", response_model=List[DisponibilidadMedicoRead])
+def buscar_disponibilidad(
+    desde: date,
+    hasta: date,
+    duracion_minutos: int = 30,
+    especialidad_id: Optional[int] = None,
+    medico_id: Optional[int] = None,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    if (especialidad_id is None) == (medico_id is None):
+        raise HTTPException(status_code=400, detail="Indique una especialidad o un médico.")
+    if hasta < desde or (hasta - desde).days >= MAX_DIAS_DISPONIBILIDAD:
+        raise HTTPException(status_code=400, detail=f"El rango de fechas debe ser válido y de máximo {MAX_DIAS_DISPONIBILIDAD} días.")
+    if not 5 <= duracion_minutos <= 480:
+        raise HTTPException(status_code=400, detail="La duración debe estar entre 5 y 480 minutos.")
+
+    filtro = User.id == medico_id if medico_id is not None else User.especialidad_id == especialidad_id
+    medicos = session.exec(
+        select(User)
+        .options(selectinload(User.especialidad))
+        .where(User.role == RoleEnum.medico, User.is_active == True, filtro)
+        .order_by(User.apellido, User.nombre)
+    ).all()
+    if not medicos:
+        return []
+
+    # Todas las citas del rango en una sola consulta, agrupadas por (médico, fecha)
+    ocupados = defaultdict(list)
+    filas = session.exec(
+        select(Cita.medico_id, Cita.fecha, Cita.hora_inicio, Cita.hora_fin).where(
+            Cita.medico_id.in_([m.id for m in medicos]),
+            Cita.fecha >= desde,
+            Cita.fecha <= hasta
+        )
+    ).all()
+    for medico, fecha, inicio, fin in filas:
+        ocupados[(medico, fecha)].append((a_minutos(inicio), a_minutos(fin)))
+
+    horarios = cache_horarios.obtener_varios(session, [m.id for m in medicos])
+
+    ahora = datetime.now()
+    hoy = ahora.date()
+    dias = [desde + timedelta(days=n) for n in range((hasta - desde).days + 1)]
+    resultado = []
+    for medico in medicos:
+        horario = horarios[medico.id]
+        slots = []
+        for dia in dias:
+            ventanas = horario.ventanas(dia.weekday())
+            if not ventanas or dia < hoy:
+                continue
+            minimo = ahora.hour * 60 + ahora.minute if dia == hoy else 0
+            for inicio, fin in calcular_slots(ventanas, ocupados.get((medico.id, dia), ()), duracion_minutos, minimo):
+                slots.append(SlotDisponible(fecha=dia, hora_inicio=a_hora(inicio), hora_fin=a_hora(fin)))
+
+        resultado.append(DisponibilidadMedicoRead(
+            medico_id=medico.id,
+            nombre=medico.nombre,
+            apellido=medico.apellido,
+            especialidad=medico.especialidad.nombre if medico.especialidad else None,
+            slots=slots
+        ))
+
+    return resultado
+
+
 @router.get("/citas/{cita_id}", response_model=CitaRead)
 def obtener_cita_por_id(
     cita_id: int,
@@ -0,0 +1,74 @@
+from typing import List
+from fastapi import APIRouter, HTTPException, Depends
+from sqlmodel import Session, select
+from sqlalchemy.exc import IntegrityError
+
+from ...dependencies import require_role
+from ...models.usuario.usuario import User
+from ...database import get_session
+from ...models.medicamento.medicamento import Medicamento
+from ...models.medicamento.interaccion import InteraccionMedicamento
+from ...schemas.medicamento.interaccion import InteraccionCreate, InteraccionRead
+from ...utils.interacciones import indice_interacciones
+
+router = APIRouter()
+
+
+@router.get("/interacciones", response_model=List[InteraccionRead])
+def listar_interacciones(session: Session = Depends(get_session)):
+    return session.exec(select(InteraccionMedicamento)).all()
+
+
+@router.post("/interacciones", response_model=InteraccionRead)
+def crear_interaccion(
+    datos: InteraccionCreate,
+    session: Session = Depends(get_session),
+    user: User = Depends(require_role("farmacologo"))
+):
+    a, b = sorted((datos.medicamento_a_id, datos.medicamento_b_id))
+    if a == b:
+        raise HTTPException(status_code=400, detail="Una interacción requiere dos medicamentos distintos")
+    encontrados = session.exec(select(Medicamento.id).where(Medicamento.id.in_([a, b]))).all()
+    if len(encontrados) != 2:
+        raise HTTPException(status_code=404, detail="Medicamento no encontrado")
+
+    interaccion = InteraccionMedicamento(
+        medicamento_a_id=a,
+        medicamento_b_id=b,
+        severidad=datos.severidad,
+        descripcion=datos.descripcion
+    )
+    session.add(interaccion)
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=400, detail="La interacción ya está registrada")
+    session.refresh(interaccion)
+    indice_interacciones.invalidar()
+    return interaccion
+
+
+@router.delete("/interacciones/{interaccion_id}")
+def eliminar_interaccion(
+    interaccion_id: int,
+    session: Session = Depends(get_session),
+    user: User = Depends(require_role("farmacologo"))
+):
+    interaccion = session.get(InteraccionMedicamento, interaccion_id)
+    if not interaccion:
+        raise HTTPException(status_code=404, detail="Interacción no encontrada")
+    session.delete(interaccion)
+    session.commit()
+    indice_interacciones.invalidar()
+    return {"ok": True}
+
+
+@router.post("/interacciones/recargar")
+def recargar_interacciones(
+    session: Session = Depends(get_session),
+    user: User = Depends(require_role("farmacologo"))
+):
+    # Para cargas hechas directamente en la base; los demás workers recargan al usarlo
+    indice_interacciones.invalidar()
+    return {"interacciones": indice_interacciones.cargar(session)}
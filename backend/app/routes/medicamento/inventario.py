@@ -0,0 +1,118 @@
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import update
+
+from ...dependencies import require_role
+from ...models.usuario.usuario import User
+from ...database import get_session, get_async_session, engine
+from ...models.medicamento.medicamento import Medicamento
+from ...models.medicamento.inventario import MovimientoInventario, TipoMovimientoEnum
+from ...schemas.medicamento.inventario import MovimientoCreate, MovimientoRead, StockLedgerRead
+from ...utils.stock import descontar_stock
+from ...utils.inventario import registrar_movimientos, stock_segun_ledger, tarea_inventario, ultima_conciliacion
+from ...utils.alertas import actualizar_alertas
+from ...utils.pronostico import cache_pronostico
+from ...utils.paginacion import PAGINA_DEFAULT, PAGINA_MAX, CABECERA_CURSOR, decodificar_cursor, recortar_pagina
+from ..websocket.gestor_medicamentos import gestor_medicamentos
+
+router = APIRouter()
+
+
+@router.post("/inventario/movimientos", response_model=MovimientoRead)
+async def registrar_movimiento(
+    datos: MovimientoCreate,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(require_role("farmacologo"))
+):
+    if datos.cantidad == 0:
+        raise HTTPException(status_code=400, detail="La cantidad no puede ser cero")
+    if datos.tipo == TipoMovimientoEnum.dispensacion:
+        raise HTTPException(status_code=400, detail="Las dispensaciones se registran al entregar una receta")
+    if datos.tipo == TipoMovimientoEnum.ingreso and datos.cantidad < 0:
+        raise HTTPException(status_code=400, detail="Un ingreso debe tener cantidad positiva")
+    if datos.tipo == TipoMovimientoEnum.vencimiento and datos.cantidad > 0:
+        raise HTTPException(status_code=400, detail="Un vencimiento debe tener cantidad negativa")
+
+    if not await session.get(Medicamento, datos.medicamento_id):
+        raise HTTPException(status_code=404, detail="Medicamento no encontrado")
+
+    if datos.cantidad < 0:
+        faltantes = await descontar_stock(session, {datos.medicamento_id: -datos.cantidad})
+        if faltantes:
+            await session.rollback()
+            raise HTTPException(status_code=400, detail={"mensaje": "Stock insuficiente", "faltantes": faltantes})
+    else:
+        await session.execute(
+            update(Medicamento)
+            .where(Medicamento.id == datos.medicamento_id)
+            .values(stock=Medicamento.stock + datos.cantidad)
+            .execution_options(synchronize_session=False)
+        )
+
+    movimiento = MovimientoInventario(**datos.dict(), usuario_id=user.id)
+    session.add(movimiento)
+    await session.commit()
+    await session.refresh(movimiento)
+    await gestor_medicamentos.notificar_cambio("actualizar", {"id": datos.medicamento_id})
+    await actualizar_alertas(session, [datos.medicamento_id])
+    return movimiento
+
+
+@router.get("/inventario/conciliacion")
+def obtener_conciliacion(
+    ejecutar: bool = False,
+    user: User = Depends(require_role("farmacologo"))
+):
+    # Con ejecutar=true se genera un snapshot y se concilia en el momento
+    if ejecutar:
+        tarea_inventario(engine)
+    return ultima_conciliacion
+
+
+@router.get("/inventario/pronostico")
+def obtener_pronostico(
+    recalcular: bool = False,
+    solo_reponer: bool = False,
+    session: Session = Depends(get_session),
+    user: User = Depends(require_role("farmacologo"))
+):
+    pronostico = cache_pronostico.obtener(session, forzar=recalcular)
+    if solo_reponer:
+        return {**pronostico, "medicamentos": [m for m in pronostico["medicamentos"] if m["reponer"] > 0]}
+    return pronostico
+
+
+@router.get("/inventario/{medicamento_id}/movimientos", response_model=List[MovimientoRead])
+def listar_movimientos(
+    medicamento_id: int,
+    response: Response,
+    limite: int = Query(PAGINA_DEFAULT, ge=1, le=PAGINA_MAX),
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session),
+    user: User = Depends(require_role("farmacologo"))
+):
+    # Más recientes primero, paginado por id
+    consulta = select(MovimientoInventario).where(MovimientoInventario.medicamento_id == medicamento_id)
+    if cursor:
+        ultimo_id, = decodificar_cursor(cursor, (int,))
+        consulta = consulta.where(MovimientoInventario.id < ultimo_id)
+
+    movimientos = session.exec(consulta.order_by(MovimientoInventario.id.desc()).limit(limite + 1)).all()
+    movimientos, siguiente = recortar_pagina(movimientos, limite, lambda m: (m.id,))
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
+    return movimientos
+
+
+@router.get("/inventario/{medicamento_id}/stock", response_model=StockLedgerRead)
+def stock_a_fecha(
+    medicamento_id: int,
+    fecha: Optional[datetime] = None,
+    session: Session = Depends(get_session),
+    user: User = Depends(require_role("farmacologo"))
+):
+    stock = stock_segun_ledger(session, hasta=fecha, medicamento_id=medicamento_id)
+    return StockLedgerRead(medicamento_id=medicamento_id, fecha=fecha, stock=stock.get(medicamento_id, 0))
@@ -1,95 +1,170 @@
-from datetime import date
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
-
-from ...dependencies import require_role
-from ...models.medicamento.receta import Receta
-from ...models.usuario.usuario import User
-from ...database import get_session
-from ...models.medicamento.medicamento import Medicamento
-from ...schemas.medicamento.medicamento import MedicamentoCreate, MedicamentoRead, MedicamentoUpdate
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from sqlmodel import select
+from sqlalchemy import tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ...database import get_async_session, async_engine
+from ...models.medicamento.medicamento import Medicamento, MedicamentoEliminado, VersionCatalogo, FormaFarmaceuticaEnum
+from ...schemas.medicamento.medicamento import MedicamentoCreate, MedicamentoRead, MedicamentoUpdate, CambiosMedicamentoRead
+from ...utils.inventario import registrar_movimientos
+from ...models.medicamento.inventario import TipoMovimientoEnum
+from ...utils.busqueda import coincide_texto
+from ...utils.alertas import motor_alertas, actualizar_alertas
+from ...utils.paginacion import PAGINA_DEFAULT, PAGINA_MAX, CABECERA_CURSOR, decodificar_cursor, recortar_pagina
 from ..websocket.gestor_medicamentos import gestor_medicamentos
-from ..websocket.websoket import gestor_recetas
 
 router = APIRouter()
 
 
 @router.post("/medicamentos", response_model=MedicamentoRead)
-async def crear_medicamento(med: MedicamentoCreate, session: Session = Depends(get_session)):
+async def crear_medicamento(med: MedicamentoCreate, session: AsyncSession = Depends(get_async_session)):
     nuevo = Medicamento(**med.dict())
     session.add(nuevo)
-    session.commit()
-    session.refresh(nuevo)
+    await session.flush()
+    registrar_movimientos(session, {nuevo.id: nuevo.stock}, TipoMovimientoEnum.ingreso, nota="Stock inicial")
+    await session.commit()
+    await session.refresh(nuevo)
     await gestor_medicamentos.notificar_cambio("crear", {"id": nuevo.id})
+    await actualizar_alertas(session, [nuevo.id])
     return nuevo
 
 
 
+# Solo Postgres tiene el trigger que numera los cambios; en otras bases no
+# se emite ETag y /medicamentos/cambios devuelve el catálogo completo
+CATALOGO_VERSIONADO = async_engine.dialect.name == "postgresql"
+
+
+async def version_catalogo(session: AsyncSession) -> int:
+    # Último valor confirmado del contador: los cambios con un número menor o
+    # igual ya están confirmados y los que sigan en curso recibirán uno mayor
+    return (await session.exec(select(VersionCatalogo.valor))).first() or 0
+
+
+def _etag(version: int) -> str:
+    return f'"medicamentos-{version}"'
+
+
 @router.get("/medicamentos", response_model=list[MedicamentoRead])
-def listar_medicamentos(session: Session = Depends(get_session)):
-    medicamentos = session.exec(select(Medicamento)).all()
+async def listar_medicamentos(request: Request, response: Response, session: AsyncSession = Depends(get_async_session)):
+    if CATALOGO_VERSIONADO:
+        etag = _etag(await version_catalogo(session))
+        recibidos = [valor.strip().removeprefix("W/") for valor in request.headers.get("if-none-match", "").split(",")]
+        if etag in recibidos:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+
+    medicamentos = (await session.exec(select(Medicamento))).all()
     return medicamentos
 
 
+@router.get("/medicamentos/cambios", response_model=CambiosMedicamentoRead)
+async def cambios_medicamentos(
+    since_version: int = Query(..., ge=0),
+    session: AsyncSession = Depends(get_async_session)
+):
+    # La versión se lee antes que las filas, así todo cambio con número
+    # <= version entra en la respuesta. Lo confirmado entre ambas lecturas
+    # puede venir también en la siguiente consulta; aplicarlo dos veces no
+    # cambia el resultado.
+    version = await version_catalogo(session)
+    if not CATALOGO_VERSIONADO:
+        since_version = -1
+    medicamentos = (await session.exec(
+        select(Medicamento).where(Medicamento.version > since_version).order_by(Medicamento.version)
+    )).all()
+    eliminados = (await session.exec(
+        select(MedicamentoEliminado.medicamento_id).where(MedicamentoEliminado.version > since_version)
+    )).all()
+    return {"version": version, "medicamentos": medicamentos, "eliminados": eliminados}
+
+
+ORDEN_MEDICAMENTO = (Medicamento.nombre, Medicamento.id)
+TIPOS_CURSOR_MEDICAMENTO = (str, int)
+BUSQUEDA_MAX = 50
+
+
+@router.get("/medicamentos/buscar", response_model=list[MedicamentoRead])
+async def buscar_medicamentos(
+    response: Response,
+    q: Optional[str] = Query(None, max_length=100),
+    is_activo: Optional[bool] = None,
+    forma_farmaceutica: Optional[FormaFarmaceuticaEnum] = None,
+    solo_con_stock: bool = False,
+    limite: int = Query(20, ge=1, le=BUSQUEDA_MAX),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session)
+):
+    # Busca por nombre, laboratorio o concentración (sin tildes ni mayúsculas)
+    consulta = select(Medicamento)
+    if q and q.strip():
+        consulta = consulta.where(coincide_texto(
+            (Medicamento.nombre, Medicamento.laboratorio, Medicamento.concentracion),
+            q,
+            async_engine.dialect.name
+        ))
+    if is_activo is not None:
+        consulta = consulta.where(Medicamento.is_activo == is_activo)
+    if forma_farmaceutica is not None:
+        consulta = consulta.where(Medicamento.forma_farmaceutica == forma_farmaceutica)
+    if solo_con_stock:
+        consulta = consulta.where(Medicamento.stock > 0)
+    if cursor:
+        consulta = consulta.where(
+            tuple_(*ORDEN_MEDICAMENTO) > tuple_(*decodificar_cursor(cursor, TIPOS_CURSOR_MEDICAMENTO))
+        )
+
+    medicamentos = (await session.exec(consulta.order_by(*ORDEN_MEDICAMENTO).limit(limite + 1))).all()
+    medicamentos, siguiente = recortar_pagina(medicamentos, limite, lambda m: (m.nombre, m.id))
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
+    return medicamentos
+
+
+@router.get("/medicamentos/alertas")
+def listar_alertas(tipo: Optional[str] = Query(None, pattern="^(sin_stock|stock_bajo|por_vencer|vencido)$")):
+    # Se sirve desde memoria, sin consultar la base
+    return motor_alertas.listar(tipo)
+
+
 @router.get("/medicamentos/{med_id}", response_model=MedicamentoRead)
-def obtener_medicamento(med_id: int, session: Session = Depends(get_session)):
-    med = session.get(Medicamento, med_id)
+async def obtener_medicamento(med_id: int, session: AsyncSession = Depends(get_async_session)):
+    med = await session.get(Medicamento, med_id)
     if not med:
         raise HTTPException(status_code=404, detail="Medicamento no encontrado")
     return med
 
 
 @router.put("/medicamentos/{med_id}", response_model=MedicamentoRead)
-async def actualizar_medicamento(med_id: int, datos: MedicamentoUpdate, session: Session = Depends(get_session)):
-    med = session.get(Medicamento, med_id)
+async def actualizar_medicamento(med_id: int, datos: MedicamentoUpdate, session: AsyncSession = Depends(get_async_session)):
+    cambios = datos.dict(exclude_unset=True)
+    # Si cambia el stock se bloquea la fila para que el delta del ledger sea exacto
+    med = await session.get(Medicamento, med_id, with_for_update=cambios.get("stock") is not None)
     if not med:
         raise HTTPException(status_code=404, detail="No encontrado")
 
-    for campo, valor in datos.dict(exclude_unset=True).items():
+    if cambios.get("stock") is not None:
+        registrar_movimientos(session, {med.id: cambios["stock"] - med.stock}, TipoMovimientoEnum.ajuste, nota="Edición de medicamento")
+
+    for campo, valor in cambios.items():
         setattr(med, campo, valor)
 
     session.add(med)
-    session.commit()
-    session.refresh(med)
+    await session.commit()
+    await session.refresh(med)
     await gestor_medicamentos.notificar_cambio("actualizar", {"id": med.id})
+    await actualizar_alertas(session, [med.id])
     return med
 
 
 @router.delete("/medicamentos/{med_id}")
-async def eliminar_medicamento(med_id: int, session: Session = Depends(get_session)):
-    med = session.get(Medicamento, med_id)
+async def eliminar_medicamento(med_id: int, session: AsyncSession = Depends(get_async_session)):
+    med = await session.get(Medicamento, med_id)
     if not med:
         raise HTTPException(status_code=404, detail="No encontrado")
-    session.delete(med)
-    session.commit()
+    await session.delete(med)
+    await session.commit()
     await gestor_medicamentos.notificar_cambio("eliminar", {"id": med_id})
-    return {"ok": True}
-
-
-@router.post("/recetas/{receta_id}/autorizar")
-async def autorizar_entrega(
-    receta_id: int,
-    session: Session = Depends(get_session),
-    user: User = Depends(require_role("farmacologo"))
-):
-    receta = session.get(Receta, receta_id)
-    if not receta or receta.estado != "pendiente":
-        raise HTTPException(status_code=400, detail="No se puede autorizar")
-
-    for item in receta.medicamentos:
-        medicamento = session.get(Medicamento, item.medicamento_id)
-        if not medicamento or medicamento.stock <= 0:
-            raise HTTPException(status_code=400, detail=f"{medicamento.nombre} sin stock")
-
-        medicamento.stock -= 1
-        session.add(medicamento)
-
-    receta.estado = "entregada"
-    receta.fecha_entrega = date.today()
-    session.add(receta)
-    session.commit()
-
-    # Notificar por WebSocket
-    await gestor_recetas.notificar("entregada", {"receta_id": receta.id})
-
+    await actualizar_alertas(session, [med_id])
     return {"ok": True}
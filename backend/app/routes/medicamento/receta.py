@@ -1,6 +1,10 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlmodel import Session, select
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, joinedload, selectinload
 from datetime import date
 
 from app.models.cita.cita import Cita
@@ -8,110 +12,171 @@ from app.auth import get_current_user
 from app.models.usuario.usuario import User, RoleEnum
 from app.models.medicamento.medicamento import Medicamento
 from app.models.medicamento.receta import Receta, RecetaMedicamento
-from app.schemas.medicamento.receta import RecetaCreate, RecetaRead, RecetaMedicamentoRead
+from app.schemas.medicamento.receta import RecetaCreate, RecetaRead, RecetaMedicamentoRead, DispensacionLote
 from ...auth import get_current_user
-from ...database import get_session
-import re
-import json
+from ...database import get_session, get_async_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ...dependencies import require_role
+from ...utils.alertas import actualizar_alertas
+from ...utils.dispensacion import dispensar
+from ...utils.interacciones import revisar_receta
+from ...utils.posologia import interpretar_posologia
+from ...utils.paginacion import PAGINA_MAX, CABECERA_CURSOR, decodificar_cursor, limite_pagina, paginar, recortar_pagina
+from ..websocket.gestor_medicamentos import gestor_medicamentos
+from ..websocket.gestor_recetas import gestor_recetas
 router = APIRouter()
-
-def calcular_total_dosis(dosis: str, frecuencia: str, duracion: str) -> int:
-    """
-    Estima el número total de unidades necesarias para un medicamento
-    según la dosis, frecuencia y duración.
-    """
-
-    # Paso 1: convertir dosis a float
-    try:
-        dosis_float = float(re.findall(r"[\d\.]+", dosis)[0])
-    except:
-        dosis_float = 1.0  # default si falla el parseo
-
-    # Paso 2: determinar tomas por día según frecuencia
-    frecuencia = frecuencia.lower()
-    if "cada" in frecuencia and "hora" in frecuencia:
-        horas = int(re.findall(r"\d+", frecuencia)[0])
-        tomas_por_dia = 24 // horas
-    elif "vez" in frecuencia or "veces" in frecuencia:
-        tomas_por_dia = int(re.findall(r"\d+", frecuencia)[0])
-    else:
-        tomas_por_dia = 3  # valor por defecto conservador
-
-    # Paso 3: días de duración
-    try:
-        dias = int(re.findall(r"\d+", duracion)[0])
-    except:
-        dias = 3  # por defecto 3 días si no se puede leer
-
-    # Total = dosis * tomas por día * días
-    total = dosis_float * tomas_por_dia * dias
-
-    # Redondear hacia arriba para asegurar cantidad suficiente
-    return int(round(total + 0.5))
-
+logger = logging.getLogger(__name__)
 
 @router.post("/recetas", response_model=RecetaRead)
 def crear_receta(data: RecetaCreate, session: Session = Depends(get_session), user: User = Depends(get_current_user)):
-    cita = session.get(Cita, data.cita_id)
+    cita = session.exec(
+        select(Cita)
+        .options(joinedload(Cita.paciente), joinedload(Cita.medico))
+        .where(Cita.id == data.cita_id)
+    ).first()
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     if cita.medico_id != user.id:
         raise HTTPException(status_code=403, detail="No autorizado para emitir receta en esta cita")
 
+    ids = [m.medicamento_id for m in data.medicamentos]
+    if len(ids) != len(set(ids)):
+        raise HTTPException(status_code=400, detail="Un medicamento no puede repetirse en la receta")
+
+    # Todos los medicamentos se validan con una sola consulta
+    medicamentos = {
+        med.id: med for med in session.exec(select(Medicamento).where(Medicamento.id.in_(ids))).all()
+    } if ids else {}
+    no_encontrados = [i for i in ids if i not in medicamentos]
+    if no_encontrados:
+        raise HTTPException(status_code=400, detail={
+            "mensaje": "Medicamentos no encontrados",
+            "medicamento_ids": no_encontrados
+        })
+
+    # Solo advierte: la decisión clínica queda en manos del médico
+    advertencias = revisar_receta(session, cita.paciente_id, ids)
+
     receta = Receta(
         cita_id=cita.id,
         observaciones=data.observaciones or ''
     )
-
     session.add(receta)
-    session.commit()
-    session.refresh(receta)
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=400, detail="La cita ya tiene una receta emitida")
 
+    renglones = []
+    detalles = []
     for m in data.medicamentos:
-        medicamento = session.get(Medicamento, m.medicamento_id)
-        if not medicamento:
-            continue
-        receta_med = RecetaMedicamento(
-            receta_id=receta.id,
-            medicamento_id=medicamento.id,
-            dosis=m.dosis,
-            frecuencia=m.frecuencia,
-            duracion=m.duracion,
-            indicaciones=m.indicaciones
-        )
-        session.add(receta_med)
+        posologia = interpretar_posologia(m.dosis, m.frecuencia, m.duracion)
+        if not posologia.interpretada:
+            # La cantidad a entregar sale de valores por defecto: que el médico lo vea
+            logger.warning(
+                "Posología no interpretada en la cita %s, medicamento %s: %r / %r / %r",
+                cita.id, m.medicamento_id, m.dosis, m.frecuencia, m.duracion
+            )
+            advertencias.append({
+                "tipo": "posologia",
+                "medicamento_ids": [m.medicamento_id],
+                "mensaje": (
+                    "No se pudo interpretar la posología; se calcularon "
+                    f"{posologia.total_unidades} unidades ({posologia.unidades_por_toma:g} por toma, "
+                    f"{posologia.tomas_por_dia:g} tomas al día, {posologia.dias} días)"
+                )
+            })
+        renglon = {
+            "receta_id": receta.id,
+            "medicamento_id": m.medicamento_id,
+            "dosis": m.dosis,
+            "frecuencia": m.frecuencia,
+            "duracion": m.duracion,
+            "indicaciones": m.indicaciones,
+            "unidades_por_toma": posologia.unidades_por_toma,
+            "tomas_por_dia": posologia.tomas_por_dia,
+            "dias_tratamiento": posologia.dias,
+            "total_unidades": posologia.total_unidades
+        }
+        renglones.append(renglon)
+
+        medicamento = medicamentos[m.medicamento_id]
+        detalles.append(RecetaMedicamentoRead(
+            **{campo: valor for campo, valor in renglon.items() if campo != "receta_id"},
+            medicamento_nombre=medicamento.nombre,
+            disponible=medicamento.stock > 0,
+            stock=medicamento.stock
+        ))
+
+    if renglones:
+        session.execute(insert(RecetaMedicamento), renglones)
+
+    # La respuesta se arma antes del commit, que expira los objetos cargados
+    respuesta = RecetaRead(
+        id=receta.id,
+        fecha_emision=receta.fecha_emision,
+        observaciones=receta.observaciones,
+        paciente_nombre=f"{cita.paciente.nombre} {cita.paciente.apellido}",
+        medico_nombre=f"{cita.medico.nombre} {cita.medico.apellido}",
+        fecha_cita=cita.fecha,
+        medicamentos=detalles,
+        advertencias=advertencias
+    )
 
     session.commit()
-    return obtener_receta(receta.id, session, user)
+    return respuesta
 
 
 
 @router.get("/recetas/pendientes", response_model=List[RecetaRead])
-def recetas_pendientes(session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    recetas = session.exec(
-        select(Receta).where(Receta.estado.in_(["pendiente", "parcial"]))
-    ).all()
+def recetas_pendientes(
+    response: Response,
+    limite: Optional[int] = Query(None, ge=1, le=PAGINA_MAX),
+    cursor: Optional[str] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    medico_id: Optional[int] = None,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    # Cola de trabajo de farmacia en orden de llegada. Recetas, citas, paciente
+    # y médico salen de un solo JOIN; los renglones y sus medicamentos de una
+    # carga selectin, sin consultas por fila.
+    paciente = aliased(User)
+    medico = aliased(User)
+    consulta = (
+        select(Receta, Cita, paciente, medico)
+        .join(Cita, Cita.id == Receta.cita_id)
+        .join(paciente, paciente.id == Cita.paciente_id)
+        .join(medico, medico.id == Cita.medico_id)
+        .options(
+            selectinload(Receta.medicamentos).selectinload(RecetaMedicamento.medicamento),
+            selectinload(Receta.medicamentos).selectinload(RecetaMedicamento.dispensaciones)
+        )
+        .where(Receta.estado.in_(["pendiente", "parcial"]))
+    )
+    if fecha_desde:
+        consulta = consulta.where(Receta.fecha_emision >= fecha_desde)
+    if fecha_hasta:
+        consulta = consulta.where(Receta.fecha_emision <= fecha_hasta)
+    if medico_id is not None:
+        consulta = consulta.where(Cita.medico_id == medico_id)
+    if cursor:
+        consulta = consulta.where(Receta.id > decodificar_cursor(cursor, (int,))[0])
+
+    limite = limite_pagina(limite, cursor)
+    filas = session.exec(paginar(consulta.order_by(Receta.id), limite)).all()
+    filas, siguiente = recortar_pagina(filas, limite, lambda fila: (fila[0].id,))
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
 
     resultado = []
 
-    for receta in recetas:
-        cita = session.get(Cita, receta.cita_id)
-        if not cita:
-            continue
-        paciente = session.get(User, cita.paciente_id)
-        medico = session.get(User, cita.medico_id)
-
-        # 🟡 Obtener medicamentos ya entregados desde observaciones
-        entregados = set()
-        try:
-            observaciones_data = json.loads(receta.observaciones or '{}')
-            entregados = set(observaciones_data.get('entregados', []))
-        except json.JSONDecodeError:
-            pass
-
+    for receta, cita, paciente_receta, medico_receta in filas:
         detalles = []
         for item in receta.medicamentos:
-            medicamento = session.get(Medicamento, item.medicamento_id)
+            medicamento = item.medicamento
             detalles.append(RecetaMedicamentoRead(
                 medicamento_id=item.medicamento_id,
                 dosis=item.dosis,
@@ -121,15 +186,19 @@ def recetas_pendientes(session: Session = Depends(get_session), current_user: Us
                 medicamento_nombre=medicamento.nombre,
                 disponible=medicamento.stock > 0,
                 stock=medicamento.stock,
-                entregado=item.medicamento_id in entregados  # ✅ Marca si ya fue entregado
+                entregado=bool(item.dispensaciones),
+                unidades_por_toma=item.unidades_por_toma,
+                tomas_por_dia=item.tomas_por_dia,
+                dias_tratamiento=item.dias_tratamiento,
+                total_unidades=item.total_unidades
             ))
 
         resultado.append(RecetaRead(
             id=receta.id,
             fecha_emision=receta.fecha_emision,
             observaciones=receta.observaciones,
-            paciente_nombre=f"{paciente.nombre} {paciente.apellido}",
-            medico_nombre=f"{medico.nombre} {medico.apellido}",
+            paciente_nombre=f"{paciente_receta.nombre} {paciente_receta.apellido}",
+            medico_nombre=f"{medico_receta.nombre} {medico_receta.apellido}",
             fecha_cita=cita.fecha,
             medicamentos=detalles
         ))
@@ -164,7 +233,11 @@ def obtener_receta(receta_id: int, session: Session = Depends(get_session), user
             indicaciones=item.indicaciones,
             medicamento_nombre=medicamento.nombre,
             disponible=medicamento.stock > 0,
-            stock=medicamento.stock
+            stock=medicamento.stock,
+            unidades_por_toma=item.unidades_por_toma,
+            tomas_por_dia=item.tomas_por_dia,
+            dias_tratamiento=item.dias_tratamiento,
+            total_unidades=item.total_unidades
         ))
 
     return RecetaRead(
@@ -189,79 +262,61 @@ def obtener_receta_por_cita(cita_id: int, session: Session = Depends(get_session
 
 
 
-@router.post("/recetas/{receta_id}/autorizar")
-def autorizar_entrega_total(
-    receta_id: int,
-    session: Session = Depends(get_session),
-    user: User = Depends(get_current_user)
-):
-    receta = session.get(Receta, receta_id)
-    if not receta:
-        raise HTTPException(status_code=404, detail="Receta no encontrada")
-
-    for item in receta.medicamentos:
-        medicamento = session.get(Medicamento, item.medicamento_id)
-        cantidad = calcular_total_dosis(item.dosis, item.frecuencia, item.duracion)
-        medicamento.stock = max(0, medicamento.stock - cantidad)
-        session.add(medicamento)
+async def _notificar_dispensacion(session: AsyncSession, resultado: dict):
+    # Una sola notificación por canal sin importar cuántas recetas se entregaron
+    if not resultado["entregadas"]:
+        return
+    datos = {
+        "receta_ids": resultado["entregadas"],
+        "estados": {receta_id: resultado["estados"][receta_id] for receta_id in resultado["entregadas"]}
+    }
+    if len(resultado["entregadas"]) == 1:
+        datos["receta_id"] = resultado["entregadas"][0]
+    await gestor_recetas.notificar("entregada", datos)
+    await gestor_medicamentos.notificar_cambio("stock", {"ids": resultado["medicamento_ids"]})
+    await actualizar_alertas(session, resultado["medicamento_ids"])
 
-    receta.estado = "entregada"
-    receta.fecha_entrega = date.today()
 
-    session.add(receta)
-    session.commit()
-    return {"message": "Receta entregada completamente"}
+@router.post("/recetas/autorizar-lote")
+async def autorizar_entrega_lote(
+    data: DispensacionLote,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(require_role("farmacologo"))
+):
+    seleccion = {}
+    for item in data.recetas:
+        if item.receta_id in seleccion:
+            raise HTTPException(status_code=400, detail="Una receta no puede repetirse en el lote")
+        seleccion[item.receta_id] = set(item.entregados) if item.entregados is not None else None
 
+    resultado = await dispensar(session, seleccion, user)
+    await _notificar_dispensacion(session, resultado)
+    return {"estados": resultado["estados"], "entregadas": resultado["entregadas"]}
 
 
+@router.post("/recetas/{receta_id}/autorizar")
+async def autorizar_entrega_total(
+    receta_id: int,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(require_role("farmacologo"))
+):
+    # Solo lo que no se entregó en entregas parciales previas
+    resultado = await dispensar(session, {receta_id: None}, user)
+    await _notificar_dispensacion(session, resultado)
+    return {"message": "Receta entregada completamente"}
 
 
 @router.post("/recetas/{receta_id}/autorizar-parcial")
-def autorizar_entrega_parcial(
+async def autorizar_entrega_parcial(
     receta_id: int,
     data: dict,
-    session: Session = Depends(get_session),
-    user: User = Depends(get_current_user)
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(require_role("farmacologo"))
 ):
     entregados = set(data.get("entregados", []))
-    receta = session.get(Receta, receta_id)
-    if not receta:
-        raise HTTPException(status_code=404, detail="Receta no encontrada")
-
-    # Leer lista actual de entregados desde observaciones
-    entregados_previos = set()
-    try:
-        nota = json.loads(receta.observaciones or "{}")
-        entregados_previos = set(nota.get("entregados", []))
-    except json.JSONDecodeError:
-        nota = {}
-
-    # Filtrar los nuevos a entregar
-    nuevos_entregados = entregados - entregados_previos
-
-    if not nuevos_entregados:
+    resultado = await dispensar(session, {receta_id: entregados}, user)
+    if not resultado["entregadas"]:
         return {"message": "No hay nuevos medicamentos por entregar."}
 
-    for item in receta.medicamentos:
-        if item.medicamento_id in nuevos_entregados:
-            medicamento = session.get(Medicamento, item.medicamento_id)
-            cantidad = calcular_total_dosis(item.dosis, item.frecuencia, item.duracion)
-            medicamento.stock = max(0, medicamento.stock - cantidad)
-            session.add(medicamento)
-
-    # Guardar combinación de anteriores + nuevos entregados
-    nota["entregados"] = list(entregados_previos.union(nuevos_entregados))
-    receta.observaciones = json.dumps(nota)
-
-    # Cambiar estado
-    ids_totales = {item.medicamento_id for item in receta.medicamentos}
-    if set(nota["entregados"]) == ids_totales:
-        receta.estado = "entregada"
-        receta.fecha_entrega = date.today()
-    else:
-        receta.estado = "parcial"
-
-    session.add(receta)
-    session.commit()
-
+    await _notificar_dispensacion(session, resultado)
     return {"message": "Entrega parcial registrada"}
@@ -7,28 +7,30 @@ from ...models.signos.signos_vitales import SignosVitales
 from ...schemas.cita.cita import CitaWithSignosRead
 from ...schemas.signos.signos_vitales import SignosVitalesCreate, SignosVitalesRead
 
-from ..websocket.websoket import notificar_actualizacion
+from ..websocket.gestor_citas import notificar_cita
 
-from ...database import get_session
+from ...database import get_session, get_async_session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import joinedload
 
 router = APIRouter()
 
 @router.post("/signos-vitales", response_model=SignosVitalesRead)
-async  def crear_signos_vitales(signos: SignosVitalesCreate, session: Session = Depends(get_session)):
-    cita = session.get(Cita, signos.cita_id)
+async  def crear_signos_vitales(signos: SignosVitalesCreate, session: AsyncSession = Depends(get_async_session)):
+    cita = await session.get(Cita, signos.cita_id)
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada.")
 
     nuevos_signos = SignosVitales(**signos.dict())
     session.add(nuevos_signos)
 
+    estado_anterior = cita.estado
     cita.estado = EstadoCitaEnum.en_espera
     session.add(cita)
 
-    session.commit()
-    session.refresh(nuevos_signos)
-    await notificar_actualizacion()
+    await session.commit()
+    await session.refresh(nuevos_signos)
+    await notificar_cita(cita, "estado", estado_anterior)
     return nuevos_signos
 
 
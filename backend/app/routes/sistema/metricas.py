@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from ...models.usuario.usuario import User, RoleEnum
+from ...dependencies import get_current_user
+from ...utils.cache_principal import cache_principal
+from ...utils.pool import estadisticas_pool
+from ...database import engine, async_engine
+from ..websocket.gestor_citas import gestor_citas
+from ..websocket.gestor_medicamentos import gestor_medicamentos
+from ..websocket.gestor_recetas import gestor_recetas
+
+router = APIRouter()
+
+
+@router.get("/metricas")
+def obtener_metricas(current_user: User = Depends(get_current_user)):
+    if current_user.role != RoleEnum.super_admin:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    return {
+        "cache_usuarios": cache_principal.estadisticas(),
+        "pool_db": estadisticas_pool(engine.pool),
+        "pool_db_async": estadisticas_pool(async_engine.sync_engine.pool),
+        "websocket": {
+            gestor.nombre: gestor.estadisticas()
+            for gestor in (gestor_citas, gestor_medicamentos, gestor_recetas)
+        },
+    }
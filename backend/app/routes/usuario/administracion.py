@@ -8,6 +8,8 @@ from ...schemas.usuario.horario_laboral import HorarioItem
 
 from ...database import get_session
 from ...dependencies import get_current_user
+from ...utils.cache_principal import cache_principal
+from ...utils.horarios import cache_horarios
 from typing import List
 from sqlalchemy.orm import joinedload
 from .validaciones import actualizar_campos_basicos, manejar_password, manejar_especialidad, manejar_horarios
@@ -78,6 +80,7 @@ def editar_usuario(
     session.add(usuario)
     session.commit()
     manejar_horarios(session, usuario, datos)
+    cache_principal.invalidar_usuario(user_id)
 
     return {"message": "Usuario actualizado exitosamente"}
 
@@ -100,9 +103,11 @@ def eliminar_usuario(
 
     session.exec(delete(HorarioLaboral).where(HorarioLaboral.user_id == user_id))
     session.commit()
+    cache_horarios.invalidar(user_id)
 
     usuario.is_active = False
     session.add(usuario)
     session.commit()
+    cache_principal.invalidar_usuario(user_id)
     return {"message": "Usuario desactivado correctamente"}
 
@@ -9,6 +9,7 @@ from ...auth import verify_password
 from ...utils.security import get_password_hash
 from ...database import get_session
 from ...dependencies import get_current_user
+from ...utils.cache_principal import cache_principal
 
 router = APIRouter()
 
@@ -30,6 +31,7 @@ def update_username(
 
     session.add(current_user)
     session.commit()
+    cache_principal.invalidar_usuario(current_user.id)
 
     return {"message": "Nombre de usuario actualizado exitosamente."}
 
@@ -49,6 +51,7 @@ def update_password(
 
     session.add(current_user)
     session.commit()
+    cache_principal.invalidar_usuario(current_user.id)
 
     return {"message": "Contraseña actualizada exitosamente."}
 
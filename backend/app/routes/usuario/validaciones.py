@@ -9,6 +9,7 @@ from ...models.usuario.especialidad import Especialidad
 from ...schemas.usuario.usuario import UserUpdate
 
 from ...utils.security import get_password_hash
+from ...utils.horarios import cache_horarios
 import re
 
 router = APIRouter()
@@ -85,6 +86,7 @@ def create_horarios(session, nuevo_usuario, user):
         )
         session.add(horario)
     session.commit()
+    cache_horarios.invalidar(nuevo_usuario.id)
 
 def actualizar_campos_basicos(usuario: User, datos: UserUpdate):
     datos_dict = datos.dict(exclude_unset=True)
@@ -129,6 +131,7 @@ def manejar_horarios(session: Session, usuario: User, datos: UserUpdate):
         )
         session.add(nuevo_horario)
     session.commit()
+    cache_horarios.invalidar(usuario.id)
 
 
 
@@ -0,0 +1,322 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+from dotenv import load_dotenv
+from fastapi import WebSocket
+
+from ...utils.bus import bus
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WS_COLA_MAX = int(os.getenv("WS_COLA_MAX", 100))
+WS_TIMEOUT_ENVIO_SEGUNDOS = float(os.getenv("WS_TIMEOUT_ENVIO_SEGUNDOS", 5))
+# Eventos recientes que se guardan para reenviar a quien reconecta
+WS_BUFFER_EVENTOS = int(os.getenv("WS_BUFFER_EVENTOS", 500))
+# Ventana en la que se juntan los eventos de un mismo tema antes de publicar
+WS_VENTANA_MS = float(os.getenv("WS_VENTANA_MS", 150))
+# Publicaciones por segundo de un canal entre todos los workers y mensajes
+# por segundo a un cliente (0: sin límite). Cada cliente recibe lo que
+# publican todos los workers, así que el del canal debe quedar por debajo
+# del del cliente para que las ventanas solas no lo saturen
+WS_CANAL_POR_SEGUNDO = float(os.getenv("WS_CANAL_POR_SEGUNDO", 10))
+WS_CLIENTE_POR_SEGUNDO = float(os.getenv("WS_CLIENTE_POR_SEGUNDO", 20))
+# Workers que publican en los canales: cada uno toma su parte del límite del
+# canal. Uvicorn y gunicorn leen WEB_CONCURRENCY para --workers
+WS_WORKERS = max(int(os.getenv("WS_WORKERS", os.getenv("WEB_CONCURRENCY", 1))), 1)
+
+if 0 < WS_CLIENTE_POR_SEGUNDO < WS_CANAL_POR_SEGUNDO:
+    logger.warning(
+        "WS_CANAL_POR_SEGUNDO (%s) supera WS_CLIENTE_POR_SEGUNDO (%s): los clientes recibirán resync",
+        WS_CANAL_POR_SEGUNDO, WS_CLIENTE_POR_SEGUNDO
+    )
+
+# 1013 "Try Again Later": el cliente puede reconectar y recargar su estado
+CODIGO_CLIENTE_LENTO = 1013
+
+
+class LimiteTasa:
+    """Cubeta de fichas: `tasa` por segundo con ráfagas de hasta `tasa` fichas."""
+
+    def __init__(self, tasa: float):
+        self.tasa = tasa
+        self.fichas = max(tasa, 1)
+        self._ultima = time.monotonic()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.fichas = min(max(self.tasa, 1), self.fichas + (ahora - self._ultima) * self.tasa)
+        self._ultima = ahora
+
+    def tomar(self) -> bool:
+        if self.tasa <= 0:
+            return True
+        self._recargar()
+        if self.fichas < 1:
+            return False
+        self.fichas -= 1
+        return True
+
+    def espera(self) -> float:
+        # Segundos hasta que haya una ficha disponible
+        if self.tasa <= 0:
+            return 0
+        self._recargar()
+        return max(0, (1 - self.fichas) / self.tasa)
+
+
+class Conexion:
+    """Un WebSocket con su cola de salida acotada y la tarea que la vacía."""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=WS_COLA_MAX)
+        self.tarea: Optional[asyncio.Task] = None
+        self.limite = LimiteTasa(WS_CLIENTE_POR_SEGUNDO)
+        # Se le descartaron mensajes por el límite y espera un "resync"
+        self.saturada = False
+
+
+class GestorWebSocketBase:
+    """
+    Base de los gestores de WebSocket. Publicar solo encola el mensaje en
+    cada conexión y vuelve de inmediato; cada conexión tiene su propia tarea
+    que envía en orden. Un cliente cuya cola se llena o que tarda más de
+    WS_TIMEOUT_ENVIO_SEGUNDOS en aceptar un mensaje se desconecta, así un
+    equipo colgado no frena a los demás ni a la petición HTTP.
+
+    Cada evento llega del bus con un "seq" creciente y se guarda en un
+    buffer circular de WS_BUFFER_EVENTOS. Quien reconecta con ?ultimo_seq=
+    recibe solo los eventos que se perdió o, si ya no están en el buffer,
+    {"evento": "resync"} para que recargue su estado; después siempre llega
+    {"evento": "conectado", "seq": n} con el número desde el que seguir.
+    Si al worker le falta algún número (su escucha del bus se cayó), las
+    conexiones abiertas reciben "resync" antes del evento que sigue al hueco.
+
+    Los eventos publicados con `clave` se juntan durante WS_VENTANA_MS: los
+    de la misma clave se combinan y lo acumulado sale en un solo mensaje,
+    con a lo sumo WS_CANAL_POR_SEGUNDO publicaciones por segundo sumando los
+    WS_WORKERS workers (si se agotan, la ventana se alarga y se junta más).
+    Al apagar, `vaciar_pendientes` publica lo que quedaba en la ventana.
+    A un cliente que supera
+    WS_CLIENTE_POR_SEGUNDO se le dejan de enviar eventos y, cuando vuelve a
+    tener cupo, recibe un único "resync".
+    """
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.conexiones: Dict[WebSocket, Conexion] = {}
+        self.expulsados = 0
+        # Referencias a los cierres en curso para que no se recolecten
+        self._cierres: Set[asyncio.Task] = set()
+        # Se guardan todos los eventos con seq > _base (None: aún no se sabe)
+        self.eventos: deque = deque(maxlen=WS_BUFFER_EVENTOS)
+        self._base: Optional[int] = None
+        self._ultimo: Optional[int] = None
+        self._roto = False
+        self._pendientes: Dict = {}
+        self._vaciado: Optional[asyncio.Task] = None
+        self._limite_canal = LimiteTasa(WS_CANAL_POR_SEGUNDO / WS_WORKERS)
+        self.combinados = 0
+        self.limitados = 0
+        # Lo publicado por cualquier worker llega a las conexiones de este
+        self.canal = f"ws:{nombre}"
+        bus.secuenciar(self.canal)
+        bus.suscribir(self.canal, self.recibir)
+
+    async def conectar(self, websocket: WebSocket, ultimo_seq: Optional[int] = None):
+        await websocket.accept()
+        conexion = Conexion(websocket)
+        conexion.tarea = asyncio.create_task(self._enviar(conexion))
+        self.conexiones[websocket] = conexion
+        # Sin await entre registrar y reenviar: ningún evento se cuela en medio
+        self._iniciar_secuencia()
+        if ultimo_seq is not None:
+            self._reenviar(conexion, ultimo_seq)
+        conexion.cola.put_nowait({"evento": "conectado", "seq": self._ultimo})
+
+    def desconectar(self, websocket: WebSocket):
+        # Idempotente: puede llegar desde el endpoint y desde la expulsión
+        conexion = self.conexiones.pop(websocket, None)
+        if conexion and conexion.tarea and conexion.tarea is not asyncio.current_task():
+            conexion.tarea.cancel()
+        return conexion
+
+    def _expulsar(self, conexion: Conexion, motivo: str):
+        if self.desconectar(conexion.websocket) is None:
+            return
+        self.expulsados += 1
+        logger.warning("WebSocket %s: cliente desconectado (%s)", self.nombre, motivo)
+        tarea = asyncio.create_task(self._cerrar(conexion.websocket))
+        self._cierres.add(tarea)
+        tarea.add_done_callback(self._cierres.discard)
+
+    async def _cerrar(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=CODIGO_CLIENTE_LENTO), WS_TIMEOUT_ENVIO_SEGUNDOS)
+        except Exception:
+            pass
+
+    async def _enviar(self, conexion: Conexion):
+        while True:
+            mensaje = await conexion.cola.get()
+            try:
+                await asyncio.wait_for(conexion.websocket.send_json(mensaje), WS_TIMEOUT_ENVIO_SEGUNDOS)
+            except asyncio.TimeoutError:
+                self._expulsar(conexion, "envío lento")
+                return
+            except Exception:
+                self._expulsar(conexion, "conexión rota")
+                return
+
+    async def difundir(self, mensaje: dict, clave=None):
+        """
+        Publica `mensaje` para las conexiones de todos los workers. Con
+        `clave` se difiere hasta el fin de la ventana y se combina con los
+        demás eventos pendientes.
+        """
+        if clave is None or WS_VENTANA_MS <= 0:
+            await bus.publicar(self.canal, mensaje)
+            return
+        anterior = self._pendientes.get(clave)
+        if anterior is not None:
+            self.combinados += 1
+            mensaje = self.combinar(anterior, mensaje)
+        self._pendientes[clave] = mensaje
+        if self._vaciado is None:
+            self._vaciado = asyncio.create_task(self._vaciar())
+
+    def combinar(self, anterior: dict, nuevo: dict) -> dict:
+        # Dos eventos de la misma clave en una ventana: vale el último
+        return nuevo
+
+    def agrupar(self, mensajes: List[dict]) -> dict:
+        # Varios eventos de claves distintas en un solo mensaje
+        return {"evento": "lote", "eventos": mensajes}
+
+    async def _vaciar(self):
+        try:
+            await asyncio.sleep(WS_VENTANA_MS / 1000)
+            # Sin cupo en el canal se sigue juntando hasta que lo haya
+            await asyncio.sleep(self._limite_canal.espera())
+            self._limite_canal.tomar()
+        finally:
+            self._vaciado = None
+        await self._publicar_pendientes()
+
+    async def _publicar_pendientes(self):
+        pendientes = list(self._pendientes.values())
+        self._pendientes.clear()
+        if pendientes:
+            await bus.publicar(self.canal, pendientes[0] if len(pendientes) == 1 else self.agrupar(pendientes))
+
+    async def vaciar_pendientes(self):
+        # Al apagar el worker: lo que esperaba el fin de la ventana sale ya
+        tarea, self._vaciado = self._vaciado, None
+        if tarea is not None:
+            tarea.cancel()
+            await asyncio.gather(tarea, return_exceptions=True)
+        await self._publicar_pendientes()
+
+    def destinatarios_de(self, mensaje: dict) -> Optional[Iterable[WebSocket]]:
+        # None: todas las conexiones; los gestores con temas filtran aquí
+        return None
+
+    def mensaje_para(self, websocket: WebSocket, mensaje: dict) -> Optional[dict]:
+        # Lo que le toca a `websocket` de `mensaje` (None: nada)
+        destino = self.destinatarios_de(mensaje)
+        return mensaje if destino is None or websocket in destino else None
+
+    def recibir(self, mensaje: dict):
+        # Entrega local de un mensaje del bus
+        self._guardar(mensaje)
+        self.encolar(mensaje, self.destinatarios_de(mensaje))
+
+    def _iniciar_secuencia(self):
+        if self._ultimo is None:
+            self._base = self._ultimo = bus.secuencia_inicial(self.canal)
+
+    def _guardar(self, mensaje: dict):
+        self._iniciar_secuencia()
+        seq = mensaje.get("seq")
+        if seq is None:
+            # Entregado solo en este worker con el bus caído: desde aquí no
+            # se puede asegurar qué vio cada cliente
+            self.eventos.clear()
+            self._roto = True
+            return
+        if self._ultimo is None:
+            self._base = seq - 1
+        elif self._roto or seq != self._ultimo + 1:
+            # Hueco o corte: los conectados se perdieron eventos y recargan;
+            # el buffer vuelve a empezar desde este mensaje
+            self.eventos.clear()
+            self._base = seq - 1
+            self._roto = False
+            self.encolar({"evento": "resync", "seq": self._base})
+        if len(self.eventos) == self.eventos.maxlen:
+            self._base = self.eventos[0]["seq"]
+        self.eventos.append(mensaje)
+        self._ultimo = seq
+
+    def _reenviar(self, conexion: Conexion, ultimo_seq: int):
+        if self._roto or self._base is None or not self._base <= ultimo_seq <= self._ultimo:
+            conexion.cola.put_nowait({"evento": "resync", "seq": self._ultimo})
+            return
+        perdidos = []
+        for mensaje in self.eventos:
+            if mensaje["seq"] <= ultimo_seq:
+                continue
+            mensaje = self.mensaje_para(conexion.websocket, mensaje)
+            if mensaje is not None:
+                perdidos.append(mensaje)
+        if len(perdidos) >= conexion.cola.maxsize:
+            # Reenviarlos llenaría la cola: sale más barato recargar
+            conexion.cola.put_nowait({"evento": "resync", "seq": self._ultimo})
+            return
+        for mensaje in perdidos:
+            conexion.cola.put_nowait(mensaje)
+
+    def encolar(self, mensaje: dict, websockets: Optional[Iterable[WebSocket]] = None):
+        """Encola `mensaje` para `websockets` (todas las conexiones si es None) sin esperar."""
+        destino = self.conexiones.values() if websockets is None else (
+            self.conexiones[ws] for ws in websockets if ws in self.conexiones
+        )
+        for conexion in list(destino):
+            self._poner(conexion, mensaje)
+
+    def _poner(self, conexion: Conexion, mensaje: dict):
+        if conexion.saturada:
+            return
+        if not conexion.limite.tomar():
+            # Sin cupo: se descarta lo que venga y luego se pide recargar
+            self.limitados += 1
+            conexion.saturada = True
+            asyncio.get_running_loop().call_later(conexion.limite.espera(), self._liberar, conexion)
+            return
+        try:
+            conexion.cola.put_nowait(mensaje)
+        except asyncio.QueueFull:
+            self._expulsar(conexion, "cola llena")
+
+    def _liberar(self, conexion: Conexion):
+        if self.conexiones.get(conexion.websocket) is not conexion:
+            return
+        conexion.saturada = False
+        self._poner(conexion, {"evento": "resync", "seq": self._ultimo})
+
+    def estadisticas(self) -> dict:
+        return {
+            "conexiones": len(self.conexiones),
+            "expulsados": self.expulsados,
+            "mensajes_en_cola": sum(c.cola.qsize() for c in self.conexiones.values()),
+            "ultimo_seq": self._ultimo,
+            "eventos_guardados": len(self.eventos),
+            "eventos_combinados": self.combinados,
+            "clientes_limitados": self.limitados,
+        }
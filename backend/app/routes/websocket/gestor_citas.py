@@ -0,0 +1,186 @@
+from typing import Dict, Iterable, List, Optional, Set
+from fastapi import WebSocket
+
+from .gestor_base import GestorWebSocketBase
+
+# Estados que atiende la estación de enfermería
+ESTADOS_ENFERMERIA = {"para_signos", "en_espera"}
+
+
+def _valor(estado) -> Optional[str]:
+    return estado.value if hasattr(estado, "value") else estado
+
+
+def temas_cita(cita, estado_anterior: Optional[str] = None) -> List[str]:
+    """
+    Temas a los que pertenece un cambio de cita. El estado anterior también
+    cuenta, así quien mira una cola ve salir la cita además de entrar.
+    """
+    estados = {_valor(cita.estado)}
+    if estado_anterior:
+        estados.add(_valor(estado_anterior))
+    temas = [
+        f"medico:{cita.medico_id}",
+        f"paciente:{cita.paciente_id}",
+        f"fecha:{cita.fecha.isoformat()}",
+    ]
+    temas += [f"estado:{estado}" for estado in sorted(estados)]
+    if estados & ESTADOS_ENFERMERIA:
+        temas.append("enfermeria")
+    return temas
+
+
+def datos_cita(cita, estado_anterior: Optional[str] = None) -> dict:
+    return {
+        "id": cita.id,
+        "estado": _valor(cita.estado),
+        "estado_anterior": _valor(estado_anterior),
+        "medico_id": cita.medico_id,
+        "paciente_id": cita.paciente_id,
+        "fecha": cita.fecha.isoformat(),
+        "hora_inicio": cita.hora_inicio.isoformat(),
+        "hora_fin": cita.hora_fin.isoformat(),
+    }
+
+
+def temas_de_parametros(parametros) -> Set[str]:
+    # ?medico_id=2&fecha=2024-05-01&estacion=enfermeria o ?temas=medico:2,fecha:...
+    temas = set()
+    for clave, prefijo in (("medico_id", "medico"), ("paciente_id", "paciente"), ("fecha", "fecha"), ("estado", "estado")):
+        if parametros.get(clave):
+            temas.add(f"{prefijo}:{parametros[clave]}")
+    if parametros.get("estacion") == "enfermeria":
+        temas.add("enfermeria")
+    if parametros.get("temas"):
+        temas.update(t.strip() for t in parametros["temas"].split(",") if t.strip())
+    return temas
+
+
+class GestorWebSocketCitas(GestorWebSocketBase):
+    """
+    Conexiones de /ws/estado-citas con sus temas. Una conexión sin temas
+    recibe todos los eventos, como antes de existir las suscripciones.
+
+    Varias citas cambiadas en la misma ventana llegan como
+    {"evento": "actualizacion_citas", "tipo": "lote", "cambios": [...]},
+    y cada conexión recibe solo los cambios de sus temas.
+    """
+
+    def __init__(self):
+        super().__init__("citas")
+        self.temas: Dict[WebSocket, Set[str]] = {}
+        self.por_tema: Dict[str, Set[WebSocket]] = {}
+        self.sin_temas: Set[WebSocket] = set()
+
+    async def conectar(self, websocket: WebSocket, temas: Iterable[str] = (), ultimo_seq: Optional[int] = None):
+        # Los temas van antes para que el reenvío de eventos perdidos los respete
+        self.temas[websocket] = set()
+        self.sin_temas.add(websocket)
+        self.suscribir(websocket, temas)
+        try:
+            await super().conectar(websocket, ultimo_seq)
+        except Exception:
+            self.desconectar(websocket)
+            raise
+
+    def desconectar(self, websocket: WebSocket):
+        self.desuscribir(websocket, list(self.temas.get(websocket, ())))
+        self.temas.pop(websocket, None)
+        self.sin_temas.discard(websocket)
+        return super().desconectar(websocket)
+
+    def suscribir(self, websocket: WebSocket, temas: Iterable[str]):
+        if websocket not in self.temas:
+            return
+        for tema in temas:
+            self.temas[websocket].add(tema)
+            self.por_tema.setdefault(tema, set()).add(websocket)
+        if self.temas[websocket]:
+            self.sin_temas.discard(websocket)
+
+    def desuscribir(self, websocket: WebSocket, temas: Iterable[str]):
+        # Al quitar el último tema la conexión vuelve a recibir todo
+        if websocket not in self.temas:
+            return
+        for tema in temas:
+            self.temas[websocket].discard(tema)
+            suscriptores = self.por_tema.get(tema)
+            if suscriptores is not None:
+                suscriptores.discard(websocket)
+                if not suscriptores:
+                    del self.por_tema[tema]
+        if not self.temas[websocket]:
+            self.sin_temas.add(websocket)
+
+    def destinatarios(self, temas: Iterable[str]) -> Set[WebSocket]:
+        destino = set(self.sin_temas)
+        for tema in temas:
+            destino |= self.por_tema.get(tema, set())
+        return destino
+
+    async def publicar(self, temas: List[str], mensaje: dict, clave=None):
+        await self.difundir({**mensaje, "temas": temas}, clave)
+
+    def destinatarios_de(self, mensaje: dict) -> Optional[Set[WebSocket]]:
+        # Lo que no lleva temas (p. ej. "resync") es para todas las conexiones
+        if "temas" not in mensaje:
+            return None
+        return self.destinatarios(mensaje["temas"])
+
+    def combinar(self, anterior: dict, nuevo: dict) -> dict:
+        # La misma cita cambió dos veces en la ventana: datos del último
+        # cambio, estado anterior del primero y los temas de ambos
+        cita = {**nuevo["cita"], "estado_anterior": anterior["cita"]["estado_anterior"]}
+        return {
+            **nuevo,
+            "tipo": "creada" if anterior["tipo"] == "creada" else nuevo["tipo"],
+            "cita": cita,
+            "temas": list(dict.fromkeys(anterior["temas"] + nuevo["temas"]))
+        }
+
+    def agrupar(self, mensajes: List[dict]) -> dict:
+        # Cada cambio conserva sus temas para repartirlo por conexión
+        return {
+            "evento": "actualizacion_citas",
+            "tipo": "lote",
+            "cambios": [{"tipo": m["tipo"], "cita": m["cita"], "temas": m["temas"]} for m in mensajes],
+            "temas": list(dict.fromkeys(tema for m in mensajes for tema in m["temas"]))
+        }
+
+    def mensaje_para(self, websocket: WebSocket, mensaje: dict) -> Optional[dict]:
+        destino = self.destinatarios_de(mensaje)
+        if destino is not None and websocket not in destino:
+            return None
+        if "cambios" not in mensaje or websocket in self.sin_temas:
+            return mensaje
+        # De un lote, solo los cambios de los temas de la conexión
+        temas = self.temas.get(websocket, set())
+        cambios = [c for c in mensaje["cambios"] if temas.intersection(c["temas"])]
+        if len(cambios) == len(mensaje["cambios"]):
+            return mensaje
+        return {**mensaje, "cambios": cambios, "temas": list(dict.fromkeys(t for c in cambios for t in c["temas"]))}
+
+    def recibir(self, mensaje: dict):
+        if "cambios" not in mensaje:
+            super().recibir(mensaje)
+            return
+        self._guardar(mensaje)
+        for websocket in self.destinatarios_de(mensaje):
+            conexion = self.conexiones.get(websocket)
+            if conexion is not None:
+                self._poner(conexion, self.mensaje_para(websocket, mensaje))
+
+
+gestor_citas = GestorWebSocketCitas()
+
+
+async def notificar_cita(cita, tipo: str, estado_anterior: Optional[str] = None):
+    """
+    Publica el cambio de una cita con sus datos, sin obligar a recargar
+    listados. Los cambios de una misma ventana salen juntos en un lote.
+    """
+    await gestor_citas.publicar(
+        temas_cita(cita, estado_anterior),
+        {"evento": "actualizacion_citas", "tipo": tipo, "cita": datos_cita(cita, estado_anterior)},
+        clave=cita.id
+    )
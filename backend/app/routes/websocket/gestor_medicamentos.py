@@ -1,23 +1,22 @@
-from typing import List
-from fastapi import WebSocket
+from ...utils.alertas import al_cambiar_alertas
+from .gestor_base import GestorWebSocketBase
 
-class GestorWebSocketMedicamentos:
-    def __init__(self):
-        self.conexiones: List[WebSocket] = []
-
-    async def conectar(self, websocket: WebSocket):
-        await websocket.accept()
-        self.conexiones.append(websocket)
 
-    def desconectar(self, websocket: WebSocket):
-        self.conexiones.remove(websocket)
+class GestorWebSocketMedicamentos(GestorWebSocketBase):
+    def __init__(self):
+        super().__init__("medicamentos")
 
     async def notificar_cambio(self, evento: str, datos: dict = None):
         mensaje = {
             "evento": evento,
             "datos": datos or {}
         }
-        for conexion in self.conexiones:
-            await conexion.send_json(mensaje)
+        await self.difundir(mensaje)
 
 gestor_medicamentos = GestorWebSocketMedicamentos()
+
+
+async def _difundir_alertas(cambios: list):
+    await gestor_medicamentos.notificar_cambio("alertas", {"alertas": cambios})
+
+al_cambiar_alertas(_difundir_alertas)
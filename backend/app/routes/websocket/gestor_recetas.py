@@ -0,0 +1,15 @@
+from .gestor_base import GestorWebSocketBase
+
+
+class GestorWebSocketRecetas(GestorWebSocketBase):
+    def __init__(self):
+        super().__init__("recetas")
+
+    async def notificar(self, evento: str, datos: dict = None):
+        mensaje = {
+            "evento": evento,
+            "datos": datos or {}
+        }
+        await self.difundir(mensaje)
+
+gestor_recetas = GestorWebSocketRecetas()
@@ -1,82 +1,64 @@
+import json
+from typing import Optional
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import List
 from .gestor_medicamentos import gestor_medicamentos
+from .gestor_recetas import gestor_recetas
+from .gestor_citas import gestor_citas, temas_de_parametros
 
 router = APIRouter()
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            await connection.send_json(message)
-
-manager = ConnectionManager()
-
-
-async def notificar_actualizacion():
-    await manager.broadcast({"evento": "actualizacion_citas"})
+def ultimo_seq(websocket: WebSocket) -> Optional[int]:
+    # ?ultimo_seq=N al reconectar: el último "seq" que el cliente llegó a procesar
+    try:
+        return int(websocket.query_params["ultimo_seq"])
+    except (KeyError, ValueError):
+        return None
 
 
 @router.websocket("/ws/estado-citas")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    await gestor_citas.conectar(websocket, temas_de_parametros(websocket.query_params), ultimo_seq(websocket))
     try:
         while True:
-            await websocket.receive_text()
+            # {"accion": "suscribir" | "desuscribir", "temas": ["medico:2", "enfermeria"]}
+            texto = await websocket.receive_text()
+            try:
+                mensaje = json.loads(texto)
+            except ValueError:
+                continue
+            if not isinstance(mensaje, dict) or not isinstance(mensaje.get("temas"), list):
+                continue
+            temas = [str(t) for t in mensaje["temas"]]
+            if mensaje.get("accion") == "suscribir":
+                gestor_citas.suscribir(websocket, temas)
+            elif mensaje.get("accion") == "desuscribir":
+                gestor_citas.desuscribir(websocket, temas)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
-
-async def notificar_actualizacion():
-    await manager.broadcast({"evento": "actualizacion_citas"})
+        pass
+    finally:
+        gestor_citas.desconectar(websocket)
 
 @router.websocket("/ws/medicamentos")
 async def websocket_medicamentos(websocket: WebSocket):
-    await gestor_medicamentos.conectar(websocket)
+    await gestor_medicamentos.conectar(websocket, ultimo_seq(websocket))
     try:
         while True:
             await websocket.receive_text()  # Mantener la conexión viva
     except WebSocketDisconnect:
+        pass
+    finally:
         gestor_medicamentos.desconectar(websocket)
 
 
 
-class GestorWebSocketRecetas:
-    def __init__(self):
-        self.conexiones: List[WebSocket] = []
-
-    async def conectar(self, websocket: WebSocket):
-        await websocket.accept()
-        self.conexiones.append(websocket)
-
-    def desconectar(self, websocket: WebSocket):
-        self.conexiones.remove(websocket)
-
-    async def notificar(self, evento: str, datos: dict = None):
-        mensaje = {
-            "evento": evento,
-            "datos": datos or {}
-        }
-        for conexion in self.conexiones:
-            await conexion.send_json(mensaje)
-
-gestor_recetas = GestorWebSocketRecetas()
-
-
 @router.websocket("/ws/recetas")
 async def ws_recetas(websocket: WebSocket):
-    await gestor_recetas.conectar(websocket)
+    await gestor_recetas.conectar(websocket, ultimo_seq(websocket))
     try:
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
         gestor_recetas.desconectar(websocket)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import date, time
 from pydantic import BaseModel
 from enum import Enum
@@ -74,4 +74,18 @@ class CitaWithMedicoRead(BaseModel):
     tiene_receta: Optional[bool] = False
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class SlotDisponible(BaseModel):
+    fecha: date
+    hora_inicio: time
+    hora_fin: time
+
+
+class DisponibilidadMedicoRead(BaseModel):
+    medico_id: int
+    nombre: str
+    apellido: str
+    especialidad: Optional[str]
+    slots: List[SlotDisponible]
@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import Optional
+from ...models.medicamento.interaccion import SeveridadInteraccionEnum
+
+
+class InteraccionCreate(BaseModel):
+    medicamento_a_id: int
+    medicamento_b_id: int
+    severidad: SeveridadInteraccionEnum = SeveridadInteraccionEnum.moderada
+    descripcion: Optional[str] = None
+
+
+class InteraccionRead(InteraccionCreate):
+    id: int
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,32 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+from ...models.medicamento.inventario import TipoMovimientoEnum
+
+
+class MovimientoCreate(BaseModel):
+    medicamento_id: int
+    tipo: TipoMovimientoEnum
+    # Positivo entra al inventario, negativo sale
+    cantidad: int
+    nota: Optional[str] = None
+
+
+class MovimientoRead(BaseModel):
+    id: int
+    medicamento_id: int
+    tipo: TipoMovimientoEnum
+    cantidad: int
+    fecha: datetime
+    usuario_id: Optional[int]
+    receta_id: Optional[int]
+    nota: Optional[str]
+
+    class Config:
+        orm_mode = True
+
+
+class StockLedgerRead(BaseModel):
+    medicamento_id: int
+    fecha: Optional[datetime]
+    stock: int
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import date
 from ...models.medicamento.medicamento import FormaFarmaceuticaEnum, UnidadPresentacionEnum
 
@@ -11,6 +11,7 @@ class MedicamentoBase(BaseModel):
     forma_farmaceutica: Optional[FormaFarmaceuticaEnum]
     unidad_presentacion: Optional[UnidadPresentacionEnum]
     stock: int
+    stock_minimo: Optional[int] = 0
     fecha_vencimiento: Optional[date]
     laboratorio: Optional[str]
     precio_unitario: Optional[float]
@@ -23,11 +24,18 @@ class MedicamentoCreate(MedicamentoBase):
 
 class MedicamentoRead(MedicamentoBase):
     id: int
+    version: int = 0
 
     class Config:
         orm_mode = True
 
 
+class CambiosMedicamentoRead(BaseModel):
+    version: int
+    medicamentos: List[MedicamentoRead]
+    eliminados: List[int]
+
+
 class MedicamentoUpdate(BaseModel):
     nombre: Optional[str]
     descripcion: Optional[str]
@@ -35,6 +43,7 @@ class MedicamentoUpdate(BaseModel):
     forma_farmaceutica: Optional[FormaFarmaceuticaEnum]
     unidad_presentacion: Optional[UnidadPresentacionEnum]
     stock: Optional[int]
+    stock_minimo: Optional[int] = None
     fecha_vencimiento: Optional[date]
     laboratorio: Optional[str]
     precio_unitario: Optional[float]
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import date
 
@@ -16,6 +16,18 @@ class RecetaMedicamentoRead(RecetaMedicamentoBase):
     disponible: bool
     stock: int
     entregado: Optional[bool] = False
+    unidades_por_toma: Optional[float] = None
+    tomas_por_dia: Optional[float] = None
+    dias_tratamiento: Optional[int] = None
+    total_unidades: Optional[int] = None
+
+class AdvertenciaReceta(BaseModel):
+    tipo: str  # interaccion, duplicado, posologia
+    medicamento_ids: List[int]
+    severidad: Optional[str] = None
+    mensaje: str
+    en_tratamiento_activo: bool = False
+
 
 class RecetaCreate(BaseModel):
     cita_id: int
@@ -31,6 +43,17 @@ class RecetaRead(BaseModel):
     medico_nombre: str
     fecha_cita: date
     medicamentos: List[RecetaMedicamentoRead]
+    advertencias: List[AdvertenciaReceta] = []
 
     class Config:
         orm_mode = True
+
+
+class DispensacionItem(BaseModel):
+    receta_id: int
+    # None entrega todo lo pendiente de la receta
+    entregados: Optional[List[int]] = None
+
+
+class DispensacionLote(BaseModel):
+    recetas: List[DispensacionItem] = Field(..., min_length=1, max_length=100)
@@ -0,0 +1,152 @@
+import os
+import threading
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import or_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..models.medicamento.medicamento import Medicamento
+from ..database import async_engine
+from .bus import al_invalidar, propagar_invalidacion
+
+load_dotenv()
+
+ALERTA_VENCIMIENTO_DIAS = int(os.getenv("ALERTA_VENCIMIENTO_DIAS", 30))
+
+_COLUMNAS = (
+    Medicamento.id, Medicamento.nombre, Medicamento.stock, Medicamento.stock_minimo,
+    Medicamento.fecha_vencimiento, Medicamento.is_activo
+)
+
+
+def _alerta(fila, hoy: date) -> Optional[dict]:
+    medicamento_id, nombre, stock, stock_minimo, fecha_vencimiento, is_activo = fila
+    if not is_activo:
+        return None
+    tipos = []
+    if stock <= stock_minimo:
+        tipos.append("sin_stock" if stock == 0 else "stock_bajo")
+    if fecha_vencimiento is not None:
+        if fecha_vencimiento < hoy:
+            tipos.append("vencido")
+        elif fecha_vencimiento <= hoy + timedelta(days=ALERTA_VENCIMIENTO_DIAS):
+            tipos.append("por_vencer")
+    if not tipos:
+        return None
+    return {
+        "medicamento_id": medicamento_id,
+        "nombre": nombre,
+        "stock": stock,
+        "stock_minimo": stock_minimo,
+        "fecha_vencimiento": fecha_vencimiento.isoformat() if fecha_vencimiento else None,
+        "tipos": tipos
+    }
+
+
+class MotorAlertas:
+    """
+    Conjunto de alertas de stock bajo y vencimiento, en memoria. Tras cada
+    cambio solo se reevalúan los medicamentos tocados; el barrido diario
+    recarga el conjunto para los que vencen por el paso del tiempo.
+    """
+
+    def __init__(self):
+        self._alertas: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+
+    def _aplicar(self, ids: Iterable[int], filas, hoy: date, reemplazar: bool = False) -> List[dict]:
+        # Devuelve solo lo que cambió; una alerta resuelta va con tipos vacío
+        nuevas = {}
+        for fila in filas:
+            alerta = _alerta(fila, hoy)
+            if alerta:
+                nuevas[alerta["medicamento_id"]] = alerta
+
+        cambios = []
+        with self._lock:
+            revisar = set(self._alertas) | set(nuevas) if reemplazar else set(ids)
+            for medicamento_id in sorted(revisar):
+                anterior = self._alertas.get(medicamento_id)
+                actual = nuevas.get(medicamento_id)
+                if anterior == actual:
+                    continue
+                if actual:
+                    self._alertas[medicamento_id] = actual
+                    cambios.append(actual)
+                else:
+                    del self._alertas[medicamento_id]
+                    cambios.append({"medicamento_id": medicamento_id, "nombre": anterior["nombre"], "tipos": []})
+        return cambios
+
+    async def refrescar(self, session: AsyncSession, ids: Iterable[int]) -> List[dict]:
+        ids = set(ids)
+        if not ids:
+            return []
+        filas = (await session.exec(select(*_COLUMNAS).where(Medicamento.id.in_(ids)))).all()
+        return self._aplicar(ids, filas, date.today())
+
+    async def barrer(self, session: AsyncSession) -> List[dict]:
+        # Solo trae candidatos: stock en el mínimo o vencimiento dentro de la ventana
+        hoy = date.today()
+        filas = (await session.exec(
+            select(*_COLUMNAS).where(
+                Medicamento.is_activo == True,
+                or_(
+                    Medicamento.stock <= Medicamento.stock_minimo,
+                    Medicamento.fecha_vencimiento <= hoy + timedelta(days=ALERTA_VENCIMIENTO_DIAS)
+                )
+            )
+        )).all()
+        return self._aplicar((), filas, hoy, reemplazar=True)
+
+    def listar(self, tipo: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            alertas = list(self._alertas.values())
+        if tipo:
+            alertas = [a for a in alertas if tipo in a["tipos"]]
+        return sorted(alertas, key=lambda a: a["medicamento_id"])
+
+
+motor_alertas = MotorAlertas()
+
+# Quienes difunden los cambios de alertas a los clientes (el gestor
+# WebSocket de medicamentos se registra al importarse)
+_notificadores: List[Callable] = []
+
+
+def al_cambiar_alertas(notificador: Callable):
+    # notificador(cambios) es async y recibe solo las alertas que cambiaron
+    _notificadores.append(notificador)
+
+
+async def _notificar(cambios: List[dict]):
+    for notificador in _notificadores:
+        await notificador(cambios)
+
+
+async def actualizar_alertas(session: AsyncSession, ids: Iterable[int]):
+    # Llamar después del commit que modificó los medicamentos
+    ids = list(ids)
+    cambios = await motor_alertas.refrescar(session, ids)
+    if cambios:
+        await _notificar(cambios)
+    # Los demás workers reevalúan los mismos medicamentos sin volver a notificar
+    propagar_invalidacion("alertas", ids=ids)
+
+
+async def _refrescar_remoto(datos: dict):
+    async with AsyncSession(async_engine) as session:
+        await motor_alertas.refrescar(session, datos["ids"])
+
+
+async def barrido_alertas(async_engine):
+    async with AsyncSession(async_engine) as session:
+        cambios = await motor_alertas.barrer(session)
+    if cambios:
+        await _notificar(cambios)
+
+
+al_invalidar("alertas", _refrescar_remoto)
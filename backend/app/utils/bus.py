@@ -0,0 +1,259 @@
+import asyncio
+import inspect
+import json
+import logging
+import os
+import uuid
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy.engine import make_url
+
+from ..database import ASYNC_DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Canal de Postgres por el que viajan todos los eventos de la aplicación
+CANAL_POSTGRES = "sgc_eventos"
+# NOTIFY admite cargas de hasta 8000 bytes
+CARGA_MAX_BYTES = 7900
+REINTENTO_SEGUNDOS = 5
+# Clave del advisory lock que serializa la creación de los contadores
+LOCK_BUS_SECUENCIAS = 7_301_003
+
+
+class BusEventos:
+    """
+    Publicación/suscripción entre workers. Cada worker registra manejadores
+    locales por canal ("ws:citas", "cache", ...) y cualquier
+    worker puede publicar: el mensaje llega a los manejadores de todos.
+    """
+
+    def __init__(self):
+        # Identifica a este proceso en los mensajes que lo necesitan
+        self.id = uuid.uuid4().hex
+        self._manejadores: Dict[str, List[Callable]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tareas: Set[asyncio.Task] = set()
+        # Canales numerados y el último número conocido al iniciar
+        self._secuencias: Dict[str, Optional[int]] = {}
+
+    def suscribir(self, canal: str, manejador: Callable):
+        # manejador(mensaje), síncrono o async
+        self._manejadores.setdefault(canal, []).append(manejador)
+
+    def secuenciar(self, canal: str):
+        """
+        Numera los mensajes de `canal`: cada uno llega con "seq" creciente,
+        el mismo en todos los workers. Un hueco (la escucha se cayó y se
+        perdieron mensajes) lo detecta quien recibe.
+        """
+        self._secuencias.setdefault(canal, None)
+
+    def secuencia_inicial(self, canal: str) -> Optional[int]:
+        # Último número asignado antes de que este worker empezara a escuchar
+        return self._secuencias.get(canal)
+
+    async def _despachar(self, canal: str, mensaje: dict):
+        for manejador in self._manejadores.get(canal, []):
+            try:
+                resultado = manejador(mensaje)
+                if inspect.isawaitable(resultado):
+                    await resultado
+            except Exception:
+                logger.exception("Falló un manejador del canal %s", canal)
+
+    def _en_segundo_plano(self, corrutina):
+        tarea = self._loop.create_task(corrutina)
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+
+    async def iniciar(self):
+        self._loop = asyncio.get_running_loop()
+
+    async def detener(self):
+        pass
+
+    async def publicar(self, canal: str, mensaje: dict):
+        raise NotImplementedError
+
+    def emitir(self, canal: str, mensaje: dict):
+        """
+        Publica sin esperar, también desde rutas síncronas (hilos del
+        threadpool). Antes de iniciar el bus no hay a quién avisar y se omite.
+        """
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            en_el_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            en_el_loop = False
+        if en_el_loop:
+            self._en_segundo_plano(self.publicar(canal, mensaje))
+        else:
+            asyncio.run_coroutine_threadsafe(self.publicar(canal, mensaje), self._loop)
+
+
+class BusMemoria(BusEventos):
+    """Un solo proceso: publicar es llamar a los manejadores locales."""
+
+    def __init__(self):
+        super().__init__()
+        self._contadores: Dict[str, int] = {}
+
+    async def iniciar(self):
+        await super().iniciar()
+        for canal in self._secuencias:
+            self._secuencias[canal] = self._contadores.get(canal, 0)
+
+    async def publicar(self, canal: str, mensaje: dict):
+        if canal in self._secuencias:
+            self._contadores[canal] = self._contadores.get(canal, 0) + 1
+            mensaje = {**mensaje, "seq": self._contadores[canal]}
+        await self._despachar(canal, mensaje)
+
+
+class BusPostgres(BusEventos):
+    """
+    LISTEN/NOTIFY sobre la base que ya usa la aplicación. Cada worker
+    mantiene una conexión dedicada escuchando CANAL_POSTGRES; el propio
+    worker también recibe lo que publica, así el orden de entrega es el
+    mismo en todos. Si la escucha se cae se reintenta y, mientras tanto,
+    lo publicado sigue llegando a los demás workers y este lo entrega
+    localmente (sin "seq"). Solo si falla el propio NOTIFY el mensaje queda
+    en este worker.
+
+    Los canales numerados incrementan su fila en sgc_bus_secuencia y hacen
+    el NOTIFY en la misma transacción. El bloqueo de la fila dura hasta el
+    commit, y el NOTIFY se entrega al confirmar: los números llegan en
+    orden. Si el NOTIFY falla, el incremento se deshace y no queda hueco.
+    """
+
+    def __init__(self, dsn: str):
+        super().__init__()
+        self._dsn = dsn
+        self._pool = None
+        self._escucha = None
+        self._detenido = False
+
+    async def iniciar(self):
+        import asyncpg
+
+        await super().iniciar()
+        self._pool = await asyncpg.create_pool(self._dsn, min_size=1, max_size=2)
+        await self._escuchar()
+        # Después de escuchar: lo numerado desde aquí llega por el listener
+        async with self._pool.acquire() as conexion, conexion.transaction():
+            await conexion.execute(f"SELECT pg_advisory_xact_lock({LOCK_BUS_SECUENCIAS})")
+            await conexion.execute(
+                "CREATE TABLE IF NOT EXISTS sgc_bus_secuencia (canal TEXT PRIMARY KEY, valor BIGINT NOT NULL)"
+            )
+            for canal in self._secuencias:
+                await conexion.execute(
+                    "INSERT INTO sgc_bus_secuencia (canal, valor) VALUES ($1, 0) ON CONFLICT (canal) DO NOTHING",
+                    canal
+                )
+                self._secuencias[canal] = await conexion.fetchval(
+                    "SELECT valor FROM sgc_bus_secuencia WHERE canal = $1", canal
+                )
+
+    async def _escuchar(self):
+        import asyncpg
+
+        while not self._detenido:
+            try:
+                conexion = await asyncpg.connect(self._dsn)
+                await conexion.add_listener(CANAL_POSTGRES, self._al_notificar)
+                conexion.add_termination_listener(self._al_perder_escucha)
+                self._escucha = conexion
+                return
+            except Exception:
+                logger.exception("No se pudo escuchar %s; reintentando", CANAL_POSTGRES)
+                await asyncio.sleep(REINTENTO_SEGUNDOS)
+
+    def _al_notificar(self, conexion, pid, canal, carga):
+        try:
+            datos = json.loads(carga)
+        except ValueError:
+            logger.warning("Mensaje inválido en %s", CANAL_POSTGRES)
+            return
+        mensaje = datos["mensaje"]
+        if "seq" in datos:
+            mensaje = {**mensaje, "seq": datos["seq"]}
+        self._en_segundo_plano(self._despachar(datos["canal"], mensaje))
+
+    def _al_perder_escucha(self, conexion):
+        self._escucha = None
+        if not self._detenido:
+            logger.warning("Se perdió la conexión de escucha de %s", CANAL_POSTGRES)
+            self._en_segundo_plano(self._escuchar())
+
+    async def detener(self):
+        self._detenido = True
+        if self._escucha is not None:
+            await self._escucha.close()
+        if self._pool is not None:
+            await self._pool.close()
+
+    async def publicar(self, canal: str, mensaje: dict):
+        if self._pool is None:
+            # Bus sin iniciar o detenido: solo este worker
+            await self._despachar(canal, mensaje)
+            return
+        try:
+            if canal in self._secuencias:
+                async with self._pool.acquire() as conexion, conexion.transaction():
+                    seq = await conexion.fetchval(
+                        "UPDATE sgc_bus_secuencia SET valor = valor + 1 WHERE canal = $1 RETURNING valor", canal
+                    )
+                    carga = _carga(canal, mensaje, seq)
+                    if len(carga.encode()) > CARGA_MAX_BYTES:
+                        # No entra en un NOTIFY: se avisa a todos que recarguen
+                        # su estado en lugar de dejar un hueco
+                        carga = _carga(canal, {"evento": "resync"}, seq)
+                    await conexion.execute("SELECT pg_notify($1, $2)", CANAL_POSTGRES, carga)
+            else:
+                carga = _carga(canal, mensaje)
+                if len(carga.encode()) > CARGA_MAX_BYTES:
+                    # Sin número con el que avisar del hueco: solo este worker
+                    await self._despachar(canal, mensaje)
+                    return
+                await self._pool.execute("SELECT pg_notify($1, $2)", CANAL_POSTGRES, carga)
+        except Exception:
+            logger.exception("No se pudo publicar en %s", CANAL_POSTGRES)
+            await self._despachar(canal, mensaje)
+            return
+        if self._escucha is None:
+            # Sin escucha este worker no recibe su propio NOTIFY: lo entrega
+            # aquí sin "seq" y, al volver la escucha, el hueco pide recargar
+            await self._despachar(canal, mensaje)
+
+
+def _carga(canal: str, mensaje: dict, seq: Optional[int] = None) -> str:
+    datos = {"canal": canal, "mensaje": mensaje}
+    if seq is not None:
+        datos["seq"] = seq
+    return json.dumps(datos, default=str)
+
+
+def _crear_bus() -> BusEventos:
+    url = make_url(ASYNC_DATABASE_URL)
+    por_defecto = "postgres" if url.get_backend_name() == "postgresql" else "memoria"
+    if os.getenv("PUBSUB_BACKEND", por_defecto).lower() == "postgres":
+        return BusPostgres(url.set(drivername="postgresql").render_as_string(hide_password=False))
+    return BusMemoria()
+
+
+bus = _crear_bus()
+
+
+def propagar_invalidacion(cache: str, **datos):
+    """Avisa a los demás workers que descarten una entrada de `cache`."""
+    bus.emitir("cache", {"cache": cache, "origen": bus.id, **datos})
+
+
+def al_invalidar(cache: str, manejador: Callable):
+    # manejador(datos) corre solo para invalidaciones de otros workers
+    def filtrar(mensaje: dict):
+        if mensaje.get("cache") == cache and mensaje.get("origen") != bus.id:
+            return manejador(mensaje)
+    bus.suscribir("cache", filtrar)
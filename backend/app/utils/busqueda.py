@@ -0,0 +1,25 @@
+import unicodedata
+
+from sqlalchemy import func, or_
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes, igual que f_unaccent(lower(...)) en la base."""
+    descompuesto = unicodedata.normalize("NFKD", texto.strip().lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def _escapar_like(texto: str) -> str:
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def coincide_texto(columnas, texto: str, dialecto: str):
+    """
+    Condición "contiene `texto`" sobre cualquiera de las columnas, sin
+    distinguir mayúsculas ni tildes. En Postgres la expresión es la misma de
+    los índices GIN trigram (ver esquema.py), así el LIKE '%...%' los usa.
+    """
+    patron = f"%{_escapar_like(normalizar(texto))}%"
+    if dialecto == "postgresql":
+        return or_(*(func.f_unaccent(func.lower(c)).like(patron, escape="\\") for c in columnas))
+    return or_(*(func.lower(c).like(patron, escape="\\") for c in columnas))
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import Session, select
+
+from ..models.usuario.usuario import User
+from .bus import al_invalidar, propagar_invalidacion
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", 5000))
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+
+
+class CachePrincipal:
+    """
+    Cache acotado (LRU) de token -> usuario autenticado.
+
+    Cada entrada vive como máximo `ttl_segundos` y nunca más allá del `exp`
+    del token. Se guarda una copia de las columnas del usuario, no la
+    instancia ORM, para que cada request trabaje con su propio objeto.
+
+    Cada invalidación avanza una época global y anota en qué época se
+    invalidó el usuario. Quien leyó al usuario antes (época() tomada antes
+    de la consulta) no puede guardarlo después: sería el usuario de antes
+    del cambio de contraseña o de la baja.
+    """
+
+    def __init__(self, max_entradas: int, ttl_segundos: int):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._entradas: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._tokens_por_usuario: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+        self._epoca = 0
+        self._invalidado_en: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidaciones = 0
+
+    def obtener(self, token: str) -> Optional[dict]:
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(token)
+            if entrada is None:
+                self.misses += 1
+                return None
+            expira, datos = entrada
+            if expira <= ahora:
+                self._quitar(token)
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(token)
+            self.hits += 1
+            return datos
+
+    def epoca(self) -> int:
+        with self._lock:
+            return self._epoca
+
+    def guardar(self, token: str, exp: Optional[float], datos: dict, epoca: int):
+        # `epoca`: la de antes de leer al usuario de la base
+        expira = time.time() + self.ttl_segundos
+        if exp is not None:
+            expira = min(expira, float(exp))
+        if expira <= time.time() or self.max_entradas <= 0:
+            return
+        with self._lock:
+            if self._invalidado_en.get(datos["id"], 0) > epoca:
+                return
+            self._quitar(token)
+            self._entradas[token] = (expira, datos)
+            self._tokens_por_usuario.setdefault(datos["id"], set()).add(token)
+            while len(self._entradas) > self.max_entradas:
+                token_antiguo = next(iter(self._entradas))
+                self._quitar(token_antiguo)
+
+    def invalidar_usuario(self, user_id: int, propagar: bool = True):
+        with self._lock:
+            self._epoca += 1
+            self._invalidado_en[user_id] = self._epoca
+            tokens = self._tokens_por_usuario.pop(user_id, set())
+            for token in tokens:
+                self._entradas.pop(token, None)
+            self.invalidaciones += len(tokens)
+        if propagar:
+            propagar_invalidacion("principal", user_id=user_id)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._tokens_por_usuario.clear()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "ttl_segundos": self.ttl_segundos,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidaciones": self.invalidaciones,
+                "hit_ratio": round(self.hits / consultas, 4) if consultas else 0.0,
+            }
+
+    def _quitar(self, token: str):
+        entrada = self._entradas.pop(token, None)
+        if entrada is None:
+            return
+        user_id = entrada[1]["id"]
+        tokens = self._tokens_por_usuario.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_por_usuario[user_id]
+
+
+cache_principal = CachePrincipal(PRINCIPAL_CACHE_MAX, PRINCIPAL_CACHE_TTL_SECONDS)
+al_invalidar("principal", lambda datos: cache_principal.invalidar_usuario(datos["user_id"], propagar=False))
+
+
+def resolver_usuario(session: Session, token: str, username: str, exp: Optional[float]) -> Optional[User]:
+    """
+    Devuelve el usuario del token. En un hit no se consulta la base: se
+    reconstruye la instancia y se adjunta a la sesión como ya persistida.
+    """
+    datos = cache_principal.obtener(token)
+    if datos is not None:
+        user = User(**datos)
+        make_transient_to_detached(user)
+        return session.merge(user, load=False)
+
+    epoca = cache_principal.epoca()
+    user = session.exec(select(User).where(User.username == username)).first()
+    if user:
+        datos = {columna.name: getattr(user, columna.name) for columna in User.__table__.columns}
+        cache_principal.guardar(token, exp, datos, epoca)
+    return user
@@ -0,0 +1,143 @@
+from datetime import date
+from typing import Dict, List, Optional, Set
+
+from fastapi import HTTPException
+from sqlalchemy import exists
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..models.medicamento.inventario import TipoMovimientoEnum
+from ..models.medicamento.receta import Receta, RecetaMedicamento, DispensacionMedicamento
+from ..models.usuario.usuario import User
+from .inventario import registrar_movimientos
+from .posologia import interpretar_posologia
+from .stock import descontar_stock
+
+
+def unidades_a_dispensar(item: RecetaMedicamento) -> int:
+    if item.total_unidades is not None:
+        return item.total_unidades
+    # Renglones emitidos antes de guardar la posología normalizada
+    return interpretar_posologia(item.dosis, item.frecuencia, item.duracion).total_unidades
+
+
+async def _renglones_pendientes(session: AsyncSession, receta_ids) -> List[RecetaMedicamento]:
+    ya_entregado = exists().where(
+        DispensacionMedicamento.receta_id == RecetaMedicamento.receta_id,
+        DispensacionMedicamento.medicamento_id == RecetaMedicamento.medicamento_id
+    )
+    return (await session.exec(
+        select(RecetaMedicamento).where(RecetaMedicamento.receta_id.in_(receta_ids), ~ya_entregado)
+    )).all()
+
+
+async def dispensar(session: AsyncSession, seleccion: Dict[int, Optional[Set[int]]], user: User) -> dict:
+    """
+    Entrega varias recetas en una sola transacción. `seleccion` indica por
+    receta qué medicamentos entregar (None = todo lo pendiente).
+
+    Las recetas se bloquean en orden de id para que dos entregas de la misma
+    receta no se crucen; el stock se descuenta con un único UPDATE sumando
+    las cantidades de todas las recetas por medicamento. Si algo falla (un
+    medicamento elegido que no está en la receta, stock insuficiente) no se
+    entrega nada.
+
+    Devuelve {"estados": {receta_id: estado}, "entregadas": [...],
+    "medicamento_ids": [...]}; las recetas sin nada nuevo que entregar
+    quedan fuera de "entregadas".
+    """
+    receta_ids = sorted(seleccion)
+    recetas = {
+        receta.id: receta
+        for receta in (await session.exec(
+            select(Receta).where(Receta.id.in_(receta_ids)).order_by(Receta.id).with_for_update()
+        )).all()
+    }
+    no_encontradas = [i for i in receta_ids if i not in recetas]
+    if no_encontradas:
+        await session.rollback()
+        raise HTTPException(status_code=404, detail={"mensaje": "Receta no encontrada", "receta_ids": no_encontradas})
+    canceladas = [i for i in receta_ids if recetas[i].estado == "cancelada"]
+    if canceladas:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail={"mensaje": "No se puede autorizar", "receta_ids": canceladas})
+
+    elegidas = [i for i in receta_ids if seleccion[i] is not None]
+    if elegidas:
+        recetados: Dict[int, Set[int]] = {i: set() for i in elegidas}
+        for receta_id, medicamento_id in (await session.exec(
+            select(RecetaMedicamento.receta_id, RecetaMedicamento.medicamento_id)
+            .where(RecetaMedicamento.receta_id.in_(elegidas))
+        )).all():
+            recetados[receta_id].add(medicamento_id)
+        ajenos = {i: sorted(seleccion[i] - recetados[i]) for i in elegidas if seleccion[i] - recetados[i]}
+        if ajenos:
+            await session.rollback()
+            raise HTTPException(status_code=400, detail={
+                "mensaje": "Medicamentos que no están en la receta",
+                "medicamento_ids": ajenos
+            })
+
+    pendientes_por_receta: Dict[int, List[RecetaMedicamento]] = {i: [] for i in receta_ids}
+    for item in await _renglones_pendientes(session, receta_ids):
+        pendientes_por_receta[item.receta_id].append(item)
+
+    a_entregar: Dict[int, List[RecetaMedicamento]] = {}
+    for receta_id, pendientes in pendientes_por_receta.items():
+        elegidos = seleccion[receta_id]
+        renglones = [item for item in pendientes if elegidos is None or item.medicamento_id in elegidos]
+        if renglones:
+            a_entregar[receta_id] = renglones
+
+    # Cantidades por renglón y total por medicamento entre todas las recetas
+    cantidades_receta = {
+        receta_id: {item.medicamento_id: unidades_a_dispensar(item) for item in renglones}
+        for receta_id, renglones in a_entregar.items()
+    }
+    totales: Dict[int, int] = {}
+    for cantidades in cantidades_receta.values():
+        for medicamento_id, cantidad in cantidades.items():
+            totales[medicamento_id] = totales.get(medicamento_id, 0) + cantidad
+
+    faltantes = await descontar_stock(session, totales)
+    if faltantes:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail={
+            "mensaje": "Stock insuficiente para completar la entrega",
+            "faltantes": faltantes
+        })
+
+    hoy = date.today()
+    for receta_id, cantidades in cantidades_receta.items():
+        session.add_all([
+            DispensacionMedicamento(
+                receta_id=receta_id,
+                medicamento_id=medicamento_id,
+                cantidad=cantidad,
+                farmaceutico_id=user.id
+            )
+            for medicamento_id, cantidad in cantidades.items()
+        ])
+        registrar_movimientos(
+            session,
+            {medicamento_id: -cantidad for medicamento_id, cantidad in cantidades.items()},
+            TipoMovimientoEnum.dispensacion,
+            usuario_id=user.id,
+            receta_id=receta_id
+        )
+        receta = recetas[receta_id]
+        if len(cantidades) == len(pendientes_por_receta[receta_id]):
+            receta.estado = "entregada"
+            receta.fecha_entrega = hoy
+        else:
+            receta.estado = "parcial"
+        session.add(receta)
+
+    estados = {receta_id: recetas[receta_id].estado for receta_id in receta_ids}
+    await session.commit()
+    return {
+        "estados": estados,
+        "entregadas": sorted(a_entregar),
+        "medicamento_ids": sorted(totales)
+    }
+
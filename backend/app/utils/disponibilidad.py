@@ -0,0 +1,56 @@
+from datetime import time
+from typing import Iterable, List, Tuple
+
+# Índice = date.weekday(); coincide con los valores guardados en HorarioLaboral.dia
+DIAS_SEMANA = ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"]
+
+Intervalo = Tuple[int, int]
+
+
+def a_minutos(valor) -> int:
+    if isinstance(valor, str):
+        valor = time.fromisoformat(valor)
+    return valor.hour * 60 + valor.minute
+
+
+def a_hora(minutos: int) -> time:
+    return time(minutos // 60, minutos % 60)
+
+
+def unir_intervalos(intervalos: Iterable[Intervalo]) -> List[Intervalo]:
+    unidos = []
+    for inicio, fin in sorted(intervalos):
+        if unidos and inicio <= unidos[-1][1]:
+            unidos[-1] = (unidos[-1][0], max(unidos[-1][1], fin))
+        else:
+            unidos.append((inicio, fin))
+    return unidos
+
+
+def calcular_slots(
+    ventanas: Iterable[Intervalo],
+    ocupados: Iterable[Intervalo],
+    duracion: int,
+    minimo_inicio: int = 0
+) -> List[Intervalo]:
+    """
+    Recorre en una sola pasada las ventanas laborales y los intervalos ya
+    reservados (ambos en minutos del día) y devuelve los huecos libres de
+    `duracion` minutos. Cuando un hueco choca con una cita, el siguiente
+    candidato empieza donde termina esa cita.
+    """
+    ocupados = unir_intervalos(ocupados)
+    slots = []
+    i = 0
+    for inicio_ventana, fin_ventana in unir_intervalos(ventanas):
+        t = max(inicio_ventana, minimo_inicio)
+        while t + duracion <= fin_ventana:
+            # Citas que terminan antes del candidato ya no pueden chocar
+            while i < len(ocupados) and ocupados[i][1] <= t:
+                i += 1
+            if i < len(ocupados) and ocupados[i][0] < t + duracion:
+                t = ocupados[i][1]
+                continue
+            slots.append((t, t + duracion))
+            t += duracion
+    return slots
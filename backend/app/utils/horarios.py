@@ -0,0 +1,119 @@
+import threading
+from typing import Dict, Iterable, List
+
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..models.usuario.horario_laboral import HorarioLaboral
+from .bus import al_invalidar, propagar_invalidacion
+from .disponibilidad import DIAS_SEMANA, Intervalo, a_minutos, unir_intervalos
+
+_INDICE_DIA = {nombre: indice for indice, nombre in enumerate(DIAS_SEMANA)}
+
+
+class HorarioCompilado:
+    """
+    Horario semanal de un médico ya procesado: por cada día (0 = lunes) los
+    intervalos ordenados y un bitmap de minutos del día. Verificar si una
+    cita cabe en el horario es una sola operación AND sobre el bitmap.
+    """
+
+    def __init__(self, ventanas_por_dia: Dict[int, List[Intervalo]]):
+        self._ventanas = {dia: unir_intervalos(v) for dia, v in ventanas_por_dia.items()}
+        self._bitmaps = {}
+        for dia, ventanas in self._ventanas.items():
+            bitmap = 0
+            for inicio, fin in ventanas:
+                bitmap |= ((1 << (fin - inicio)) - 1) << inicio
+            self._bitmaps[dia] = bitmap
+
+    @classmethod
+    def desde_filas(cls, filas: Iterable) -> "HorarioCompilado":
+        ventanas_por_dia: Dict[int, List[Intervalo]] = {}
+        for dia, hora_inicio, hora_fin in filas:
+            indice = _INDICE_DIA.get(dia.strip().lower())
+            if indice is None:
+                continue
+            inicio, fin = a_minutos(hora_inicio), a_minutos(hora_fin)
+            if fin > inicio:
+                ventanas_por_dia.setdefault(indice, []).append((inicio, fin))
+        return cls(ventanas_por_dia)
+
+    def trabaja(self, dia_semana: int) -> bool:
+        return dia_semana in self._ventanas
+
+    def ventanas(self, dia_semana: int) -> List[Intervalo]:
+        return self._ventanas.get(dia_semana, [])
+
+    def contiene(self, dia_semana: int, inicio: int, fin: int) -> bool:
+        if fin <= inicio:
+            return False
+        mascara = ((1 << (fin - inicio)) - 1) << inicio
+        return self._bitmaps.get(dia_semana, 0) & mascara == mascara
+
+
+def _consulta(medico_ids):
+    return select(
+        HorarioLaboral.user_id, HorarioLaboral.dia, HorarioLaboral.hora_inicio, HorarioLaboral.hora_fin
+    ).where(HorarioLaboral.user_id.in_(medico_ids))
+
+
+class CacheHorarios:
+    """
+    Horarios compilados por médico; se invalida al modificar HorarioLaboral.
+
+    Como en CachePrincipal, cada invalidación avanza una época y anota en
+    cuál se invalidó el médico. Un horario leído antes (época tomada antes
+    de la consulta) no se guarda: sería el de antes de la edición.
+    """
+
+    def __init__(self):
+        self._horarios: Dict[int, HorarioCompilado] = {}
+        self._lock = threading.Lock()
+        self._epoca = 0
+        self._invalidado_en: Dict[int, int] = {}
+
+    def _compilar(self, medico_ids, filas, epoca: int) -> Dict[int, HorarioCompilado]:
+        por_medico = {medico_id: [] for medico_id in medico_ids}
+        for user_id, dia, hora_inicio, hora_fin in filas:
+            por_medico[user_id].append((dia, hora_inicio, hora_fin))
+        compilados = {medico_id: HorarioCompilado.desde_filas(f) for medico_id, f in por_medico.items()}
+        with self._lock:
+            self._horarios.update({
+                medico_id: horario for medico_id, horario in compilados.items()
+                if self._invalidado_en.get(medico_id, 0) <= epoca
+            })
+        return compilados
+
+    def _separar(self, medico_ids):
+        # La época se lee junto con el cache, antes de consultar la base
+        with self._lock:
+            encontrados = {i: self._horarios[i] for i in medico_ids if i in self._horarios}
+            epoca = self._epoca
+        faltantes = [i for i in medico_ids if i not in encontrados]
+        return encontrados, faltantes, epoca
+
+    def obtener_varios(self, session: Session, medico_ids) -> Dict[int, HorarioCompilado]:
+        encontrados, faltantes, epoca = self._separar(medico_ids)
+        if faltantes:
+            encontrados.update(self._compilar(faltantes, session.exec(_consulta(faltantes)).all(), epoca))
+        return encontrados
+
+    async def obtener_async(self, session: AsyncSession, medico_id: int) -> HorarioCompilado:
+        encontrados, faltantes, epoca = self._separar([medico_id])
+        if faltantes:
+            filas = (await session.exec(_consulta(faltantes))).all()
+            encontrados.update(self._compilar(faltantes, filas, epoca))
+        return encontrados[medico_id]
+
+    def invalidar(self, medico_id: int, propagar: bool = True):
+        with self._lock:
+            self._epoca += 1
+            self._invalidado_en[medico_id] = self._epoca
+            self._horarios.pop(medico_id, None)
+        if propagar:
+            propagar_invalidacion("horarios", medico_id=medico_id)
+
+
+cache_horarios = CacheHorarios()
+al_invalidar("horarios", lambda datos: cache_horarios.invalidar(datos["medico_id"], propagar=False))
@@ -0,0 +1,146 @@
+import threading
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from .bus import al_invalidar, propagar_invalidacion
+from ..models.cita.cita import Cita
+from ..models.medicamento.interaccion import InteraccionMedicamento
+from ..models.medicamento.receta import Receta, RecetaMedicamento
+
+# Recetas más antiguas no se consideran tratamiento activo aunque la
+# duración no se haya podido interpretar
+VENTANA_TRATAMIENTO_DIAS = 90
+
+
+def _ids(bits: int):
+    while bits:
+        menor = bits & -bits
+        yield menor.bit_length() - 1
+        bits ^= menor
+
+
+def _mascara(ids: Iterable[int]) -> int:
+    mascara = 0
+    for medicamento_id in ids:
+        mascara |= 1 << medicamento_id
+    return mascara
+
+
+class IndiceInteracciones:
+    """
+    Tabla de interacciones compilada en memoria: por cada medicamento, un
+    bitset (entero) con los ids con los que interactúa. Revisar una receta
+    es un AND por medicamento contra la máscara del resto.
+
+    Cada invalidación avanza una generación. Una carga que empezó antes
+    (leyó la tabla sin la interacción recién creada) no se instala; si no,
+    la tabla vieja quedaría en uso hasta la siguiente invalidación.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bits: Optional[Dict[int, int]] = None
+        self._detalle: Dict[Tuple[int, int], Tuple[str, Optional[str]]] = {}
+        self._generacion = 0
+
+    def cargar(self, session: Session) -> int:
+        with self._lock:
+            generacion = self._generacion
+        bits: Dict[int, int] = {}
+        detalle = {}
+        for a, b, severidad, descripcion in session.exec(select(
+            InteraccionMedicamento.medicamento_a_id, InteraccionMedicamento.medicamento_b_id,
+            InteraccionMedicamento.severidad, InteraccionMedicamento.descripcion
+        )).all():
+            bits[a] = bits.get(a, 0) | (1 << b)
+            bits[b] = bits.get(b, 0) | (1 << a)
+            detalle[(a, b)] = (severidad, descripcion)
+        with self._lock:
+            if self._generacion == generacion:
+                self._bits, self._detalle = bits, detalle
+        return len(detalle)
+
+    def invalidar(self, propagar: bool = True):
+        with self._lock:
+            self._generacion += 1
+            self._bits = None
+        if propagar:
+            propagar_invalidacion("interacciones")
+
+    def _indice(self, session: Session):
+        # Se vuelve a cargar mientras una invalidación descarte la carga
+        while True:
+            with self._lock:
+                bits, detalle = self._bits, self._detalle
+            if bits is not None:
+                return bits, detalle
+            self.cargar(session)
+
+    def verificar(self, session: Session, nuevos: List[int], activos: Iterable[int]) -> List[dict]:
+        """Interacciones de `nuevos` entre sí y con los medicamentos `activos`."""
+        bits, detalle = self._indice(session)
+        mascara_nuevos = _mascara(nuevos)
+        # Un activo que también se receta de nuevo ya sale como duplicado
+        mascara_activos = _mascara(activos) & ~mascara_nuevos
+        advertencias = []
+        for medicamento_id in nuevos:
+            # Entre nuevos, cada par se informa una sola vez (desde el menor)
+            choques = bits.get(medicamento_id, 0) & (mascara_activos | (mascara_nuevos & ~((2 << medicamento_id) - 1)))
+            for otro_id in _ids(choques):
+                severidad, descripcion = detalle[(min(medicamento_id, otro_id), max(medicamento_id, otro_id))]
+                advertencias.append({
+                    "tipo": "interaccion",
+                    "medicamento_ids": [medicamento_id, otro_id],
+                    "severidad": severidad,
+                    "mensaje": descripcion or "Interacción conocida entre medicamentos",
+                    "en_tratamiento_activo": bool(mascara_activos >> otro_id & 1)
+                })
+        return advertencias
+
+
+indice_interacciones = IndiceInteracciones()
+al_invalidar("interacciones", lambda datos: indice_interacciones.invalidar(propagar=False))
+
+
+def medicamentos_activos(session: Session, paciente_id: int, excluir_receta_id: Optional[int] = None) -> List[int]:
+    """
+    Medicamentos de recetas del paciente cuyo tratamiento sigue en curso:
+    emitidas dentro de la ventana, no canceladas y con
+    fecha_emision + dias_tratamiento >= hoy.
+    """
+    hoy = date.today()
+    consulta = (
+        select(RecetaMedicamento.medicamento_id, RecetaMedicamento.dias_tratamiento, Receta.fecha_emision)
+        .join(Receta, Receta.id == RecetaMedicamento.receta_id)
+        .join(Cita, Cita.id == Receta.cita_id)
+        .where(
+            Cita.paciente_id == paciente_id,
+            Receta.estado != "cancelada",
+            Receta.fecha_emision >= hoy - timedelta(days=VENTANA_TRATAMIENTO_DIAS)
+        )
+    )
+    if excluir_receta_id is not None:
+        consulta = consulta.where(Receta.id != excluir_receta_id)
+    return sorted({
+        medicamento_id
+        for medicamento_id, dias, fecha_emision in session.exec(consulta).all()
+        if dias is None or fecha_emision + timedelta(days=dias) >= hoy
+    })
+
+
+def revisar_receta(session: Session, paciente_id: int, nuevos: List[int], excluir_receta_id: Optional[int] = None) -> List[dict]:
+    activos = medicamentos_activos(session, paciente_id, excluir_receta_id)
+    en_curso = set(activos)
+    advertencias = [
+        {
+            "tipo": "duplicado",
+            "medicamento_ids": [medicamento_id],
+            "severidad": None,
+            "mensaje": "El paciente ya tiene este medicamento en un tratamiento activo",
+            "en_tratamiento_activo": True
+        }
+        for medicamento_id in nuevos if medicamento_id in en_curso
+    ]
+    return advertencias + indice_interacciones.verificar(session, nuevos, activos)
@@ -0,0 +1,189 @@
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import func, text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+
+from ..models.medicamento.medicamento import Medicamento
+from ..models.medicamento.inventario import MovimientoInventario, SnapshotStock, TipoMovimientoEnum
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock que deja generar snapshots a un solo worker por vez
+LOCK_SNAPSHOTS = 7_301_002
+# Cuánto espera un snapshot a que terminen las transacciones con movimientos
+# en curso; si no alcanza, se reintenta en la siguiente ejecución
+SNAPSHOT_ESPERA_MS = int(os.getenv("SNAPSHOT_ESPERA_MS", 10000))
+
+# Resultado de la última conciliación ejecutada por la tarea periódica
+ultima_conciliacion: dict = {"fecha": None, "diferencias": []}
+
+
+def registrar_movimientos(
+    session,
+    cantidades: Dict[int, int],
+    tipo: TipoMovimientoEnum,
+    usuario_id: Optional[int] = None,
+    receta_id: Optional[int] = None,
+    nota: Optional[str] = None
+):
+    """
+    Agrega al ledger un movimiento por medicamento ({id: delta}) en la
+    transacción del llamador, así el cambio de stock y su registro se
+    confirman juntos. Sirve para Session y AsyncSession.
+    """
+    session.add_all([
+        MovimientoInventario(
+            medicamento_id=medicamento_id,
+            tipo=tipo,
+            cantidad=cantidad,
+            usuario_id=usuario_id,
+            receta_id=receta_id,
+            nota=nota
+        )
+        for medicamento_id, cantidad in cantidades.items()
+        if cantidad
+    ])
+
+
+def _ultimos_snapshots(hasta: Optional[datetime] = None):
+    consulta = select(func.max(SnapshotStock.id)).group_by(SnapshotStock.medicamento_id)
+    if hasta is not None:
+        consulta = consulta.where(SnapshotStock.fecha <= hasta)
+    return select(SnapshotStock).where(SnapshotStock.id.in_(consulta)).subquery()
+
+
+def stock_segun_ledger(session: Session, hasta: Optional[datetime] = None, medicamento_id: Optional[int] = None) -> Dict[int, int]:
+    """
+    Stock por medicamento a la fecha `hasta` (o actual): último snapshot
+    anterior más la suma de los movimientos posteriores a él. Son dos
+    consultas agrupadas sin importar cuántos medicamentos haya.
+    """
+    snapshots = _ultimos_snapshots(hasta)
+
+    consulta_base = select(snapshots.c.medicamento_id, snapshots.c.stock)
+    if medicamento_id is not None:
+        consulta_base = consulta_base.where(snapshots.c.medicamento_id == medicamento_id)
+    resultado = {mid: stock for mid, stock in session.exec(consulta_base).all()}
+
+    consulta_deltas = (
+        select(MovimientoInventario.medicamento_id, func.sum(MovimientoInventario.cantidad))
+        .outerjoin(snapshots, snapshots.c.medicamento_id == MovimientoInventario.medicamento_id)
+        .where(MovimientoInventario.id > func.coalesce(snapshots.c.ultimo_movimiento_id, 0))
+        .group_by(MovimientoInventario.medicamento_id)
+    )
+    if hasta is not None:
+        consulta_deltas = consulta_deltas.where(MovimientoInventario.fecha <= hasta)
+    if medicamento_id is not None:
+        consulta_deltas = consulta_deltas.where(MovimientoInventario.medicamento_id == medicamento_id)
+    for mid, delta in session.exec(consulta_deltas).all():
+        resultado[mid] = resultado.get(mid, 0) + int(delta or 0)
+
+    return resultado
+
+
+def generar_snapshots(session: Session) -> int:
+    """
+    Inserta un snapshot para cada medicamento con movimientos nuevos desde
+    el anterior. Un medicamento sin snapshot toma su stock actual como saldo
+    de apertura. En ambos casos el stock y el último movimiento cubierto se
+    leen en la misma sentencia para que sean coherentes entre sí.
+
+    La tarea corre en cada worker: en Postgres solo genera el que obtiene el
+    advisory lock (se libera al confirmar) y los demás devuelven 0. Quien
+    llegue después ve los snapshots ya confirmados y no repite ninguno.
+
+    Los ids del ledger se asignan al insertar, no al confirmar: un movimiento
+    con id menor podría confirmarse después del snapshot y quedar fuera de
+    todos los siguientes. Por eso en Postgres se toma la tabla en modo SHARE:
+    espera a las transacciones que ya insertaron movimientos y las nuevas
+    esperan al commit del snapshot, así todo id <= ultimo_movimiento_id ya
+    está confirmado. La espera dura solo lo que tardan las consultas.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        if not session.execute(text(f"SELECT pg_try_advisory_xact_lock({LOCK_SNAPSHOTS})")).scalar():
+            session.rollback()
+            return 0
+        try:
+            session.execute(text(f"SET LOCAL lock_timeout = {SNAPSHOT_ESPERA_MS}"))
+            session.execute(text("LOCK TABLE movimientoinventario IN SHARE MODE"))
+        except OperationalError:
+            session.rollback()
+            logger.warning("Snapshot de inventario pospuesto: hay movimientos sin confirmar")
+            return 0
+
+    snapshots = _ultimos_snapshots()
+    previos = {
+        mid: (stock, ultimo_id)
+        for mid, stock, ultimo_id in session.exec(
+            select(snapshots.c.medicamento_id, snapshots.c.stock, snapshots.c.ultimo_movimiento_id)
+        ).all()
+    }
+
+    ahora = datetime.now(timezone.utc)
+    nuevos = []
+
+    ultimo_movimiento = (
+        select(func.max(MovimientoInventario.id))
+        .where(MovimientoInventario.medicamento_id == Medicamento.id)
+        .scalar_subquery()
+    )
+    for mid, stock, ultimo_id in session.exec(select(Medicamento.id, Medicamento.stock, ultimo_movimiento)).all():
+        if mid not in previos:
+            nuevos.append(SnapshotStock(medicamento_id=mid, fecha=ahora, stock=stock, ultimo_movimiento_id=ultimo_id or 0))
+
+    deltas = session.exec(
+        select(
+            MovimientoInventario.medicamento_id,
+            func.sum(MovimientoInventario.cantidad),
+            func.max(MovimientoInventario.id)
+        )
+        .join(snapshots, snapshots.c.medicamento_id == MovimientoInventario.medicamento_id)
+        .where(MovimientoInventario.id > snapshots.c.ultimo_movimiento_id)
+        .group_by(MovimientoInventario.medicamento_id)
+    ).all()
+    for mid, delta, ultimo_id in deltas:
+        stock_previo, _ = previos[mid]
+        nuevos.append(SnapshotStock(medicamento_id=mid, fecha=ahora, stock=stock_previo + int(delta), ultimo_movimiento_id=ultimo_id))
+
+    session.add_all(nuevos)
+    session.commit()
+    return len(nuevos)
+
+
+def conciliar(session: Session) -> List[dict]:
+    """Compara el stock cacheado en Medicamento con el que resulta del ledger."""
+    if session.get_bind().dialect.name == "postgresql":
+        # Ledger y stock se leen de la misma foto de la base
+        session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    calculados = stock_segun_ledger(session)
+    diferencias = []
+    for mid, nombre, stock in session.exec(select(Medicamento.id, Medicamento.nombre, Medicamento.stock)).all():
+        segun_ledger = calculados.get(mid, 0)
+        if segun_ledger != stock:
+            diferencias.append({
+                "medicamento_id": mid,
+                "nombre": nombre,
+                "stock": stock,
+                "stock_ledger": segun_ledger,
+                "diferencia": stock - segun_ledger
+            })
+    return diferencias
+
+
+def tarea_inventario(engine):
+    # Tarea periódica: snapshot y conciliación
+    with Session(engine) as session:
+        creados = generar_snapshots(session)
+        diferencias = conciliar(session)
+    ultima_conciliacion["fecha"] = datetime.now(timezone.utc)
+    ultima_conciliacion["diferencias"] = diferencias
+    if diferencias:
+        logger.warning("Conciliación de inventario: %d medicamentos con diferencias", len(diferencias))
+    logger.info("Snapshots de inventario generados: %d", creados)
@@ -0,0 +1,59 @@
+import base64
+import json
+import os
+from typing import Callable, Optional, Sequence
+
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PAGINA_DEFAULT = int(os.getenv("PAGINA_DEFAULT", 100))
+PAGINA_MAX = int(os.getenv("PAGINA_MAX", 500))
+
+# El cursor de la página siguiente viaja en esta cabecera para no cambiar
+# la forma (lista) de las respuestas existentes.
+CABECERA_CURSOR = "X-Next-Cursor"
+
+
+def codificar_cursor(valores: Sequence) -> str:
+    texto = json.dumps([v.isoformat() if hasattr(v, "isoformat") else v for v in valores])
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, tipos: Sequence[Callable]) -> list:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if len(valores) != len(tipos):
+            raise ValueError
+        return [tipo(valor) for tipo, valor in zip(tipos, valores)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido.")
+
+
+def limite_pagina(limite: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """
+    Sin `limite` ni `cursor` los listados que ya existían devuelven todo,
+    como antes de paginarlos: las pantallas actuales no siguen el cursor.
+    Quien pide la siguiente página sin `limite` recibe PAGINA_DEFAULT filas.
+    """
+    if limite is None and cursor:
+        return PAGINA_DEFAULT
+    return limite
+
+
+def paginar(consulta, limite: Optional[int]):
+    # Una fila de más para saber si hay otra página
+    return consulta if limite is None else consulta.limit(limite + 1)
+
+
+def recortar_pagina(filas: list, limite: Optional[int], clave: Callable):
+    """
+    Las consultas piden `limite + 1` filas: si llegó la fila extra hay otra
+    página y su cursor se arma con la última fila devuelta.
+    """
+    if limite is None or len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    return filas, codificar_cursor(clave(filas[-1]))
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class MedidorEsperaPool:
+    """Acumula cuánto esperan los checkouts por una conexión libre."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.esperas = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def registrar(self, segundos: float, timeout: bool = False):
+        with self._lock:
+            self.esperas += 1
+            self.espera_total += segundos
+            self.espera_max = max(self.espera_max, segundos)
+            if timeout:
+                self.timeouts += 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.esperas,
+                "timeouts": self.timeouts,
+                "espera_promedio_ms": round(self.espera_total * 1000 / self.esperas, 3) if self.esperas else 0.0,
+                "espera_max_ms": round(self.espera_max * 1000, 3),
+            }
+
+
+class _MedicionEsperaMixin:
+    # _do_get es el punto donde QueuePool bloquea hasta tener conexión
+    # (o crea una de overflow), así que medirlo da el tiempo de espera real.
+    def _do_get(self):
+        medidor = self.__dict__.setdefault("medidor", MedidorEsperaPool())
+        inicio = time.perf_counter()
+        try:
+            conexion = super()._do_get()
+        except Exception:
+            medidor.registrar(time.perf_counter() - inicio, timeout=True)
+            raise
+        medidor.registrar(time.perf_counter() - inicio)
+        return conexion
+
+
+class QueuePoolMedido(_MedicionEsperaMixin, QueuePool):
+    pass
+
+
+class AsyncQueuePoolMedido(_MedicionEsperaMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def estadisticas_pool(pool) -> dict:
+    datos = {"tipo": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        datos.update({
+            "tamano": pool.size(),
+            "en_uso": pool.checkedout(),
+            "libres": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+    medidor = getattr(pool, "medidor", None)
+    datos.update(medidor.estadisticas() if medidor else MedidorEsperaPool().estadisticas())
+    return datos
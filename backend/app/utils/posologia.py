@@ -0,0 +1,117 @@
+import math
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Valores usados cuando el texto no se puede interpretar
+DOSIS_DEFAULT = 1.0
+TOMAS_DEFAULT = 3.0
+DIAS_DEFAULT = 3
+
+_NUMEROS_TEXTO = {
+    "media": 0.5, "medio": 0.5, "un": 1, "una": 1, "uno": 1, "dos": 2, "tres": 3,
+    "cuatro": 4, "cinco": 5, "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10,
+    "doce": 12, "quince": 15, "veinte": 20, "treinta": 30,
+}
+# "1.5", "1,5" o ".5"; el lookbehind evita tomar solo la parte decimal
+_DECIMAL = r"(?:\d+(?:[.,]\d+)?|[.,]\d+)"
+_NUMERO = (
+    r"((?<![\d.,])" + _DECIMAL + r"(?:\s*/\s*" + _DECIMAL + r")?|\b(?:"
+    + "|".join(sorted(_NUMEROS_TEXTO, key=len, reverse=True))
+    + r")\b)"
+)
+
+_RE_NUMERO = re.compile(_NUMERO)
+_RE_CADA_HORAS = re.compile(r"cada\s+" + _NUMERO + r"?\s*(horas?|hrs?|h)\b")
+_RE_CADA_DIAS = re.compile(r"cada\s+" + _NUMERO + r"?\s*(d[ií]as?)\b")
+_RE_VECES = re.compile(_NUMERO + r"\s*(?:veces|vez)\b")
+_RE_DIARIO = re.compile(r"\b(?:diari[oa]|al d[ií]a|por d[ií]a|cada d[ií]a)\b")
+_RE_DURACION = re.compile(_NUMERO + r"\s*(d[ií]as?|semanas?|mes(?:es)?)\b")
+
+_DIAS_POR_UNIDAD = {"d": 1, "s": 7, "m": 30}
+
+
+class Posologia(NamedTuple):
+    unidades_por_toma: float
+    tomas_por_dia: float
+    dias: int
+    total_unidades: int
+    # False si alguna parte cayó en el valor por defecto
+    interpretada: bool
+
+
+def _numero(texto: Optional[str]) -> Optional[float]:
+    if texto is None:
+        return None
+    texto = texto.strip()
+    if texto in _NUMEROS_TEXTO:
+        return float(_NUMEROS_TEXTO[texto])
+    try:
+        if "/" in texto:
+            numerador, denominador = (float(parte.replace(",", ".")) for parte in texto.split("/"))
+            return numerador / denominador if denominador else None
+        return float(texto.replace(",", "."))
+    except ValueError:
+        return None
+
+
+def _dosis(texto: str) -> Optional[float]:
+    coincidencia = _RE_NUMERO.search(texto)
+    return _numero(coincidencia.group(1)) if coincidencia else None
+
+
+def _intervalo(coincidencia) -> Optional[float]:
+    # "cada hora" / "cada día" valen 1; "cada horas" o "cada 0 horas" no se entienden
+    if coincidencia.group(1) is None:
+        return 1.0 if not coincidencia.group(2).endswith("s") else None
+    valor = _numero(coincidencia.group(1))
+    return valor if valor and valor > 0 else None
+
+
+def _tomas_por_dia(texto: str) -> Optional[float]:
+    coincidencia = _RE_CADA_HORAS.search(texto)
+    if coincidencia:
+        horas = _intervalo(coincidencia)
+        return 24 / horas if horas else None
+    coincidencia = _RE_VECES.search(texto)
+    if coincidencia:
+        veces = _numero(coincidencia.group(1))
+        # "2 veces por semana"
+        return veces / 7 if veces and "semana" in texto else veces
+    coincidencia = _RE_CADA_DIAS.search(texto)
+    if coincidencia:
+        dias = _intervalo(coincidencia)
+        return 1 / dias if dias else None
+    if _RE_DIARIO.search(texto):
+        return 1.0
+    return None
+
+
+def _dias(texto: str) -> Optional[int]:
+    coincidencia = _RE_DURACION.search(texto)
+    if coincidencia:
+        valor = _numero(coincidencia.group(1))
+        return math.ceil(valor * _DIAS_POR_UNIDAD[coincidencia.group(2)[0]]) if valor else None
+    numero = _dosis(texto)
+    return math.ceil(numero) if numero else None
+
+
+@lru_cache(maxsize=4096)
+def interpretar_posologia(dosis: str, frecuencia: str, duracion: str) -> Posologia:
+    """
+    Convierte los textos libres de una prescripción ("1 tableta",
+    "cada 8 horas", "5 días") a cantidades. Las frases se repiten mucho
+    entre recetas, por eso el resultado se memoiza.
+    """
+    unidades = _dosis((dosis or "").lower())
+    tomas = _tomas_por_dia((frecuencia or "").lower())
+    dias = _dias((duracion or "").lower())
+    interpretada = None not in (unidades, tomas, dias) and unidades > 0 and tomas > 0 and dias > 0
+
+    unidades = unidades if unidades and unidades > 0 else DOSIS_DEFAULT
+    tomas = tomas if tomas and tomas > 0 else TOMAS_DEFAULT
+    dias = dias if dias and dias > 0 else DIAS_DEFAULT
+
+    # Redondear hacia arriba para asegurar cantidad suficiente
+    total = math.ceil(round(unidades * tomas * dias, 6))
+    return Posologia(unidades, round(tomas, 4), dias, total, interpretada)
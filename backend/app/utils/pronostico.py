@@ -0,0 +1,119 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import case, func
+from sqlmodel import Session, select
+
+from ..models.medicamento.medicamento import Medicamento
+from ..models.medicamento.inventario import MovimientoInventario, SnapshotStock
+from ..models.medicamento.receta import DispensacionMedicamento
+
+load_dotenv()
+
+PRONOSTICO_VENTANA_DIAS = int(os.getenv("PRONOSTICO_VENTANA_DIAS", 90))
+PRONOSTICO_REPOSICION_DIAS = int(os.getenv("PRONOSTICO_REPOSICION_DIAS", 7))
+PRONOSTICO_COBERTURA_DIAS = int(os.getenv("PRONOSTICO_COBERTURA_DIAS", 30))
+PRONOSTICO_TTL_SEGUNDOS = int(os.getenv("PRONOSTICO_TTL_SEGUNDOS", 3600))
+
+
+def calcular_pronostico(session: Session) -> List[dict]:
+    """
+    Consumo diario, días hasta agotarse y cantidad sugerida a reponer para
+    todo el catálogo. El historial se agrega en la base (una fila por
+    medicamento); en Python solo se recorre el catálogo.
+
+    La tasa es lo dispensado en la ventana dividido por la ventana completa,
+    o por los días desde que hay registro del medicamento si es más nuevo:
+    su primer movimiento, su primer snapshot (el saldo de apertura de los
+    que ya existían al crear el ledger) o su primera entrega. Las entregas
+    anteriores a DispensacionMedicamento ya están en ella gracias a
+    migrar_entregas_legadas (ver esquema.py).
+    """
+    ahora = datetime.now(timezone.utc)
+    desde = ahora - timedelta(days=PRONOSTICO_VENTANA_DIAS)
+
+    consumo = (
+        select(
+            DispensacionMedicamento.medicamento_id,
+            func.sum(case(
+                (DispensacionMedicamento.fecha_entrega >= desde, DispensacionMedicamento.cantidad),
+                else_=0
+            )).label("total"),
+            func.min(DispensacionMedicamento.fecha_entrega).label("primera")
+        )
+        .group_by(DispensacionMedicamento.medicamento_id)
+        .subquery()
+    )
+    primer_movimiento = (
+        select(MovimientoInventario.medicamento_id, func.min(MovimientoInventario.fecha).label("fecha"))
+        .group_by(MovimientoInventario.medicamento_id)
+        .subquery()
+    )
+    primer_snapshot = (
+        select(SnapshotStock.medicamento_id, func.min(SnapshotStock.fecha).label("fecha"))
+        .group_by(SnapshotStock.medicamento_id)
+        .subquery()
+    )
+    filas = session.exec(
+        select(
+            Medicamento.id, Medicamento.nombre, Medicamento.stock, Medicamento.stock_minimo,
+            consumo.c.total, consumo.c.primera, primer_movimiento.c.fecha, primer_snapshot.c.fecha
+        )
+        .outerjoin(consumo, consumo.c.medicamento_id == Medicamento.id)
+        .outerjoin(primer_movimiento, primer_movimiento.c.medicamento_id == Medicamento.id)
+        .outerjoin(primer_snapshot, primer_snapshot.c.medicamento_id == Medicamento.id)
+        .where(Medicamento.is_activo == True)
+        .order_by(Medicamento.id)
+    ).all()
+
+    horizonte = PRONOSTICO_REPOSICION_DIAS + PRONOSTICO_COBERTURA_DIAS
+    resultado = []
+    for medicamento_id, nombre, stock, stock_minimo, total, *registros in filas:
+        tasa = 0.0
+        if total:
+            # SQLite devuelve fechas sin zona; se guardan en UTC
+            inicio = min(f if f.tzinfo else f.replace(tzinfo=timezone.utc) for f in registros if f is not None)
+            dias = max(1.0, min(PRONOSTICO_VENTANA_DIAS, (ahora - inicio).total_seconds() / 86400))
+            tasa = total / dias
+        dias_hasta_agotar = round(stock / tasa, 1) if tasa else None
+        sugerido = max(0, math.ceil(tasa * horizonte) + stock_minimo - stock)
+        resultado.append({
+            "medicamento_id": medicamento_id,
+            "nombre": nombre,
+            "stock": stock,
+            "consumo_diario": round(tasa, 3),
+            "dias_hasta_agotar": dias_hasta_agotar,
+            "reponer": sugerido
+        })
+    return resultado
+
+
+class CachePronostico:
+    """Último pronóstico calculado; se recalcula al vencer el TTL."""
+
+    def __init__(self, ttl_segundos: int):
+        self._ttl = ttl_segundos
+        self._lock = threading.Lock()
+        self._calculado_en: Optional[float] = None
+        self._datos: dict = {}
+
+    def obtener(self, session: Session, forzar: bool = False) -> dict:
+        # El lock evita que varias peticiones recalculen a la vez
+        with self._lock:
+            vigente = self._calculado_en is not None and time.monotonic() - self._calculado_en < self._ttl
+            if forzar or not vigente:
+                self._datos = {
+                    "fecha": datetime.now(timezone.utc),
+                    "ventana_dias": PRONOSTICO_VENTANA_DIAS,
+                    "medicamentos": calcular_pronostico(session)
+                }
+                self._calculado_en = time.monotonic()
+            return self._datos
+
+
+cache_pronostico = CachePronostico(PRONOSTICO_TTL_SEGUNDOS)
@@ -0,0 +1,52 @@
+from typing import Dict, List
+
+from sqlalchemy import case, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..models.medicamento.medicamento import Medicamento
+
+
+async def descontar_stock(session: AsyncSession, cantidades: Dict[int, int]) -> List[dict]:
+    """
+    Descuenta `cantidades` ({medicamento_id: unidades}) del stock en la
+    transacción actual, todo o nada.
+
+    Las filas se bloquean con SELECT ... FOR UPDATE siempre en orden de id,
+    así dos entregas simultáneas no pueden interbloquearse, y luego se
+    actualizan todas en un único UPDATE. Si algún medicamento no alcanza no
+    se modifica nada y se devuelven los faltantes; el llamador debe hacer
+    rollback para liberar los bloqueos.
+    """
+    cantidades = {medicamento_id: cantidad for medicamento_id, cantidad in cantidades.items() if cantidad > 0}
+    if not cantidades:
+        return []
+
+    filas = (await session.exec(
+        select(Medicamento.id, Medicamento.nombre, Medicamento.stock)
+        .where(Medicamento.id.in_(cantidades))
+        .order_by(Medicamento.id)
+        .with_for_update()
+    )).all()
+    disponibles = {medicamento_id: (nombre, stock) for medicamento_id, nombre, stock in filas}
+
+    faltantes = []
+    for medicamento_id, cantidad in sorted(cantidades.items()):
+        nombre, stock = disponibles.get(medicamento_id, (None, 0))
+        if stock < cantidad:
+            faltantes.append({
+                "medicamento_id": medicamento_id,
+                "nombre": nombre,
+                "solicitado": cantidad,
+                "disponible": stock
+            })
+    if faltantes:
+        return faltantes
+
+    await session.execute(
+        update(Medicamento)
+        .where(Medicamento.id.in_(cantidades))
+        .values(stock=Medicamento.stock - case(cantidades, value=Medicamento.id))
+        .execution_options(synchronize_session=False)
+    )
+    return []
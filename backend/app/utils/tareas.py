@@ -0,0 +1,27 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def ejecutar_periodicamente(intervalo_segundos: float, funcion, *args):
+    """
+    Ejecuta `funcion` cada `intervalo_segundos`, empezando de inmediato. Si
+    es síncrona (p. ej. un trabajo con Session) corre en un hilo. Un fallo
+    se registra y no detiene las siguientes ejecuciones.
+    """
+    while True:
+        try:
+            if asyncio.iscoroutinefunction(funcion):
+                await funcion(*args)
+            else:
+                await asyncio.to_thread(funcion, *args)
+        except Exception:
+            logger.exception("Falló la tarea periódica %s", getattr(funcion, "__name__", funcion))
+        await asyncio.sleep(intervalo_segundos)
+
+
+async def cancelar_tareas(tareas):
+    for tarea in tareas:
+        tarea.cancel()
+    await asyncio.gather(*tareas, return_exceptions=True)
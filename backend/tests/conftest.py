@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+# La aplicación arma sus engines al importarse: la base de pruebas se fija
+# antes. Con TEST_DATABASE_URL (Postgres) corren también las pruebas de
+# concurrencia; sin ella se usa un SQLite temporal.
+_SQLITE = Path(tempfile.mkdtemp()) / "pruebas.db"
+URL_PRUEBAS = os.getenv("TEST_DATABASE_URL", f"sqlite:///{_SQLITE}")
+os.environ["DATABASE_URL"] = URL_PRUEBAS
+if URL_PRUEBAS.startswith("sqlite"):
+    os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{_SQLITE}"
+else:
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Importar la app registra todos los modelos en el metadata
+from app.main import app  # noqa: E402,F401
+from app.database import engine, init_db  # noqa: E402
+
+ES_POSTGRES = engine.dialect.name == "postgresql"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def base_de_datos():
+    init_db()
+    yield engine
+
+
+@pytest.fixture
+def requiere_postgres():
+    if not ES_POSTGRES:
+        pytest.skip("Necesita TEST_DATABASE_URL apuntando a Postgres")
+
+
+def crear_usuario(session, role, **campos):
+    """Usuario con username único; `role` es un RoleEnum."""
+    from app.models.usuario.usuario import User
+
+    nombre = f"{role.value}_{uuid.uuid4().hex[:8]}"
+    user = User(
+        username=nombre, hashed_password="x", nombre=nombre, apellido="Prueba",
+        fecha_nacimiento=None, direccion=None, telefono=None, cedula=nombre,
+        role=role, **campos
+    )
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    return user
+
+
+def cabeceras(user) -> dict:
+    from app.auth import create_access_token
+
+    return {"Authorization": "Bearer " + create_access_token({"sub": user.username, "role": user.role.value})}
+
+
+def correr(corrutina):
+    """asyncio.run que al final suelta las conexiones async: cada loop abre las suyas."""
+    from app.database import async_engine
+
+    async def envoltura():
+        try:
+            return await corrutina
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(envoltura())
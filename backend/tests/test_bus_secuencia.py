@@ -0,0 +1,175 @@
+"""Numeración de los eventos WebSocket: sin huecos entre workers y "resync" ante un hueco."""
+import asyncio
+import json
+
+from sqlalchemy.engine import make_url
+
+from app.database import ASYNC_DATABASE_URL
+from app.routes.websocket.gestor_base import Conexion, GestorWebSocketBase
+from app.routes.websocket.gestor_citas import GestorWebSocketCitas
+from app.utils.bus import CANAL_POSTGRES, CARGA_MAX_BYTES, BusPostgres
+
+
+class WebSocketFalso:
+    pass
+
+
+def _mensajes(conexion: Conexion) -> list:
+    mensajes = []
+    while not conexion.cola.empty():
+        mensajes.append(conexion.cola.get_nowait())
+    return mensajes
+
+
+def test_hueco_pide_resync_a_los_conectados():
+    async def escenario():
+        gestor = GestorWebSocketBase("prueba_hueco")
+        websocket = WebSocketFalso()
+        conexion = gestor.conexiones[websocket] = Conexion(websocket)
+
+        for seq in (1, 2, 5):
+            gestor.recibir({"evento": "cambio", "seq": seq})
+
+        assert _mensajes(conexion) == [
+            {"evento": "cambio", "seq": 1},
+            {"evento": "cambio", "seq": 2},
+            {"evento": "resync", "seq": 4},
+            {"evento": "cambio", "seq": 5},
+        ]
+        # Quien reconecta desde antes del hueco recarga; desde el hueco, se le reenvía
+        gestor._reenviar(conexion, 2)
+        gestor._reenviar(conexion, 4)
+        assert _mensajes(conexion) == [{"evento": "resync", "seq": 5}, {"evento": "cambio", "seq": 5}]
+
+    asyncio.run(escenario())
+
+
+def test_resync_llega_a_las_conexiones_con_temas():
+    async def escenario():
+        gestor = GestorWebSocketCitas()
+        websocket = WebSocketFalso()
+        gestor.temas[websocket] = set()
+        gestor.suscribir(websocket, ["medico:2"])
+        conexion = gestor.conexiones[websocket] = Conexion(websocket)
+
+        cambio = {"evento": "actualizacion_citas", "tipo": "creada", "cita": {}, "temas": ["medico:2"], "seq": 1}
+        ajeno = {**cambio, "temas": ["medico:3"], "seq": 3}
+        for mensaje in (cambio, {"evento": "resync", "seq": 2}, ajeno):
+            gestor.recibir(mensaje)
+        assert _mensajes(conexion) == [cambio, {"evento": "resync", "seq": 2}]
+
+        # El reenvío a quien reconecta respeta lo mismo
+        gestor._reenviar(conexion, 1)
+        assert _mensajes(conexion) == [{"evento": "resync", "seq": 2}]
+
+    asyncio.run(escenario())
+
+
+def test_al_apagar_se_publica_lo_que_esperaba_la_ventana():
+    async def escenario():
+        gestor = GestorWebSocketBase("prueba_apagado")
+        websocket = WebSocketFalso()
+        conexion = gestor.conexiones[websocket] = Conexion(websocket)
+
+        await gestor.difundir({"evento": "cambio", "id": 1}, clave=1)
+        await gestor.difundir({"evento": "cambio", "id": 2}, clave=2)
+        assert _mensajes(conexion) == []
+
+        # Sin esperar el fin de la ventana
+        await gestor.vaciar_pendientes()
+        assert [mensaje["eventos"] for mensaje in _mensajes(conexion)] == [
+            [{"evento": "cambio", "id": 1}, {"evento": "cambio", "id": 2}]
+        ]
+        assert gestor._vaciado is None and not gestor._pendientes
+
+    asyncio.run(escenario())
+
+
+DSN = make_url(ASYNC_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+async def _iniciar_workers(canal: str, cantidad: int = 2):
+    # Cada "worker" es un BusPostgres propio que guarda lo que recibe
+    workers, recibidos = [], []
+    for _ in range(cantidad):
+        bus, lista = BusPostgres(DSN), []
+        bus.secuenciar(canal)
+        bus.suscribir(canal, lista.append)
+        await bus.iniciar()
+        workers.append(bus)
+        recibidos.append(lista)
+    return workers, recibidos
+
+
+async def _esperar(condicion):
+    for _ in range(100):
+        if condicion():
+            return
+        await asyncio.sleep(0.05)
+
+
+async def _detener(workers):
+    for bus in workers:
+        await bus.detener()
+
+
+def test_workers_reciben_la_misma_secuencia_sin_huecos(requiere_postgres):
+    canal = "ws:prueba_orden"
+
+    async def escenario():
+        workers, recibidos = await _iniciar_workers(canal)
+        inicial = workers[0].secuencia_inicial(canal)
+        try:
+            await asyncio.gather(*(
+                bus.publicar(canal, {"evento": "cambio", "n": n}) for n in range(20) for bus in workers
+            ))
+            await _esperar(lambda: all(len(lista) == 40 for lista in recibidos))
+        finally:
+            await _detener(workers)
+        return inicial, [[mensaje["seq"] for mensaje in lista] for lista in recibidos]
+
+    inicial, recibidos = asyncio.run(escenario())
+    esperado = list(range(inicial + 1, inicial + 41))
+    assert recibidos == [esperado, esperado]
+
+
+def test_sin_escucha_se_sigue_publicando_a_los_demas(requiere_postgres):
+    canal = "ws:prueba_escucha"
+
+    async def escenario():
+        (caido, sano), (locales, remotos) = await _iniciar_workers(canal)
+        inicial = caido.secuencia_inicial(canal)
+        escucha, caido._escucha = caido._escucha, None
+        await escucha.remove_listener(CANAL_POSTGRES, caido._al_notificar)
+        try:
+            await caido.publicar(canal, {"evento": "cambio"})
+            await _esperar(lambda: remotos)
+        finally:
+            await escucha.close()
+            await _detener([caido, sano])
+        return inicial, locales, remotos
+
+    inicial, locales, remotos = asyncio.run(escenario())
+    # Los demás lo reciben numerado; el caído lo entrega sin "seq"
+    assert remotos == [{"evento": "cambio", "seq": inicial + 1}]
+    assert locales == [{"evento": "cambio"}]
+
+
+def test_mensaje_que_no_entra_en_el_notify_llega_como_resync(requiere_postgres):
+    canal = "ws:prueba_grande"
+    # El mensaje solo entra en el límite; con canal y seq ya no
+    mensaje = {"evento": "cambio", "datos": "x" * (CARGA_MAX_BYTES - 40)}
+    assert len(json.dumps(mensaje).encode()) <= CARGA_MAX_BYTES
+
+    async def escenario():
+        workers, recibidos = await _iniciar_workers(canal)
+        inicial = workers[0].secuencia_inicial(canal)
+        try:
+            await workers[0].publicar(canal, mensaje)
+            await _esperar(lambda: all(recibidos))
+        finally:
+            await _detener(workers)
+        return inicial, recibidos
+
+    inicial, recibidos = asyncio.run(escenario())
+    assert recibidos == [[{"evento": "resync", "seq": inicial + 1}]] * 2
@@ -0,0 +1,136 @@
+"""Entrega de recetas en lote: stock sumado por medicamento y todo o nada."""
+from datetime import date, time
+
+import httpx
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.main import app
+from app.models.cita.cita import Cita
+from app.models.medicamento.inventario import MovimientoInventario
+from app.models.medicamento.medicamento import Medicamento
+from app.models.medicamento.receta import DispensacionMedicamento, Receta, RecetaMedicamento
+from app.models.usuario.usuario import RoleEnum
+from conftest import cabeceras, correr, crear_usuario
+
+
+def _medicamentos(*stocks):
+    with Session(engine) as session:
+        medicamentos = [Medicamento(nombre=f"Dispensación {i}", stock=stock) for i, stock in enumerate(stocks)]
+        session.add_all(medicamentos)
+        session.commit()
+        return [medicamento.id for medicamento in medicamentos]
+
+
+def _receta(unidades: dict) -> int:
+    """Receta con un renglón por medicamento: {medicamento_id: total_unidades}."""
+    with Session(engine) as session:
+        medico = crear_usuario(session, RoleEnum.medico)
+        paciente = crear_usuario(session, RoleEnum.paciente)
+        cita = Cita(paciente_id=paciente.id, medico_id=medico.id, fecha=date.today(), hora_inicio=time(10), hora_fin=time(10, 30))
+        session.add(cita)
+        session.commit()
+        receta = Receta(cita_id=cita.id, fecha_emision=date.today())
+        session.add(receta)
+        session.commit()
+        session.add_all([
+            RecetaMedicamento(receta_id=receta.id, medicamento_id=medicamento_id, dosis="1 tableta",
+                              frecuencia="cada 24 horas", duracion=f"{total} días", total_unidades=total)
+            for medicamento_id, total in unidades.items()
+        ])
+        session.commit()
+        return receta.id
+
+
+def _farmacologo() -> dict:
+    with Session(engine) as session:
+        return cabeceras(crear_usuario(session, RoleEnum.farmacologo))
+
+
+def _autorizar_lote(recetas: list):
+    async def pedir():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://prueba") as cliente:
+            return await cliente.post("/recetas/autorizar-lote", headers=_farmacologo(), json={"recetas": recetas})
+    return correr(pedir())
+
+
+def _stocks(*medicamento_ids):
+    with Session(engine) as session:
+        return [session.get(Medicamento, medicamento_id).stock for medicamento_id in medicamento_ids]
+
+
+def _estado(receta_id: int) -> str:
+    with Session(engine) as session:
+        return session.get(Receta, receta_id).estado
+
+
+def _entregado(receta_id: int) -> list:
+    with Session(engine) as session:
+        return session.exec(
+            select(DispensacionMedicamento.medicamento_id, DispensacionMedicamento.cantidad)
+            .where(DispensacionMedicamento.receta_id == receta_id)
+            .order_by(DispensacionMedicamento.medicamento_id)
+        ).all()
+
+
+def test_lote_descuenta_el_total_por_medicamento():
+    a, b = _medicamentos(20, 20)
+    primera, segunda = _receta({a: 3, b: 2}), _receta({a: 5})
+
+    respuesta = _autorizar_lote([{"receta_id": primera}, {"receta_id": segunda}])
+
+    assert respuesta.status_code == 200
+    assert respuesta.json()["entregadas"] == [primera, segunda]
+    assert _stocks(a, b) == [12, 18]
+    with Session(engine) as session:
+        movimientos = session.exec(
+            select(MovimientoInventario.receta_id, MovimientoInventario.cantidad)
+            .where(MovimientoInventario.medicamento_id == a)
+            .order_by(MovimientoInventario.receta_id)
+        ).all()
+    # Un UPDATE agregado, pero el ledger sigue registrando cada receta
+    assert movimientos == [(primera, -3), (segunda, -5)]
+
+
+def test_lote_mezcla_entregas_totales_y_parciales():
+    a, b = _medicamentos(20, 20)
+    parcial, total = _receta({a: 3, b: 2}), _receta({a: 1, b: 1})
+
+    respuesta = _autorizar_lote([{"receta_id": parcial, "entregados": [b]}, {"receta_id": total}])
+
+    assert respuesta.status_code == 200
+    assert respuesta.json()["estados"] == {str(parcial): "parcial", str(total): "entregada"}
+    assert _entregado(parcial) == [(b, 2)]
+    assert _entregado(total) == [(a, 1), (b, 1)]
+    assert _stocks(a, b) == [19, 17]
+
+    # Lo ya entregado no se vuelve a descontar al completar la receta
+    respuesta = _autorizar_lote([{"receta_id": parcial, "entregados": [a, b]}])
+    assert respuesta.json()["estados"] == {str(parcial): "entregada"}
+    assert _entregado(parcial) == [(a, 3), (b, 2)]
+    assert _stocks(a, b) == [16, 17]
+
+
+def test_faltante_en_una_receta_no_entrega_ninguna():
+    a, b = _medicamentos(10, 4)
+    alcanza, no_alcanza = _receta({a: 2}), _receta({a: 2, b: 5})
+
+    respuesta = _autorizar_lote([{"receta_id": alcanza}, {"receta_id": no_alcanza}])
+
+    assert respuesta.status_code == 400
+    assert [f["medicamento_id"] for f in respuesta.json()["detail"]["faltantes"]] == [b]
+    assert _stocks(a, b) == [10, 4]
+    assert _entregado(alcanza) == _entregado(no_alcanza) == []
+    assert _estado(alcanza) == _estado(no_alcanza) == "pendiente"
+
+
+def test_medicamento_que_no_esta_en_la_receta_se_rechaza():
+    a, ajeno = _medicamentos(10, 10)
+    otra, receta = _receta({a: 1}), _receta({a: 2})
+
+    respuesta = _autorizar_lote([{"receta_id": otra}, {"receta_id": receta, "entregados": [a, ajeno]}])
+
+    assert respuesta.status_code == 400
+    assert respuesta.json()["detail"]["medicamento_ids"] == {str(receta): [ajeno]}
+    assert _stocks(a, ajeno) == [10, 10]
+    assert _entregado(otra) == _entregado(receta) == []
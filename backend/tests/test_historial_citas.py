@@ -0,0 +1,86 @@
+"""
+/citas/historial carga médicos, especialidades y certificados con cargas
+selectin y marca las citas con receta: la cantidad de consultas no depende
+de cuántas citas tenga el paciente.
+"""
+from datetime import date, time, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.main import app
+from app.models.cita.cita import Cita
+from app.models.cita.certificado import CertificadoAsistencia
+from app.models.medicamento.receta import Receta
+from app.models.usuario.especialidad import Especialidad
+from app.models.usuario.usuario import RoleEnum
+from conftest import cabeceras, crear_usuario
+
+
+def _paciente_con_citas(cantidad: int):
+    with Session(engine) as session:
+        paciente = crear_usuario(session, RoleEnum.paciente)
+        for i in range(cantidad):
+            especialidad = Especialidad(nombre=f"esp_{paciente.id}_{i}")
+            session.add(especialidad)
+            session.commit()
+            # Un médico distinto por cita: el peor caso para el N+1
+            medico = crear_usuario(session, RoleEnum.medico, especialidad_id=especialidad.id)
+            cita = Cita(
+                paciente_id=paciente.id, medico_id=medico.id,
+                fecha=date(2024, 1, 1) + timedelta(days=i), hora_inicio=time(9), hora_fin=time(9, 30)
+            )
+            session.add(cita)
+            session.commit()
+            if i % 2:
+                session.add(CertificadoAsistencia(
+                    cita_id=cita.id, fecha=cita.fecha, hora_entrada=time(9), hora_salida=time(9, 30)
+                ))
+                session.commit()
+            if i % 3 == 0:
+                session.add(Receta(cita_id=cita.id, fecha_emision=cita.fecha))
+                session.commit()
+        session.refresh(paciente)
+        session.expunge(paciente)
+        return paciente
+
+
+def _consultas_historial(cliente: TestClient, paciente) -> tuple:
+    sentencias = []
+
+    def contar(conn, cursor, sentencia, parametros, contexto, executemany):
+        sentencias.append(sentencia)
+
+    event.listen(engine, "before_cursor_execute", contar)
+    try:
+        respuesta = cliente.get("/citas/historial", headers=cabeceras(paciente))
+    finally:
+        event.remove(engine, "before_cursor_execute", contar)
+    assert respuesta.status_code == 200
+    return len(respuesta.json()), len(sentencias)
+
+
+def test_historial_no_crece_con_las_citas():
+    cliente = TestClient(app)
+    pocas, consultas_pocas = _consultas_historial(cliente, _paciente_con_citas(2))
+    muchas, consultas_muchas = _consultas_historial(cliente, _paciente_con_citas(25))
+
+    assert (pocas, muchas) == (2, 25)
+    assert consultas_muchas == consultas_pocas
+
+
+def test_historial_marca_las_citas_con_receta():
+    paciente = _paciente_con_citas(3)
+    with Session(engine) as session:
+        con_receta = set(session.exec(
+            select(Receta.cita_id).join(Cita, Cita.id == Receta.cita_id).where(Cita.paciente_id == paciente.id)
+        ).all())
+
+    respuesta = TestClient(app).get("/citas/historial", headers=cabeceras(paciente))
+
+    assert respuesta.status_code == 200
+    marcas = {cita["id"]: cita["tiene_receta"] for cita in respuesta.json()}
+    assert len(con_receta) == 1 and len(marcas) == 3
+    assert marcas == {cita_id: cita_id in con_receta for cita_id in marcas}
@@ -0,0 +1,57 @@
+"""El cache de horarios no guarda un horario leído antes de su edición."""
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models.usuario.horario_laboral import HorarioLaboral
+from app.models.usuario.usuario import RoleEnum
+from app.utils.horarios import CacheHorarios
+from conftest import crear_usuario
+
+LUNES = 0
+
+
+class Filas(list):
+    def all(self):
+        return list(self)
+
+
+class SesionConEdicionConcurrente:
+    """Después de leer los horarios, otra petición los edita e invalida."""
+
+    def __init__(self, session, al_consultar):
+        self.session = session
+        self.al_consultar = al_consultar
+
+    def exec(self, consulta):
+        filas = self.session.exec(consulta).all()
+        if self.al_consultar:
+            self.al_consultar()
+            self.al_consultar = None
+        return Filas(filas)
+
+
+def test_horario_leido_antes_de_la_edicion_no_queda_en_cache():
+    cache = CacheHorarios()
+    with Session(engine) as session:
+        medico = crear_usuario(session, RoleEnum.medico)
+        medico_id = medico.id
+        session.add(HorarioLaboral(user_id=medico_id, dia="lunes", hora_inicio="08:00", hora_fin="12:00"))
+        session.commit()
+
+    def editar_horario():
+        with Session(engine) as otra:
+            horario = otra.exec(select(HorarioLaboral).where(HorarioLaboral.user_id == medico_id)).one()
+            horario.hora_inicio, horario.hora_fin = "14:00", "18:00"
+            otra.add(horario)
+            otra.commit()
+        cache.invalidar(medico_id, propagar=False)
+
+    with Session(engine) as session:
+        # Esta petición se queda con lo que leyó...
+        anterior = cache.obtener_varios(SesionConEdicionConcurrente(session, editar_horario), [medico_id])
+        assert anterior[medico_id].contiene(LUNES, 9 * 60, 10 * 60)
+
+        # ...pero la siguiente ve el horario editado
+        actual = cache.obtener_varios(session, [medico_id])[medico_id]
+    assert actual.contiene(LUNES, 15 * 60, 16 * 60)
+    assert not actual.contiene(LUNES, 9 * 60, 10 * 60)
@@ -0,0 +1,134 @@
+"""Duplicados e interacciones al recetar, y recarga del índice en memoria."""
+from datetime import date, time
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.database import engine
+from app.main import app
+from app.models.cita.cita import Cita
+from app.models.medicamento.interaccion import InteraccionMedicamento
+from app.models.medicamento.medicamento import Medicamento
+from app.models.medicamento.receta import Receta, RecetaMedicamento
+from app.models.usuario.usuario import RoleEnum
+from app.utils.interacciones import IndiceInteracciones, indice_interacciones, revisar_receta
+from conftest import cabeceras, crear_usuario
+
+
+def _medicamentos(session, cantidad: int) -> list:
+    medicamentos = [Medicamento(nombre=f"Interacción {i}", stock=10) for i in range(cantidad)]
+    session.add_all(medicamentos)
+    session.commit()
+    return [medicamento.id for medicamento in medicamentos]
+
+
+def _interaccion(session, a: int, b: int, descripcion: str):
+    session.add(InteraccionMedicamento(medicamento_a_id=min(a, b), medicamento_b_id=max(a, b), descripcion=descripcion))
+    session.commit()
+
+
+def _paciente_en_tratamiento(session, medicamento_ids) -> int:
+    medico = crear_usuario(session, RoleEnum.medico)
+    paciente = crear_usuario(session, RoleEnum.paciente)
+    cita = Cita(paciente_id=paciente.id, medico_id=medico.id, fecha=date.today(), hora_inicio=time(7), hora_fin=time(7, 30))
+    session.add(cita)
+    session.commit()
+    receta = Receta(cita_id=cita.id, fecha_emision=date.today())
+    session.add(receta)
+    session.commit()
+    session.add_all([
+        RecetaMedicamento(receta_id=receta.id, medicamento_id=medicamento_id, dosis="1 tableta",
+                          frecuencia="cada 8 horas", duracion="30 días", dias_tratamiento=30)
+        for medicamento_id in medicamento_ids
+    ])
+    session.commit()
+    return paciente.id
+
+
+def test_duplicados_e_interacciones_con_tratamiento_activo():
+    with Session(engine) as session:
+        activo, nuevo, otro_nuevo = _medicamentos(session, 3)
+        _interaccion(session, activo, nuevo, "activo-nuevo")
+        _interaccion(session, nuevo, otro_nuevo, "entre nuevos")
+        indice_interacciones.invalidar(propagar=False)
+        paciente_id = _paciente_en_tratamiento(session, [activo])
+
+        advertencias = revisar_receta(session, paciente_id, [activo, nuevo, otro_nuevo])
+
+    resumen = sorted((a["tipo"], tuple(a["medicamento_ids"]), a["en_tratamiento_activo"]) for a in advertencias)
+    # El activo recetado de nuevo es duplicado, no interacción consigo mismo;
+    # el par entre nuevos sale una sola vez
+    assert resumen == sorted([
+        ("duplicado", (activo,), True),
+        ("interaccion", (activo, nuevo), False),
+        ("interaccion", (nuevo, otro_nuevo), False),
+    ])
+
+    with Session(engine) as session:
+        advertencias = revisar_receta(session, paciente_id, [nuevo])
+    assert [(a["medicamento_ids"], a["en_tratamiento_activo"], a["mensaje"]) for a in advertencias] == [
+        ([nuevo, activo], True, "activo-nuevo")
+    ]
+
+
+class Filas(list):
+    def all(self):
+        return list(self)
+
+
+class SesionConEscrituraConcurrente:
+    """Al consultar la tabla, otra petición crea una interacción e invalida."""
+
+    def __init__(self, session, al_consultar):
+        self.session = session
+        self.al_consultar = al_consultar
+
+    def exec(self, consulta):
+        filas = self.session.exec(consulta).all()
+        if self.al_consultar:
+            self.al_consultar()
+            self.al_consultar = None
+        return Filas(filas)
+
+
+def test_carga_anterior_a_una_invalidacion_no_se_instala():
+    indice = IndiceInteracciones()
+    with Session(engine) as session:
+        a, b = _medicamentos(session, 2)
+
+    def crear_interaccion():
+        with Session(engine) as otra:
+            _interaccion(otra, a, b, "creada durante la carga")
+        indice.invalidar(propagar=False)
+
+    with Session(engine) as session:
+        sesion = SesionConEscrituraConcurrente(session, crear_interaccion)
+        advertencias = indice.verificar(sesion, [a, b], [])
+
+    assert [a["mensaje"] for a in advertencias] == ["creada durante la carga"]
+
+
+def test_crear_y_recargar_por_api():
+    with Session(engine) as session:
+        a, b = _medicamentos(session, 2)
+        headers = cabeceras(crear_usuario(session, RoleEnum.farmacologo))
+    cliente = TestClient(app)
+
+    with Session(engine) as session:
+        assert revisar_receta(session, 0, [a, b]) == []
+
+    respuesta = cliente.post("/interacciones", headers=headers, json={
+        "medicamento_a_id": b, "medicamento_b_id": a, "severidad": "grave", "descripcion": "por API"
+    })
+    assert respuesta.status_code == 200
+    with Session(engine) as session:
+        assert [x["severidad"] for x in revisar_receta(session, 0, [a, b])] == ["grave"]
+
+        # Cargada directamente en la base: visible tras /interacciones/recargar
+        c, = _medicamentos(session, 1)
+        _interaccion(session, a, c, "cargada a mano")
+        assert len(revisar_receta(session, 0, [a, c])) == 0
+    total = cliente.post("/interacciones/recargar", headers=headers).json()["interacciones"]
+    with Session(engine) as session:
+        assert total >= 2
+        assert [x["mensaje"] for x in revisar_receta(session, 0, [a, c])] == ["cargada a mano"]
@@ -0,0 +1,98 @@
+"""Las entregas guardadas como JSON en observaciones pasan a DispensacionMedicamento."""
+import json
+from datetime import date, time
+
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.esquema import MIGRACION_ENTREGAS, migrar_entregas_legadas
+from app.models.cita.cita import Cita
+from app.models.medicamento.medicamento import Medicamento
+from app.models.medicamento.receta import DispensacionMedicamento, Receta, RecetaMedicamento
+from app.models.usuario.usuario import RoleEnum
+from conftest import crear_usuario
+
+
+def _receta(session, dia: int, estado: str, observaciones: str, medicamentos) -> int:
+    medico = crear_usuario(session, RoleEnum.medico)
+    paciente = crear_usuario(session, RoleEnum.paciente)
+    cita = Cita(paciente_id=paciente.id, medico_id=medico.id, fecha=date(2023, 1, dia), hora_inicio=time(9), hora_fin=time(9, 30))
+    session.add(cita)
+    session.commit()
+    receta = Receta(cita_id=cita.id, estado=estado, observaciones=observaciones, fecha_emision=date(2023, 1, dia))
+    session.add(receta)
+    session.commit()
+    for medicamento in medicamentos:
+        # Renglones anteriores a la posología normalizada: total_unidades NULL
+        session.add(RecetaMedicamento(
+            receta_id=receta.id, medicamento_id=medicamento.id,
+            dosis="1 tableta", frecuencia="cada 8 horas", duracion="5 días"
+        ))
+    session.commit()
+    return receta.id
+
+
+def _dispensaciones(session, receta_id: int):
+    return session.exec(
+        select(DispensacionMedicamento.medicamento_id, DispensacionMedicamento.cantidad)
+        .where(DispensacionMedicamento.receta_id == receta_id)
+        .order_by(DispensacionMedicamento.medicamento_id)
+    ).all()
+
+
+def _base_sin_migrar():
+    # init_db ya la corrió al iniciar las pruebas
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM sgc_migracion WHERE nombre = :nombre"), {"nombre": MIGRACION_ENTREGAS})
+
+
+def test_migra_entregas_legadas_una_sola_vez():
+    with Session(engine) as session:
+        a, b, c = (Medicamento(nombre=f"Legado {i}", stock=100) for i in range(3))
+        session.add_all([a, b, c])
+        session.commit()
+        parcial = _receta(session, 2, "parcial", json.dumps({"entregados": [a.id]}), [a, b])
+        entregada = _receta(session, 3, "entregada", "", [b, c])
+        pendiente = _receta(session, 4, "pendiente", "Tomar con comida", [c])
+
+        _base_sin_migrar()
+        migrar_entregas_legadas(engine)
+        migrar_entregas_legadas(engine)
+
+        session.expire_all()
+        assert _dispensaciones(session, parcial) == [(a.id, 15)]
+        assert _dispensaciones(session, entregada) == [(b.id, 15), (c.id, 15)]
+        assert _dispensaciones(session, pendiente) == []
+        assert session.get(Receta, parcial).observaciones == ""
+        assert session.get(Receta, pendiente).observaciones == "Tomar con comida"
+        # El stock ya se había descontado al entregar
+        assert session.get(Medicamento, a.id).stock == 100
+
+
+def test_ids_invalidos_se_omiten_sin_frenar_el_arranque():
+    with Session(engine) as session:
+        a, b = (Medicamento(nombre=f"Legado inválido {i}", stock=100) for i in range(2))
+        session.add_all([a, b])
+        session.commit()
+        receta = _receta(session, 5, "parcial", json.dumps({"entregados": [str(a.id), "x", None]}), [a, b])
+
+        _base_sin_migrar()
+        migrar_entregas_legadas(engine)
+
+        session.expire_all()
+        assert _dispensaciones(session, receta) == [(a.id, 15)]
+
+
+def test_una_vez_registrada_no_vuelve_a_recorrer_las_recetas():
+    with Session(engine) as session:
+        a = Medicamento(nombre="Legado tardío", stock=100)
+        session.add(a)
+        session.commit()
+        _base_sin_migrar()
+        migrar_entregas_legadas(engine)
+
+        receta = _receta(session, 6, "entregada", "", [a])
+        migrar_entregas_legadas(engine)
+
+        assert _dispensaciones(session, receta) == []
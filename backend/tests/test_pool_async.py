@@ -0,0 +1,101 @@
+"""
+Latencia con el engine async frente a usar el Session síncrono dentro de
+rutas `async def` (lo que había antes). Con Postgres (TEST_DATABASE_URL)
+cada consulta tarda CONSULTA_SEGUNDOS en el servidor y se mide el p99 del
+retraso del event loop y de las consultas; `pytest -s` imprime la tabla.
+"""
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import DB_MAX_OVERFLOW, DB_POOL_SIZE, async_engine, engine
+from conftest import correr
+
+CONCURRENCIA = 40
+CONSULTAS_POR_CLIENTE = 5
+CONSULTA_SEGUNDOS = 0.02
+TICK_SEGUNDOS = 0.005
+
+
+def _p99(valores):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.99))]
+
+
+async def _medir(consultar) -> dict:
+    """Corre CONCURRENCIA clientes y un reloj que mide cuánto se atrasa el loop."""
+    atrasos, latencias = [], []
+    corriendo = True
+
+    async def reloj():
+        while corriendo:
+            inicio = time.perf_counter()
+            await asyncio.sleep(TICK_SEGUNDOS)
+            atrasos.append(time.perf_counter() - inicio - TICK_SEGUNDOS)
+
+    async def cliente():
+        for _ in range(CONSULTAS_POR_CLIENTE):
+            inicio = time.perf_counter()
+            await consultar()
+            latencias.append(time.perf_counter() - inicio)
+
+    tarea_reloj = asyncio.create_task(reloj())
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(CONCURRENCIA)))
+    total = time.perf_counter() - inicio
+    corriendo = False
+    await tarea_reloj
+    return {
+        "p99_loop_ms": round(_p99(atrasos) * 1000, 1),
+        "p99_consulta_ms": round(_p99(latencias) * 1000, 1),
+        "total_s": round(total, 2),
+    }
+
+
+async def _consulta_async(sql: str):
+    async with AsyncSession(async_engine) as session:
+        await session.exec(text(sql))
+
+
+async def _consulta_bloqueante(sql: str):
+    # Así eran las rutas async antes: la espera ocupa el event loop
+    with Session(engine) as session:
+        session.exec(text(sql))
+
+
+def test_pool_async_atiende_mas_clientes_que_conexiones():
+    # Más clientes que conexiones en el pool: esperan turno, ninguno falla
+    assert CONCURRENCIA > DB_POOL_SIZE
+
+    async def medir():
+        resultado = await _medir(lambda: _consulta_async("SELECT 1"))
+        pool = async_engine.pool
+        return resultado, pool.checkedout(), pool.overflow(), pool.medidor.estadisticas()
+
+    resultado, en_uso, overflow, medidor = correr(medir())
+
+    assert resultado["total_s"] > 0
+    assert en_uso == 0
+    assert overflow <= DB_MAX_OVERFLOW
+    assert medidor["timeouts"] == 0
+    assert medidor["checkouts"] >= CONCURRENCIA * CONSULTAS_POR_CLIENTE
+
+
+def test_p99_async_frente_a_bloqueante(requiere_postgres):
+    sql = f"SELECT pg_sleep({CONSULTA_SEGUNDOS})"
+
+    async def comparar():
+        antes = await _medir(lambda: _consulta_bloqueante(sql))
+        despues = await _medir(lambda: _consulta_async(sql))
+        return antes, despues
+
+    antes, despues = correr(comparar())
+    print(f"\nSession síncrono: {antes}\nAsyncSession:     {despues}")
+
+    # Bloqueando, el loop se atrasa al menos una consulta completa
+    assert antes["p99_loop_ms"] >= CONSULTA_SEGUNDOS * 1000
+    assert despues["p99_loop_ms"] < antes["p99_loop_ms"] / 2
+    assert despues["total_s"] < antes["total_s"]
@@ -0,0 +1,104 @@
+"""
+Interpretación de posologías y benchmark del parser sobre un corpus de
+textos como los que escriben los médicos (`pytest -s` imprime tiempos).
+"""
+import itertools
+import random
+import time as reloj
+from datetime import date, time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.database import engine
+from app.main import app
+from app.models.cita.cita import Cita
+from app.models.medicamento.medicamento import Medicamento
+from app.models.usuario.usuario import RoleEnum
+from app.utils.posologia import interpretar_posologia
+from conftest import cabeceras, crear_usuario
+
+DOSIS = ["1 tableta", "2 tabletas", "media tableta", "1/2 tableta", "5 ml", "10 ml", "una cápsula", "2 gotas", "1.5 comprimidos", "dos puff"]
+FRECUENCIAS = ["cada 8 horas", "cada 12 hrs", "cada 6h", "cada 24 horas", "3 veces al día", "dos veces al día", "diario", "una vez al día", "cada 2 días", "cada hora"]
+DURACIONES = ["5 días", "7 dias", "10 días", "2 semanas", "1 mes", "tres días", "14", "por 3 días", "quince días", "1 semana"]
+
+
+@pytest.mark.parametrize("dosis,frecuencia,duracion,esperado", [
+    ("1 tableta", "cada 8 horas", "5 días", (1, 3, 5, 15)),
+    ("media tableta", "cada 12 hrs", "1 semana", (0.5, 2, 7, 7)),
+    ("5 ml", "3 veces al día", "10 dias", (5, 3, 10, 150)),
+    ("1 cápsula", "cada 2 días", "1 mes", (1, 0.5, 30, 15)),
+    ("2 gotas", "cada hora", "2 días", (2, 24, 2, 96)),
+    ("1,5/2 tableta", "cada 8 horas", "5 dias", (0.75, 3, 5, 12)),
+    ("1 tableta", "cada 12 horas", ".5 dias", (1, 2, 1, 2)),
+    ("0,5 ml", "cada 8 horas", "1,5 semanas", (0.5, 3, 11, 17)),
+])
+def test_interpreta_frases_comunes(dosis, frecuencia, duracion, esperado):
+    posologia = interpretar_posologia(dosis, frecuencia, duracion)
+    assert posologia.interpretada
+    assert (posologia.unidades_por_toma, posologia.tomas_por_dia, posologia.dias, posologia.total_unidades) == esperado
+
+
+@pytest.mark.parametrize("frecuencia", ["cada 0 horas", "cada horas", "cada 0 días", "cada días", "según dolor", ""])
+def test_frecuencias_sin_sentido_no_cuentan_como_interpretadas(frecuencia):
+    posologia = interpretar_posologia("1 tableta", frecuencia, "5 días")
+    assert not posologia.interpretada
+    assert posologia.tomas_por_dia == 3
+
+
+@pytest.mark.parametrize("dosis,frecuencia,duracion", [
+    ("1 tableta", "cada 8 horas", "1/0 dias"),
+    ("1 tableta", "cada 1/0 horas", "5 días"),
+    ("1 tableta", "1/0 veces por semana", "5 días"),
+    ("1/0 tableta", "cada 8 horas", "5 días"),
+])
+def test_textos_invalidos_no_rompen_el_parser(dosis, frecuencia, duracion):
+    posologia = interpretar_posologia(dosis, frecuencia, duracion)
+    assert not posologia.interpretada
+    assert posologia.total_unidades > 0
+
+
+def test_benchmark_corpus():
+    azar = random.Random(7)
+    combinaciones = list(itertools.product(DOSIS, FRECUENCIAS, DURACIONES))
+    corpus = [azar.choice(combinaciones) for _ in range(20000)]
+
+    sin_cache = interpretar_posologia.__wrapped__
+    inicio = reloj.perf_counter()
+    for dosis, frecuencia, duracion in corpus:
+        sin_cache(dosis, frecuencia, duracion)
+    frio = reloj.perf_counter() - inicio
+
+    interpretar_posologia.cache_clear()
+    inicio = reloj.perf_counter()
+    resultados = [interpretar_posologia(*textos) for textos in corpus]
+    memoizado = reloj.perf_counter() - inicio
+
+    por_frase = lambda segundos: round(segundos / len(corpus) * 1e6, 2)
+    print(f"\n{len(corpus)} posologías ({len(combinaciones)} frases distintas): "
+          f"sin cache {por_frase(frio)} µs, memoizado {por_frase(memoizado)} µs por receta")
+    assert all(posologia.interpretada for posologia in resultados)
+    assert memoizado < frio
+
+
+def test_crear_receta_advierte_posologia_no_interpretada():
+    with Session(engine) as session:
+        medico = crear_usuario(session, RoleEnum.medico)
+        paciente = crear_usuario(session, RoleEnum.paciente)
+        cita = Cita(paciente_id=paciente.id, medico_id=medico.id, fecha=date(2023, 3, 1), hora_inicio=time(9), hora_fin=time(9, 30))
+        medicamento = Medicamento(nombre="Posología prueba", stock=50)
+        session.add_all([cita, medicamento])
+        session.commit()
+        cita_id, medicamento_id = cita.id, medicamento.id
+        headers = cabeceras(medico)
+
+    respuesta = TestClient(app).post("/recetas", headers=headers, json={
+        "cita_id": cita_id,
+        "observaciones": None,
+        "medicamentos": [{"medicamento_id": medicamento_id, "dosis": "1 tableta", "frecuencia": "cada horas", "duracion": "5 días"}]
+    })
+
+    assert respuesta.status_code == 200
+    advertencias = [a for a in respuesta.json()["advertencias"] if a["tipo"] == "posologia"]
+    assert [a["medicamento_ids"] for a in advertencias] == [[medicamento_id]]
@@ -0,0 +1,70 @@
+"""El consumo diario divide por la ventana o por los días con registro del medicamento."""
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session
+
+from app.database import engine
+from app.models.medicamento.inventario import MovimientoInventario, SnapshotStock, TipoMovimientoEnum
+from app.models.medicamento.medicamento import Medicamento
+from app.models.medicamento.receta import DispensacionMedicamento
+from app.utils.pronostico import PRONOSTICO_VENTANA_DIAS, calcular_pronostico
+from test_migracion_entregas import _receta
+
+
+def _hace(dias: int) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=dias)
+
+
+def _consumo(medicamento_id: int) -> float:
+    with Session(engine) as session:
+        fila, = [f for f in calcular_pronostico(session) if f["medicamento_id"] == medicamento_id]
+    return fila["consumo_diario"]
+
+
+def _dispensar(session, medicamento, dias: int, cantidad: int):
+    receta_id = _receta(session, 1, "entregada", "", [medicamento])
+    session.add(DispensacionMedicamento(
+        receta_id=receta_id, medicamento_id=medicamento.id, cantidad=cantidad, fecha_entrega=_hace(dias)
+    ))
+
+
+def test_primera_entrega_reciente_no_infla_la_tasa():
+    with Session(engine) as session:
+        medicamento = Medicamento(nombre="Pronóstico antiguo", stock=100)
+        session.add(medicamento)
+        session.commit()
+        # Existía al crear el ledger: su saldo de apertura es de hace 200 días
+        session.add(SnapshotStock(medicamento_id=medicamento.id, fecha=_hace(200), stock=100))
+        _dispensar(session, medicamento, 5, 45)
+        session.commit()
+        medicamento_id = medicamento.id
+
+    assert _consumo(medicamento_id) == round(45 / PRONOSTICO_VENTANA_DIAS, 3)
+
+
+def test_medicamento_nuevo_cuenta_desde_su_alta():
+    with Session(engine) as session:
+        medicamento = Medicamento(nombre="Pronóstico nuevo", stock=100)
+        session.add(medicamento)
+        session.commit()
+        session.add(MovimientoInventario(
+            medicamento_id=medicamento.id, tipo=TipoMovimientoEnum.ingreso, cantidad=100, fecha=_hace(30)
+        ))
+        _dispensar(session, medicamento, 2, 60)
+        session.commit()
+        medicamento_id = medicamento.id
+
+    assert _consumo(medicamento_id) == 2.0
+
+
+def test_entregas_anteriores_a_la_ventana_solo_fijan_el_inicio():
+    with Session(engine) as session:
+        medicamento = Medicamento(nombre="Pronóstico historial", stock=100)
+        session.add(medicamento)
+        session.commit()
+        _dispensar(session, medicamento, PRONOSTICO_VENTANA_DIAS + 40, 500)
+        _dispensar(session, medicamento, 10, 9)
+        session.commit()
+        medicamento_id = medicamento.id
+
+    assert _consumo(medicamento_id) == round(9 / PRONOSTICO_VENTANA_DIAS, 3)
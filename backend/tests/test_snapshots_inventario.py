@@ -0,0 +1,97 @@
+"""La tarea de snapshots corre en cada worker pero solo uno los genera."""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, Thread
+
+from sqlalchemy import func, text
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models.medicamento.inventario import SnapshotStock
+from app.models.medicamento.medicamento import Medicamento
+from app.utils.inventario import LOCK_SNAPSHOTS, conciliar, generar_snapshots, stock_segun_ledger
+
+
+def _snapshots(medicamento_id: int) -> int:
+    with Session(engine) as session:
+        return session.exec(
+            select(func.count()).select_from(SnapshotStock).where(SnapshotStock.medicamento_id == medicamento_id)
+        ).one()
+
+
+def _medicamento() -> int:
+    with Session(engine) as session:
+        medicamento = Medicamento(nombre="Snapshot prueba", stock=7)
+        session.add(medicamento)
+        session.commit()
+        return medicamento.id
+
+
+def test_otro_worker_con_el_lock_no_duplica(requiere_postgres):
+    medicamento_id = _medicamento()
+
+    with engine.connect() as otro_worker:
+        otro_worker.execute(text(f"SELECT pg_advisory_lock({LOCK_SNAPSHOTS})"))
+        with Session(engine) as session:
+            assert generar_snapshots(session) == 0
+        otro_worker.execute(text(f"SELECT pg_advisory_unlock({LOCK_SNAPSHOTS})"))
+
+    assert _snapshots(medicamento_id) == 0
+    with Session(engine) as session:
+        assert generar_snapshots(session) >= 1
+    assert _snapshots(medicamento_id) == 1
+
+
+def test_workers_simultaneos_generan_un_solo_snapshot(requiere_postgres):
+    medicamento_id = _medicamento()
+    barrera = Barrier(4)
+
+    def worker():
+        barrera.wait()
+        with Session(engine) as session:
+            return generar_snapshots(session)
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: worker(), range(4)))
+
+    assert _snapshots(medicamento_id) == 1
+
+
+def _mover(conn, medicamento_id: int, cantidad: int):
+    conn.execute(
+        text("INSERT INTO movimientoinventario (medicamento_id, tipo, cantidad, fecha) VALUES (:m, 'ajuste', :c, now())"),
+        {"m": medicamento_id, "c": cantidad}
+    )
+    conn.execute(text("UPDATE medicamento SET stock = stock + :c WHERE id = :m"), {"m": medicamento_id, "c": cantidad})
+
+
+def test_movimiento_con_id_menor_confirmado_despues_no_se_pierde(requiere_postgres):
+    medicamento_id = _medicamento()
+    with Session(engine) as session:
+        generar_snapshots(session)
+
+    with engine.connect() as lenta:
+        # Toma el id menor pero confirma al final
+        lenta.execute(
+            text("INSERT INTO movimientoinventario (medicamento_id, tipo, cantidad, fecha) VALUES (:m, 'ajuste', -2, now())"),
+            {"m": medicamento_id}
+        )
+        with engine.begin() as rapida:
+            _mover(rapida, medicamento_id, -3)
+
+        def snapshot():
+            with Session(engine) as session:
+                generar_snapshots(session)
+        hilo = Thread(target=snapshot)
+        hilo.start()
+        hilo.join(0.5)
+        # El snapshot espera a la transacción que insertó el movimiento
+        assert hilo.is_alive()
+
+        lenta.execute(text("UPDATE medicamento SET stock = stock - 2 WHERE id = :m"), {"m": medicamento_id})
+        lenta.commit()
+        hilo.join()
+
+    with Session(engine) as session:
+        assert stock_segun_ledger(session, medicamento_id=medicamento_id) == {medicamento_id: 2}
+        assert session.get(Medicamento, medicamento_id).stock == 2
+        assert not [d for d in conciliar(session) if d["medicamento_id"] == medicamento_id]
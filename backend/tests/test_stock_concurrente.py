@@ -0,0 +1,75 @@
+"""
+Entregas simultáneas del mismo medicamento contra Postgres: el stock nunca
+queda negativo y ningún descuento se pierde.
+"""
+import asyncio
+
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import async_engine, engine
+from app.models.medicamento.medicamento import Medicamento
+from app.utils.stock import descontar_stock
+from conftest import correr
+
+
+def _medicamento(stock: int) -> int:
+    with Session(engine) as session:
+        medicamento = Medicamento(nombre="Prueba concurrencia", stock=stock)
+        session.add(medicamento)
+        session.commit()
+        return medicamento.id
+
+
+def _stock(medicamento_id: int) -> int:
+    with Session(engine) as session:
+        return session.exec(select(Medicamento.stock).where(Medicamento.id == medicamento_id)).one()
+
+
+async def _entregar(medicamento_id: int, cantidad: int, demora: float = 0) -> bool:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        faltantes = await descontar_stock(session, {medicamento_id: cantidad})
+        if faltantes:
+            await session.rollback()
+            return False
+        # Con el bloqueo tomado: las demás entregas tienen que esperar
+        await asyncio.sleep(demora)
+        await session.commit()
+        return True
+
+
+async def _simultaneas(*entregas):
+    return await asyncio.gather(*entregas)
+
+
+def test_dos_entregas_que_alcanzan_descuentan_ambas(requiere_postgres):
+    medicamento_id = _medicamento(10)
+
+    resultados = correr(_simultaneas(
+        _entregar(medicamento_id, 4, demora=0.2),
+        _entregar(medicamento_id, 4)
+    ))
+
+    assert resultados == [True, True]
+    assert _stock(medicamento_id) == 2
+
+
+def test_dos_entregas_que_no_alcanzan_solo_pasa_una(requiere_postgres):
+    medicamento_id = _medicamento(10)
+
+    resultados = correr(_simultaneas(
+        _entregar(medicamento_id, 6, demora=0.2),
+        _entregar(medicamento_id, 6)
+    ))
+
+    assert sorted(resultados) == [False, True]
+    assert _stock(medicamento_id) == 4
+
+
+def test_muchas_entregas_simultaneas(requiere_postgres):
+    medicamento_id = _medicamento(20)
+
+    resultados = correr(_simultaneas(*(_entregar(medicamento_id, 3, demora=0.01) for _ in range(10))))
+
+    assert resultados.count(True) == 6
+    assert _stock(medicamento_id) == 2
@@ -0,0 +1,86 @@
+"""Las versiones del catálogo se confirman en orden: /medicamentos/cambios no pierde cambios lentos."""
+import time as reloj
+from threading import Thread
+
+import httpx
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.database import engine
+from app.main import app
+from app.models.medicamento.medicamento import Medicamento
+from conftest import correr
+
+
+def _medicamentos(*stocks):
+    with Session(engine) as session:
+        medicamentos = [Medicamento(nombre=f"Versión {i}", stock=stock) for i, stock in enumerate(stocks)]
+        session.add_all(medicamentos)
+        session.commit()
+        return [medicamento.id for medicamento in medicamentos]
+
+
+def _cambiar_stock(conn, medicamento_id: int, stock: int):
+    conn.execute(text("UPDATE medicamento SET stock = :stock WHERE id = :id"), {"stock": stock, "id": medicamento_id})
+
+
+async def _cambio_tardio(lento: int, rapido: int):
+    # Todas las peticiones en el mismo loop: el pool async queda ligado a él
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://prueba") as cliente:
+        async def version(desde: int) -> dict:
+            return (await cliente.get("/medicamentos/cambios", params={"since_version": desde})).json()
+
+        async def estado_catalogo(etag: str) -> int:
+            return (await cliente.get("/medicamentos", headers={"If-None-Match": etag})).status_code
+
+        inicial = (await version(0))["version"]
+        etag_inicial = (await cliente.get("/medicamentos")).headers["ETag"]
+
+        with engine.connect() as conn_lenta:
+            # Escribe primero pero confirma al final
+            _cambiar_stock(conn_lenta, lento, 5)
+            with engine.begin() as conn_rapida:
+                _cambiar_stock(conn_rapida, rapido, 7)
+
+            # Lo confirmado ya tiene versión; lo que sigue en curso no
+            intermedio = await version(inicial)
+            assert [m["id"] for m in intermedio["medicamentos"]] == [rapido]
+            assert intermedio["version"] > inicial
+            assert await estado_catalogo(etag_inicial) == 200
+            etag_intermedio = (await cliente.get("/medicamentos")).headers["ETag"]
+
+            conn_lenta.commit()
+
+        # Al confirmarse tarde recibe un número mayor que el ya entregado
+        final = await version(intermedio["version"])
+        assert [m["id"] for m in final["medicamentos"]] == [lento]
+        assert final["version"] > intermedio["version"]
+        assert await estado_catalogo(etag_intermedio) == 200
+
+
+def test_cambio_confirmado_tarde_no_se_pierde(requiere_postgres):
+    correr(_cambio_tardio(*_medicamentos(10, 10)))
+
+
+def test_escrituras_de_stock_no_esperan_al_contador(requiere_postgres):
+    # Cada transacción descuenta stock de su propio medicamento y sigue
+    # trabajando antes del commit, como una dispensación
+    ids = _medicamentos(*[10] * 5)
+    trabajo = 0.3
+
+    def dispensar(medicamento_id: int):
+        with engine.begin() as conn:
+            _cambiar_stock(conn, medicamento_id, 9)
+            conn.execute(text("SELECT pg_sleep(:s)"), {"s": trabajo})
+
+    hilos = [Thread(target=dispensar, args=(i,)) for i in ids]
+    inicio = reloj.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = reloj.perf_counter() - inicio
+    print(f"\n{len(ids)} dispensaciones de {trabajo}s en paralelo: {transcurrido:.2f}s")
+
+    # Serializadas tardarían len(ids) * trabajo
+    assert transcurrido < 2 * trabajo